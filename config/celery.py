@@ -2,11 +2,13 @@ import os
 from celery import Celery
 from celery.schedules import crontab
 from django.conf import settings
+from kombu import Queue
 
 # Set the default Django settings module
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-app = Celery('config')
+# Tasks go to the broker or the local database queue, see TASK_BACKEND
+app = Celery('config', task_cls='courses.services.task_service:BackendTask')
 
 # Using a string here means the worker doesn't have to serialize
 # the configuration object to child processes.
@@ -15,6 +17,77 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
 
+
+def message_priority(priority):
+    """Translate a 0-9 priority (higher first) for the configured broker."""
+    # Redis consumes priority 0 first, AMQP brokers the highest number
+    if app.conf.broker_url and app.conf.broker_url.startswith('redis'):
+        return 9 - priority
+    return priority
+
+
+def worker_argv(queue):
+    """
+    Build the worker arguments of a queue profile from TASK_QUEUES.
+
+    Args:
+        queue: Name of the queue
+
+    Returns:
+        Arguments for ``app.worker_main``
+    """
+    profile = settings.TASK_QUEUES[queue]
+    return [
+        'worker',
+        '--queues', queue,
+        '--hostname', f'{queue}@%h',
+        '--concurrency', str(profile['concurrency']),
+        '--prefetch-multiplier', str(profile['prefetch_multiplier']),
+    ]
+
+
+@app.on_after_configure.connect
+def configure_queues(sender, **kwargs):
+    """
+    Route workloads to their own queues, see TASK_QUEUES.
+
+    Runs once the configuration is loaded rather than at import, so
+    settings modules that start with ``from config.settings import *``
+    are read completely.
+    """
+    conf = sender.conf
+    conf.task_queues = [
+        Queue(name, routing_key=name, queue_arguments={'x-max-priority': 10})
+        for name in settings.TASK_QUEUES
+    ]
+    conf.task_routes = {
+        pattern: {
+            'queue': name,
+            'routing_key': name,
+            'priority': message_priority(profile['priority']),
+        }
+        for name, profile in settings.TASK_QUEUES.items()
+        for pattern in profile['tasks']
+    }
+    conf.task_default_priority = message_priority(
+        settings.TASK_QUEUES[conf.task_default_queue]['priority']
+    )
+    conf.task_annotations = {
+        task: {'rate_limit': rate_limit}
+        for profile in settings.TASK_QUEUES.values()
+        for task, rate_limit in profile.get('rate_limits', {}).items()
+        if rate_limit
+    }
+    conf.timezone = settings.TIME_ZONE
+
+
+app.conf.broker_transport_options = {
+    # Priorities within a queue on Redis
+    'queue_order_strategy': 'priority',
+    'priority_steps': list(range(10)),
+    'sep': ':',
+}
+
 # Configure periodic tasks
 app.conf.beat_schedule = {
     # Check and block inactive users every day at midnight
@@ -22,15 +95,39 @@ app.conf.beat_schedule = {
         'task': 'users.tasks.check_inactive_users',
         'schedule': crontab(hour=0, minute=0),  # Every day at midnight
     },
+    # Delete expired sessions every hour
+    'clear-expired-sessions-hourly': {
+        'task': 'users.tasks.clear_expired_sessions',
+        'schedule': crontab(minute=30),
+    },
     # Send pending notifications every hour
     'send-pending-notifications-hourly': {
         'task': 'courses.tasks.send_pending_notifications',
         'schedule': crontab(minute=0, hour='*/1'),  # Every hour
     },
+    # Publish task calls the broker refused after their commit
+    'redeliver-tasks-every-minute': {
+        'task': 'courses.tasks.redeliver_tasks',
+        'schedule': crontab(),
+    },
+    # Send hourly digests of course changes
+    'send-hourly-digests': {
+        'task': 'courses.tasks.send_subscriber_digests',
+        'schedule': crontab(minute=5),
+        'args': ('hourly',),
+    },
 }
 
-# Timezone configuration
-app.conf.timezone = settings.TIME_ZONE
+
+@app.on_after_configure.connect
+def schedule_daily_digests(sender, **kwargs):
+    """Schedule daily digests at DIGEST_DAILY_HOUR once settings are loaded."""
+    # Send daily digests of course changes
+    sender.conf.beat_schedule['send-daily-digests'] = {
+        'task': 'courses.tasks.send_subscriber_digests',
+        'schedule': crontab(minute=10, hour=settings.DIGEST_DAILY_HOUR),
+        'args': ('daily',),
+    }
 
 
 @app.task(bind=True, ignore_result=True)
@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 from pathlib import Path
 from dotenv import load_dotenv
 from celery.schedules import crontab
@@ -45,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so tasks dispatched anywhere in the request are batched
+    'courses.middleware.TaskBatchMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -128,12 +131,20 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Custom user model
 AUTH_USER_MODEL = 'users.User'
 
+# Session users are loaded through the cache. ModelBackend stays listed
+# so sessions started before the switch remain valid.
+AUTHENTICATION_BACKENDS = [
+    'users.backends.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 # Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'users.authentication.ClaimsJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
@@ -144,10 +155,95 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10,
 }
 
+# JWT: access tokens carry the claims needed to authorize a request
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(
+        minutes=int(os.getenv('JWT_ACCESS_TOKEN_MINUTES', 15))
+    ),
+    'REFRESH_TOKEN_LIFETIME': timedelta(
+        days=int(os.getenv('JWT_REFRESH_TOKEN_DAYS', 7))
+    ),
+    'TOKEN_OBTAIN_SERIALIZER': 'users.tokens.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'users.tokens.ClaimsTokenRefreshSerializer',
+}
+
+# Cache configuration
+# Redis in production (CACHE_URL=redis://...), local memory otherwise
+CACHE_URL = os.getenv('CACHE_URL', '')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+            'KEY_PREFIX': 'lms',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'lms-default',
+        }
+    }
+
+# Catalog responses are only cached in a cache shared by all processes,
+# a version bump in local memory would not reach the other workers
+RESPONSE_CACHE_ENABLED = (
+    os.getenv('RESPONSE_CACHE_ENABLED', str(bool(CACHE_URL))) == 'True'
+)
+# Seconds a cached catalog response lives (versions invalidate it earlier)
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+# Seconds one worker may hold the rebuild lock of a cache entry
+RESPONSE_CACHE_LOCK_LEASE = int(os.getenv('RESPONSE_CACHE_LOCK_LEASE', 5))
+# Seconds a request without any cached entry waits for the worker
+# rebuilding it before building the response itself
+RESPONSE_CACHE_WAIT = float(os.getenv('RESPONSE_CACHE_WAIT', 1))
+# Seconds an outdated entry is still served while it is being rebuilt
+RESPONSE_CACHE_STALE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_STALE_TIMEOUT', 600))
+
+# Token versions, users and roles are only cached in a cache shared by
+# all processes, a revocation, deactivation or demotion dropped from local
+# memory would leave the tokens, sessions and roles valid in the other
+# workers
+AUTH_CACHE_ENABLED = (
+    os.getenv('AUTH_CACHE_ENABLED', str(bool(CACHE_URL))) == 'True'
+)
+
+# Seconds verified Basic auth credentials are remembered when
+# users.authentication.CachedBasicAuthentication replaces BasicAuthentication
+BASIC_AUTH_CACHE_TIMEOUT = int(os.getenv('BASIC_AUTH_CACHE_TIMEOUT', 60))
+
+# Seconds a user row loaded by CachedModelBackend is served from the
+# cache (see AUTH_CACHE_ENABLED), 0 disables the cache
+USER_CACHE_TIMEOUT = int(os.getenv('USER_CACHE_TIMEOUT', 300))
+
+# Sessions are served from the cache and written to the database behind
+# the request, existing database sessions stay valid. The write happens in
+# a Celery worker, so it needs a cache shared by all processes, with local
+# memory sessions are written to the database during the request
+SESSION_ENGINE = (
+    'users.sessions' if CACHE_URL else 'django.contrib.sessions.backends.cached_db'
+)
+# Seconds session saves are coalesced before the database write
+SESSION_WRITE_DELAY = int(os.getenv('SESSION_WRITE_DELAY', 5))
+# Expired session rows deleted per query by the hourly sweeper
+SESSION_SWEEP_BATCH_SIZE = int(os.getenv('SESSION_SWEEP_BATCH_SIZE', 1000))
+# Users deactivated per query by the nightly inactivity check
+INACTIVE_USERS_BATCH_SIZE = int(os.getenv('INACTIVE_USERS_BATCH_SIZE', 1000))
+
+# Seconds resolved user roles (group names) are shared between requests
+# (see AUTH_CACHE_ENABLED)
+ROLE_CACHE_TIMEOUT = int(os.getenv('ROLE_CACHE_TIMEOUT', 300))
+
+# Courses fetched (with their lessons) per query by the catalog export
+CATALOG_EXPORT_CHUNK_SIZE = int(os.getenv('CATALOG_EXPORT_CHUNK_SIZE', 500))
+
 # Stripe configuration
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', '')
 STRIPE_PUBLISHABLE_KEY = os.getenv('STRIPE_PUBLISHABLE_KEY', '')
 STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET', '')
+# Currency of course prices in Stripe, a change creates new prices
+STRIPE_CURRENCY = os.getenv('STRIPE_CURRENCY', 'rub')
 
 # Redis and Celery configuration
 REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
@@ -158,6 +254,70 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+
+# Where tasks run: 'celery' sends them to the broker above, 'local'
+# stores them in the database for `manage.py run_local_tasks`, which runs
+# them and the beat schedule (single-node installs without Redis)
+TASK_BACKEND = os.getenv('TASK_BACKEND', 'celery')
+# Run the local pool inside the web process instead, only for servers
+# with a single process, every process would poll the database
+TASK_LOCAL_AUTOSTART = os.getenv('TASK_LOCAL_AUTOSTART', 'False') == 'True'
+# Pool of the local backend, 'thread' or 'process', and its size
+TASK_LOCAL_POOL = os.getenv('TASK_LOCAL_POOL', 'thread')
+TASK_LOCAL_WORKERS = int(os.getenv('TASK_LOCAL_WORKERS', 2))
+# Seconds between polls of the local queue for due and periodic tasks
+TASK_LOCAL_POLL_INTERVAL = float(os.getenv('TASK_LOCAL_POLL_INTERVAL', 1))
+# Seconds after which a task of a vanished process is run again
+TASK_LOCAL_LEASE = int(os.getenv('TASK_LOCAL_LEASE', 3600))
+
+# Celery queues, built into routes and queues by config/celery.py:
+# - tasks: task name patterns routed to the queue, unmatched tasks go to
+#   CELERY_TASK_DEFAULT_QUEUE
+# - priority: priority of the routed messages, 0-9, higher runs first
+# - rate_limits: Celery rate limits of single tasks, per worker
+# - concurrency and prefetch_multiplier: worker profile of the queue, see
+#   `manage.py run_worker <queue>`
+TASK_QUEUES = {
+    'default': {
+        'tasks': [],
+        'priority': 6,
+        'concurrency': int(os.getenv('CELERY_DEFAULT_CONCURRENCY', 4)),
+        'prefetch_multiplier': int(os.getenv('CELERY_DEFAULT_PREFETCH', 4)),
+    },
+    'payments': {
+        # Payment and Stripe webhook tasks
+        'tasks': ['*payment*', '*stripe*'],
+        'priority': 9,
+        'concurrency': int(os.getenv('CELERY_PAYMENTS_CONCURRENCY', 2)),
+        'prefetch_multiplier': 1,
+    },
+    'notifications': {
+        'tasks': [
+            'courses.tasks.*notification*',
+            'courses.tasks.send_subscriber_digests',
+        ],
+        'priority': 3,
+        'concurrency': int(os.getenv('CELERY_NOTIFICATIONS_CONCURRENCY', 4)),
+        # Batches take minutes, a worker should not hoard them
+        'prefetch_multiplier': 1,
+        'rate_limits': {
+            'courses.tasks.deliver_notification': os.getenv(
+                'NOTIFICATION_DELIVERY_RATE_LIMIT', ''
+            ),
+        },
+    },
+    'maintenance': {
+        'tasks': [
+            'users.tasks.check_inactive_users',
+            'users.tasks.clear_expired_sessions',
+            'courses.tasks.redeliver_tasks',
+        ],
+        'priority': 0,
+        'concurrency': int(os.getenv('CELERY_MAINTENANCE_CONCURRENCY', 1)),
+        'prefetch_multiplier': 1,
+    },
+}
 
 # Email configuration
 EMAIL_BACKEND = os.getenv(
@@ -171,6 +331,28 @@ EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'webmaster@localhost')
 
+# Subscribers per notification outbox batch, each batch is delivered by
+# its own task, one message per subscriber over one mail connection
+NOTIFICATION_CHUNK_SIZE = int(os.getenv('NOTIFICATION_CHUNK_SIZE', 500))
+# Seconds after which a batch claimed by a vanished worker is retried
+NOTIFICATION_CLAIM_TIMEOUT = int(os.getenv('NOTIFICATION_CLAIM_TIMEOUT', 900))
+# Deliveries of a batch before its remaining recipients are given up
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv('NOTIFICATION_MAX_ATTEMPTS', 3))
+# Messages per second a delivery sends over its SMTP connection, 0 is
+# unlimited. The limit applies per worker process
+NOTIFICATION_SEND_RATE = float(os.getenv('NOTIFICATION_SEND_RATE', 0))
+# Recipients handled between two saved checkpoints of a delivery
+NOTIFICATION_CHECKPOINT_INTERVAL = int(
+    os.getenv('NOTIFICATION_CHECKPOINT_INTERVAL', 25)
+)
+# Base and maximum delay in seconds of the exponential retry backoff
+NOTIFICATION_RETRY_BACKOFF = int(os.getenv('NOTIFICATION_RETRY_BACKOFF', 60))
+NOTIFICATION_RETRY_BACKOFF_MAX = int(
+    os.getenv('NOTIFICATION_RETRY_BACKOFF_MAX', 3600)
+)
+# Hour (in TIME_ZONE) at which daily digests of course changes are sent
+DIGEST_DAILY_HOUR = int(os.getenv('DIGEST_DAILY_HOUR', 9))
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     'http://localhost:8000',
@@ -1,15 +1,25 @@
 from django.contrib import admin
 from .models import Course, Lesson
+from .services.search_service import SearchService
+
+
+class FullTextSearchMixin:
+    """Use the full-text index instead of icontains scans for admin search."""
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return SearchService.search(queryset, search_term), False
 
 
 @admin.register(Course)
-class CourseAdmin(admin.ModelAdmin):
+class CourseAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ("title", "created_at")
     search_fields = ("title", "description")
 
 
 @admin.register(Lesson)
-class LessonAdmin(admin.ModelAdmin):
+class LessonAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ("title", "course", "created_at")
     list_filter = ("course",)
     search_fields = ("title", "description")
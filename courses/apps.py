@@ -1,5 +1,25 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def restore_search_triggers(sender, using, **kwargs):
+    """
+    Recreate full-text triggers after migrations.
+
+    SQLite drops triggers when a migration rebuilds their table.
+    """
+    from .services.search_service import SearchService
+
+    connection = connections[using]
+    if connection.vendor == "sqlite" and SearchService.is_installed(connection):
+        SearchService.install(connection)
 
 
 class CoursesConfig(AppConfig):
     name = "courses"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        post_migrate.connect(restore_search_triggers, sender=self)
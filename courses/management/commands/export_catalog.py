@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand, CommandError
+from courses.services.export_service import (
+    FORMAT_NDJSON,
+    FORMATS,
+    STAFF_RELATIONS,
+    ExportService,
+)
+
+
+class Command(BaseCommand):
+    help = "Stream the whole course catalog as NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format",
+            choices=sorted(FORMATS),
+            default=FORMAT_NDJSON,
+            help="Output format",
+        )
+        parser.add_argument(
+            "--include",
+            action="append",
+            choices=STAFF_RELATIONS,
+            default=[],
+            help="Add a relation to every course (NDJSON only), repeatable",
+        )
+        parser.add_argument(
+            "--updated-since",
+            help="Only export courses changed at or after this ISO date/datetime",
+        )
+        parser.add_argument(
+            "--gzip",
+            action="store_true",
+            help="Compress the output with gzip",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            help="Number of courses fetched per query",
+        )
+        parser.add_argument(
+            "--output",
+            help="File to write to, stdout by default",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            stream = ExportService.stream(
+                options["format"],
+                include=options["include"],
+                updated_since=ExportService.parse_updated_since(
+                    options["updated_since"]
+                ),
+                compress=options["gzip"],
+                chunk_size=options["chunk_size"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options["output"]:
+            with open(options["output"], "wb") as output:
+                for chunk in stream:
+                    output.write(chunk)
+            self.stderr.write(
+                self.style.SUCCESS(f"Catalog exported to {options['output']}")
+            )
+        else:
+            output = getattr(self.stdout._out, "buffer", None)
+            for chunk in stream:
+                if output is None:
+                    self.stdout.write(chunk.decode(), ending="")
+                else:
+                    output.write(chunk)
+            if output is not None:
+                output.flush()
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from courses.services.search_service import SearchService
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of courses and lessons"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Database to rebuild the index on",
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        SearchService.rebuild(connection)
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt"))
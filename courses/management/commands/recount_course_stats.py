@@ -0,0 +1,101 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from courses.models import Course, Lesson, Payment, Subscription
+from courses.services.cache_service import CacheService
+
+
+def _subquery(queryset, aggregate, default, output_field=None):
+    """Per-course aggregate of ``queryset`` as a correlated subquery."""
+    return Coalesce(
+        Subquery(
+            queryset.filter(course=OuterRef("pk"))
+            .order_by()
+            .values("course")
+            .annotate(total=aggregate)
+            .values("total")
+        ),
+        Value(default),
+        output_field=output_field,
+    )
+
+
+class Command(BaseCommand):
+    help = "Recompute denormalized course counters and repair drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of courses recomputed per transaction",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report drifted courses, do not write",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        dry_run = options["dry_run"]
+
+        expected = {
+            "expected_lessons_count": _subquery(Lesson.objects.all(), Count("pk"), 0),
+            "expected_subscribers_count": _subquery(
+                Subscription.objects.filter(is_active=True), Count("pk"), 0
+            ),
+            "expected_payments_count": _subquery(
+                Payment.objects.filter(status=Payment.STATUS_SUCCEEDED),
+                Count("pk"),
+                0,
+            ),
+            "expected_revenue": _subquery(
+                Payment.objects.filter(status=Payment.STATUS_SUCCEEDED),
+                Sum("amount"),
+                0,
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+        }
+
+        checked = repaired = 0
+        last_pk = 0
+        while True:
+            # Keyset batches keep each transaction (and its row locks) short
+            with transaction.atomic():
+                batch = list(
+                    Course.objects.select_for_update()
+                    .filter(pk__gt=last_pk)
+                    .order_by("pk")
+                    .only("pk", *Course.COUNTER_FIELDS)
+                    .annotate(**expected)[:batch_size]
+                )
+                if not batch:
+                    break
+
+                drifted = []
+                for course in batch:
+                    changed = False
+                    for field in Course.COUNTER_FIELDS:
+                        value = getattr(course, f"expected_{field}")
+                        if getattr(course, field) != value:
+                            setattr(course, field, value)
+                            changed = True
+                    if changed:
+                        drifted.append(course)
+
+                if drifted and not dry_run:
+                    Course.objects.bulk_update(drifted, Course.COUNTER_FIELDS)
+                    # Cached responses still carry the drifted counters
+                    for course in drifted:
+                        CacheService.invalidate_course(course.pk)
+
+            checked += len(batch)
+            repaired += len(drifted)
+            last_pk = batch[-1].pk
+
+        action = "would be repaired" if dry_run else "repaired"
+        self.stdout.write(
+            self.style.SUCCESS(f"Checked {checked} courses, {repaired} {action}")
+        )
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from courses.services.cache_service import CacheService
+
+
+class Command(BaseCommand):
+    help = "Show course catalog response cache hit/miss counters"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Reset the counters after printing them",
+        )
+
+    def handle(self, *args, **options):
+        stats = CacheService.get_stats()
+        self.stdout.write(
+            f"Hits: {stats['hits']}, misses: {stats['misses']}, "
+            f"hit ratio: {stats['hit_ratio']:.2%}"
+        )
+        if options["reset"]:
+            CacheService.reset_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset"))
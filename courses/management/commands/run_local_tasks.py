@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from courses.services.local_task_service import LocalTaskExecutor
+from courses.services.task_service import BACKEND_LOCAL
+
+
+class Command(BaseCommand):
+    help = "Run tasks and the beat schedule of the local task backend"
+
+    def handle(self, *args, **options):
+        if settings.TASK_BACKEND != BACKEND_LOCAL:
+            raise CommandError(
+                f"TASK_BACKEND is {settings.TASK_BACKEND!r}, tasks go to Celery"
+            )
+        self.stdout.write(
+            f"Running local tasks with {settings.TASK_LOCAL_WORKERS} "
+            f"{settings.TASK_LOCAL_POOL} workers"
+        )
+        LocalTaskExecutor.run()
@@ -0,0 +1,33 @@
+import shlex
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from config.celery import app, worker_argv
+
+
+class Command(BaseCommand):
+    help = "Start a Celery worker with the profile of a queue from TASK_QUEUES"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "queue",
+            choices=sorted(settings.TASK_QUEUES),
+            help="Queue the worker consumes",
+        )
+        parser.add_argument(
+            "--loglevel",
+            default="info",
+            help="Worker log level",
+        )
+        parser.add_argument(
+            "--print",
+            action="store_true",
+            help="Print the celery command line instead of starting the worker",
+        )
+
+    def handle(self, *args, **options):
+        argv = worker_argv(options["queue"]) + ["--loglevel", options["loglevel"]]
+        if options["print"]:
+            self.stdout.write(shlex.join(["celery", "-A", "config", *argv]))
+            return
+        app.worker_main(argv)
@@ -0,0 +1,23 @@
+from django.conf import settings
+
+from .services.task_service import BACKEND_LOCAL, TaskService
+
+
+class TaskBatchMiddleware:
+    """
+    Publish the Celery tasks a request dispatched in one batch.
+
+    With the local task backend and TASK_LOCAL_AUTOSTART it also starts
+    the task pool of the web process.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if settings.TASK_BACKEND == BACKEND_LOCAL and settings.TASK_LOCAL_AUTOSTART:
+            from .services.local_task_service import LocalTaskExecutor
+
+            LocalTaskExecutor.start()
+
+    def __call__(self, request):
+        with TaskService.batch():
+            return self.get_response(request)
@@ -0,0 +1,20 @@
+# Generated by Django 6.0 on 2026-01-06 12:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0005_remove_course_owner_remove_lesson_owner_payment_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="price",
+            field=models.DecimalField(
+                decimal_places=2, default=0.0, max_digits=10, verbose_name="Цена"
+            ),
+        ),
+    ]
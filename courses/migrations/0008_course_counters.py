@@ -0,0 +1,82 @@
+# Generated by Django 6.0 on 2026-10-17 09:30
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def _count(model, **filters):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(course=OuterRef("pk"), **filters)
+            .order_by()
+            .values("course")
+            .annotate(total=Count("pk"))
+            .values("total")
+        ),
+        0,
+    )
+
+
+def backfill_counters(apps, schema_editor):
+    Course = apps.get_model("courses", "Course")
+    Lesson = apps.get_model("courses", "Lesson")
+    Subscription = apps.get_model("courses", "Subscription")
+    Payment = apps.get_model("courses", "Payment")
+
+    revenue = Coalesce(
+        Subquery(
+            Payment.objects.filter(course=OuterRef("pk"), status="succeeded")
+            .order_by()
+            .values("course")
+            .annotate(total=Sum("amount"))
+            .values("total")
+        ),
+        Value(0),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+    Course.objects.update(
+        lessons_count=_count(Lesson),
+        subscribers_count=_count(Subscription, is_active=True),
+        payments_count=_count(Payment, status="succeeded"),
+        revenue=revenue,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0007_course_last_updated_lesson_last_updated_subscription"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="lessons_count",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Количество уроков"
+            ),
+        ),
+        migrations.AddField(
+            model_name="course",
+            name="payments_count",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Количество оплат"
+            ),
+        ),
+        migrations.AddField(
+            model_name="course",
+            name="revenue",
+            field=models.DecimalField(
+                decimal_places=2, default=0, max_digits=12, verbose_name="Выручка"
+            ),
+        ),
+        migrations.AddField(
+            model_name="course",
+            name="subscribers_count",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Количество подписчиков"
+            ),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
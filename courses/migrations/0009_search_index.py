@@ -0,0 +1,74 @@
+from django.db import migrations
+
+# The SQL is frozen here, later changes to SearchService must not change
+# what this migration does
+TABLES = ("courses_course", "courses_lesson")
+POSTGRES_CONFIG = "russian"
+
+SQLITE_INSTALL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5("
+    "title, description, content='{table}', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table} BEGIN "
+    "INSERT INTO {table}_fts(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table} BEGIN "
+    "INSERT INTO {table}_fts({table}_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS {table}_fts_au "
+    "AFTER UPDATE OF title, description ON {table} BEGIN "
+    "INSERT INTO {table}_fts({table}_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO {table}_fts(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+    "INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')",
+)
+SQLITE_UNINSTALL = (
+    "DROP TRIGGER IF EXISTS {table}_fts_ai",
+    "DROP TRIGGER IF EXISTS {table}_fts_ad",
+    "DROP TRIGGER IF EXISTS {table}_fts_au",
+    "DROP TABLE IF EXISTS {table}_fts",
+)
+
+POSTGRES_INSTALL = (
+    "ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('{config}'::regconfig, coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('{config}'::regconfig, coalesce(description, '')), 'B')"
+    ") STORED",
+    "CREATE INDEX IF NOT EXISTS {table}_search_vector_idx "
+    "ON {table} USING GIN (search_vector)",
+)
+POSTGRES_UNINSTALL = (
+    "DROP INDEX IF EXISTS {table}_search_vector_idx",
+    "ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector",
+)
+
+
+def run(schema_editor, statements):
+    statements = statements.get(schema_editor.connection.vendor, ())
+    for table in TABLES:
+        for statement in statements:
+            schema_editor.execute(statement.format(table=table, config=POSTGRES_CONFIG))
+
+
+def install(apps, schema_editor):
+    run(schema_editor, {"sqlite": SQLITE_INSTALL, "postgresql": POSTGRES_INSTALL})
+
+
+def uninstall(apps, schema_editor):
+    run(
+        schema_editor,
+        {"sqlite": SQLITE_UNINSTALL, "postgresql": POSTGRES_UNINSTALL},
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0008_course_counters"),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 6.0 on 2026-10-17 18:20
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0010_notification_outbox"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="subscription",
+            name="digest_sent_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, verbose_name="Последняя сводка"
+            ),
+        ),
+        migrations.AddField(
+            model_name="subscription",
+            name="notification_mode",
+            field=models.CharField(
+                choices=[
+                    ("immediate", "Сразу"),
+                    ("hourly", "Сводка раз в час"),
+                    ("daily", "Сводка раз в день"),
+                ],
+                default="immediate",
+                max_length=20,
+                verbose_name="Режим уведомлений",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="notificationoutbox",
+            name="course",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="notifications",
+                to="courses.course",
+                verbose_name="Курс",
+            ),
+        ),
+        migrations.CreateModel(
+            name="ChangeEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "change_key",
+                    models.CharField(
+                        max_length=64, unique=True, verbose_name="Ключ изменения"
+                    ),
+                ),
+                ("summary", models.CharField(max_length=255, verbose_name="Описание")),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+                (
+                    "course",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="change_events",
+                        to="courses.course",
+                        verbose_name="Курс",
+                    ),
+                ),
+                (
+                    "lesson",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="change_events",
+                        to="courses.lesson",
+                        verbose_name="Урок",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Изменение",
+                "verbose_name_plural": "Изменения",
+                "ordering": ["created_at", "id"],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-17 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0011_subscriber_digests"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notificationoutbox",
+            name="checkpoint",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Обработано получателей"
+            ),
+        ),
+        migrations.AddField(
+            model_name="notificationoutbox",
+            name="failed_recipients",
+            field=models.JSONField(default=list, verbose_name="Ошибки доставки"),
+        ),
+        migrations.AddField(
+            model_name="notificationoutbox",
+            name="retry_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Повтор после"
+            ),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 6.0 on 2026-10-17 20:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0012_notification_checkpoints"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QueuedTask",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("task_id", models.CharField(max_length=255, unique=True)),
+                ("name", models.CharField(max_length=255, verbose_name="Задача")),
+                ("args", models.JSONField(default=list, verbose_name="Аргументы")),
+                (
+                    "kwargs",
+                    models.JSONField(
+                        default=dict, verbose_name="Именованные аргументы"
+                    ),
+                ),
+                (
+                    "retries",
+                    models.PositiveIntegerField(default=0, verbose_name="Повторы"),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Ожидает"),
+                            ("running", "Выполняется"),
+                            ("done", "Выполнена"),
+                            ("failed", "Ошибка"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "eta",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="Запуск после"
+                    ),
+                ),
+                ("locked_at", models.DateTimeField(blank=True, null=True)),
+                ("error", models.TextField(blank=True, verbose_name="Ошибка")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "verbose_name": "Задача в очереди",
+                "verbose_name_plural": "Задачи в очереди",
+                "ordering": ["eta", "id"],
+                "indexes": [
+                    models.Index(
+                        fields=["status", "eta"], name="courses_que_status_943fb1_idx"
+                    )
+                ],
+            },
+        ),
+    ]
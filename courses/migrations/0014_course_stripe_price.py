@@ -0,0 +1,68 @@
+# Generated by Django 6.0 on 2026-10-17 20:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0013_queued_task"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CourseStripePrice",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "product_id",
+                    models.CharField(
+                        blank=True, max_length=100, verbose_name="ID продукта в Stripe"
+                    ),
+                ),
+                (
+                    "price_id",
+                    models.CharField(
+                        blank=True, max_length=100, verbose_name="ID цены в Stripe"
+                    ),
+                ),
+                (
+                    "amount",
+                    models.DecimalField(
+                        blank=True,
+                        decimal_places=2,
+                        max_digits=10,
+                        null=True,
+                        verbose_name="Сумма",
+                    ),
+                ),
+                (
+                    "currency",
+                    models.CharField(blank=True, max_length=3, verbose_name="Валюта"),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "course",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stripe_price",
+                        to="courses.course",
+                        verbose_name="Курс",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Цена курса в Stripe",
+                "verbose_name_plural": "Цены курсов в Stripe",
+            },
+        ),
+    ]
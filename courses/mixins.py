@@ -0,0 +1,282 @@
+import hashlib
+from calendar import timegm
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .services.cache_service import CACHE_MISS, CACHE_STALE, CacheService
+
+
+def _timestamp(value):
+    return timegm(value.utctimetuple()) if value else None
+
+
+def make_etag(*parts):
+    """Build a strong, quoted ETag from the given validator parts."""
+    value = ":".join(str(part) for part in parts)
+    return quote_etag(hashlib.md5(value.encode()).hexdigest())
+
+
+class ConditionalRequestMixin:
+    """
+    Answer conditional requests without serializing the resource.
+
+    Views return cheap validators from ``get_conditional_state``. Safe
+    requests carrying ``If-None-Match``/``If-Modified-Since`` get a 304,
+    unsafe requests carrying ``If-Match``/``If-Unmodified-Since`` get a
+    412 when the resource has changed in the meantime.
+    """
+
+    def get_conditional_state(self):
+        """
+        Return validators for the current request.
+
+        Returns:
+            Tuple of (etag, last_modified datetime) or None when the
+            resource does not exist or conditional requests are unsupported
+        """
+        return None
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        """Run ``handler`` unless the request preconditions short-circuit it."""
+        state = self.get_conditional_state()
+        if state is None:
+            return handler(request, *args, **kwargs)
+
+        etag, last_modified = state
+        timestamp = _timestamp(last_modified)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if request.method not in permissions.SAFE_METHODS:
+                # Validators changed with the write, report the new ones
+                state = self.get_conditional_state()
+                if state is None or response.status_code >= 300:
+                    return response
+                etag, last_modified = state
+                timestamp = _timestamp(last_modified)
+            elif response.status_code != 200 or getattr(response, "is_stale", False):
+                # A stale cached body does not match the current validators
+                return response
+
+        response.headers["ETag"] = etag
+        if timestamp is not None:
+            response.headers["Last-Modified"] = http_date(timestamp)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request, *args, **kwargs)
+
+    def update(self, request, *args, **kwargs):
+        return self.conditional_response(super().update, request, *args, **kwargs)
+
+    def destroy(self, request, *args, **kwargs):
+        return self.conditional_response(super().destroy, request, *args, **kwargs)
+
+
+class CachedResponseMixin:
+    """
+    Cache GET responses under the course or catalog version.
+
+    Only active with RESPONSE_CACHE_ENABLED, which requires a cache shared
+    by all processes.
+
+    Keys combine the version with the query parameters and the caller's
+    permission classes and audience, so writes invalidate by bumping a
+    version (see ``CacheService.invalidate_course``) instead of scanning.
+    """
+
+    cache_actions = ("list", "retrieve")
+    cache_scope = None
+    cache_timeout = None
+
+    def get_cache_version(self):
+        """Return the catalog version for lists, the course version otherwise."""
+        if self.detail:
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            return CacheService.course_version(self.kwargs[lookup_url_kwarg])
+        return CacheService.global_version()
+
+    def get_cache_audience(self, request):
+        """Return the part of the caller identity the response depends on."""
+        user = request.user
+        if not user.is_authenticated:
+            return "anonymous"
+        return "staff" if user.is_staff else "authenticated"
+
+    def get_cache_key(self, request, *args, **kwargs):
+        permission_classes = tuple(
+            type(permission).__name__ for permission in self.get_permissions()
+        )
+        return CacheService.make_key(
+            self.cache_scope or type(self).__name__,
+            self.action,
+            sorted(kwargs.items()),
+            sorted(request.query_params.lists()),
+            permission_classes,
+            self.get_cache_audience(request),
+            request.get_host(),
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        """
+        Serve ``handler`` from the cache, filling it on a miss.
+
+        Concurrent misses are coalesced: one request rebuilds the response
+        while the others get the previous version of it, marked with
+        ``is_stale`` so no current validators are sent along.
+        """
+        if (
+            not settings.RESPONSE_CACHE_ENABLED
+            or request.method != "GET"
+            or self.action not in self.cache_actions
+        ):
+            return handler(request, *args, **kwargs)
+
+        computed = {}
+
+        def compute():
+            response = handler(request, *args, **kwargs)
+            computed["response"] = response
+            return response.data if response.status_code == 200 else None
+
+        data, state = CacheService.single_flight(
+            self.get_cache_key(request, *args, **kwargs),
+            self.get_cache_version(),
+            compute,
+            timeout=self.cache_timeout,
+        )
+        CacheService.record("misses" if state == CACHE_MISS else "hits")
+        if "response" in computed:
+            return computed["response"]
+        response = Response(data)
+        response.is_stale = state == CACHE_STALE
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+
+class SparseFieldsetMixin:
+    """
+    Let list requests choose the serialized fields and load only those.
+
+    ``?fields=a,b`` keeps the listed fields, ``?omit=a,b`` drops them and
+    ``?profile=<name>`` starts from a named set in the serializer's
+    ``Meta.profiles`` (e.g. "summary"). The selection is handed to
+    serializers using ``SparseFieldsetSerializerMixin`` and turned into
+    ``QuerySet.only()`` so unused columns are never fetched.
+    """
+
+    fields_query_param = "fields"
+    omit_query_param = "omit"
+    profile_query_param = "profile"
+    sparse_actions = ("list",)
+
+    def _split_param(self, name):
+        value = self.request.query_params.get(name, "")
+        return {part.strip() for part in value.split(",") if part.strip()}
+
+    def get_sparse_fields(self):
+        """
+        Return the selected serializer field names.
+
+        Returns:
+            Set of field names, or None when the request selects all
+        """
+        if hasattr(self, "_sparse_fields"):
+            return self._sparse_fields
+        self._sparse_fields = None
+
+        # Generic views have no action, their GET is the list
+        action = getattr(self, "action", "list")
+        params = self.request.query_params
+        if (
+            self.request.method != "GET"
+            or action not in self.sparse_actions
+            or not any(
+                name in params
+                for name in (
+                    self.fields_query_param,
+                    self.omit_query_param,
+                    self.profile_query_param,
+                )
+            )
+        ):
+            return None
+
+        serializer_class = self.get_serializer_class()
+        available = set(serializer_class().fields)
+        profiles = getattr(serializer_class.Meta, "profiles", {})
+
+        profile = params.get(self.profile_query_param)
+        if profile:
+            if profile not in profiles:
+                raise ValidationError(
+                    {self.profile_query_param: [f"Unknown profile: {profile}"]}
+                )
+            selected = set(profiles[profile])
+        else:
+            selected = set(available)
+
+        for name in (self.fields_query_param, self.omit_query_param):
+            unknown = self._split_param(name) - available
+            if unknown:
+                raise ValidationError(
+                    {name: [f"Unknown fields: {', '.join(sorted(unknown))}"]}
+                )
+
+        fields = self._split_param(self.fields_query_param)
+        if fields:
+            selected &= fields | {"id"}
+        selected -= self._split_param(self.omit_query_param) - {"id"}
+
+        self._sparse_fields = selected
+        return selected
+
+    def get_sparse_columns(self, selected, model):
+        """
+        Map selected serializer fields to the model fields to load.
+
+        Returns:
+            List of model field names, or None when nothing can be deferred
+        """
+        serializer = self.get_serializer_class()()
+        model_fields = {field.name for field in model._meta.concrete_fields}
+        columns = {model._meta.pk.name}
+
+        # Keyset pagination reads its ordering fields from every instance
+        cursor_paginator = getattr(self.paginator, "cursor_paginator", None)
+        for ordering in getattr(cursor_paginator, "ordering", ()):
+            columns.add(ordering.lstrip("-"))
+
+        for name in selected:
+            source = serializer.fields[name].source
+            if source == "*":
+                return None
+            attribute = source.split(".")[0]
+            if attribute in model_fields:
+                columns.add(attribute)
+        return sorted(columns)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        selected = self.get_sparse_fields()
+        if selected is None:
+            return queryset
+        columns = self.get_sparse_columns(selected, queryset.model)
+        return queryset if columns is None else queryset.only(*columns)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["sparse_fields"] = self.get_sparse_fields()
+        return context
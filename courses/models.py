@@ -1,7 +1,11 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 
+from .services.cache_service import CacheService
+
 User = get_user_model()
 
 
@@ -29,6 +33,34 @@ class Course(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Denormalized aggregates, maintained by CourseCountersMixin writes
+    # and repaired in bulk by the recount_course_stats command.
+    lessons_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество уроков',
+    )
+    subscribers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество подписчиков',
+    )
+    payments_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество оплат',
+    )
+    revenue = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name='Выручка',
+    )
+
+    COUNTER_FIELDS = (
+        'lessons_count',
+        'subscribers_count',
+        'payments_count',
+        'revenue',
+    )
+
     class Meta:
         verbose_name = 'Курс'
         verbose_name_plural = 'Курсы'
@@ -42,9 +74,152 @@ class Course(models.Model):
         if self.pk:
             self.last_updated = timezone.now()
         super().save(*args, **kwargs)
+        CacheService.invalidate_course(self.pk)
+
+    def delete(self, *args, **kwargs):
+        """Invalidate cached responses of the deleted course."""
+        course_id = self.pk
+        result = super().delete(*args, **kwargs)
+        CacheService.invalidate_course(course_id)
+        return result
+
+    @classmethod
+    def adjust_counters(cls, course_id, **deltas):
+        """
+        Atomically shift the denormalized counters of a course.
+
+        Args:
+            course_id: ID of the course to update
+            **deltas: Counter field names mapped to the value to add
+        """
+        deltas = {name: delta for name, delta in deltas.items() if delta}
+        if not course_id or not deltas:
+            return
+        values = {}
+        for name, delta in deltas.items():
+            values[name] = F(name) + delta
+            if delta < 0:
+                # A drifted counter stops at zero instead of failing its
+                # CHECK constraint, recount_course_stats repairs it
+                values[name] = Greatest(
+                    values[name], 0, output_field=cls._meta.get_field(name)
+                )
+        cls.objects.filter(pk=course_id).update(**values)
+        CacheService.invalidate_course(course_id)
+
+
+class CourseCountersMixin:
+    """
+    Keep the denormalized counters on Course in sync with row writes.
+
+    Subclasses list the attributes their contribution depends on in
+    ``counter_fields`` and return it from ``get_counter_deltas``. The
+    contribution loaded from the database is remembered, so a save only
+    applies the difference. Saves and deletes, including cascades and
+    queryset deletes, are counted by the handlers in ``courses.signals``.
+    Bulk writes go through ``bulk_create_counted`` and
+    ``bulk_update_counted``. Queryset-level ``update`` bypasses this, use
+    the recount_course_stats command to repair such drift.
+    """
+
+    counter_fields = ('course_id',)
+
+    def get_counter_deltas(self):
+        """Return the contribution of this row to its course counters."""
+        return {}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_counters()
+        return instance
+
+    def _remember_counters(self):
+        if set(self.counter_fields) & self.get_deferred_fields():
+            self._counted = None
+        else:
+            self._counted = (self.course_id, self.get_counter_deltas())
 
+    def stored_counters(self):
+        """
+        Return the contribution of the stored row of this instance.
 
-class Lesson(models.Model):
+        Returns:
+            Tuple of course ID and counter deltas, None if there is no row
+        """
+        counted = getattr(self, '_counted', None)
+        if counted is None and self.pk is not None:
+            stored = (
+                type(self)
+                ._base_manager.filter(pk=self.pk)
+                .only(*self.counter_fields)
+                .first()
+            )
+            counted = stored._counted if stored else None
+        return counted
+
+    @staticmethod
+    def _apply_counter_changes(*pairs):
+        changes = {}
+        for old, new in pairs:
+            for counted, sign in ((old, -1), (new, 1)):
+                if counted is None:
+                    continue
+                course_id, deltas = counted
+                course_changes = changes.setdefault(course_id, {})
+                for name, value in deltas.items():
+                    course_changes[name] = course_changes.get(name, 0) + sign * value
+        for course_id, deltas in changes.items():
+            Course.adjust_counters(course_id, **deltas)
+
+    def save(self, *args, **kwargs):
+        # The post_save counter update commits together with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    @classmethod
+    def bulk_create_counted(cls, objs):
+        """
+        Insert rows with one query and shift counters once per course.
+
+        Args:
+            objs: Unsaved instances
+
+        Returns:
+            The created instances
+        """
+        with transaction.atomic():
+            objs = cls.objects.bulk_create(objs)
+            cls._apply_counter_changes(
+                *((None, (obj.course_id, obj.get_counter_deltas())) for obj in objs)
+            )
+        for obj in objs:
+            obj._remember_counters()
+        return objs
+
+    @classmethod
+    def bulk_update_counted(cls, objs, fields):
+        """
+        Update rows with one query and shift counters once per course.
+
+        Args:
+            objs: Instances loaded from the database and modified in memory
+            fields: Names of the fields to write
+        """
+        with transaction.atomic():
+            cls.objects.bulk_update(objs, fields)
+            cls._apply_counter_changes(
+                *(
+                    (obj._counted, (obj.course_id, obj.get_counter_deltas()))
+                    for obj in objs
+                    if getattr(obj, '_counted', None) is not None
+                )
+            )
+        for obj in objs:
+            obj._remember_counters()
+
+
+class Lesson(CourseCountersMixin, models.Model):
     """Lesson model."""
 
     course = models.ForeignKey(
@@ -77,16 +252,65 @@ class Lesson(models.Model):
     def __str__(self):
         return f'{self.title} - {self.course.title}'
 
+    def get_counter_deltas(self):
+        """Every lesson counts towards its course."""
+        return {'lessons_count': 1}
+
     def save(self, *args, **kwargs):
         """Update last_updated timestamp on save."""
         if self.pk:
             self.last_updated = timezone.now()
         super().save(*args, **kwargs)
+        CacheService.invalidate_course(self.course_id)
+
+    def delete(self, *args, **kwargs):
+        """Invalidate cached responses of the lesson's course."""
+        result = super().delete(*args, **kwargs)
+        CacheService.invalidate_course(self.course_id)
+        return result
+
+    @classmethod
+    def bulk_create_counted(cls, objs):
+        """Invalidate cached responses of every course that got lessons."""
+        objs = super().bulk_create_counted(objs)
+        for course_id in {lesson.course_id for lesson in objs}:
+            CacheService.invalidate_course(course_id)
+        return objs
+
+    @classmethod
+    def bulk_update_counted(cls, objs, fields):
+        """Touch the timestamps save() would and invalidate cached responses."""
+        # bulk_update() skips auto_now, so set updated_at like save() does
+        now = timezone.now()
+        course_ids = {
+            lesson._counted[0]
+            for lesson in objs
+            if getattr(lesson, '_counted', None)
+        }
+        for lesson in objs:
+            lesson.last_updated = now
+            lesson.updated_at = now
+            course_ids.add(lesson.course_id)
+        super().bulk_update_counted(
+            objs, {*fields, 'last_updated', 'updated_at'}
+        )
+        for course_id in course_ids:
+            CacheService.invalidate_course(course_id)
 
 
-class Subscription(models.Model):
+class Subscription(CourseCountersMixin, models.Model):
     """Subscription model for course updates."""
 
+    MODE_IMMEDIATE = 'immediate'
+    MODE_HOURLY = 'hourly'
+    MODE_DAILY = 'daily'
+
+    MODE_CHOICES = [
+        (MODE_IMMEDIATE, 'Сразу'),
+        (MODE_HOURLY, 'Сводка раз в час'),
+        (MODE_DAILY, 'Сводка раз в день'),
+    ]
+
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -100,6 +324,17 @@ class Subscription(models.Model):
         verbose_name='Курс',
     )
     is_active = models.BooleanField(default=True, verbose_name='Активна')
+    notification_mode = models.CharField(
+        max_length=20,
+        choices=MODE_CHOICES,
+        default=MODE_IMMEDIATE,
+        verbose_name='Режим уведомлений',
+    )
+    # Changes up to this moment are covered by sent digests
+    digest_sent_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Последняя сводка',
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -109,11 +344,17 @@ class Subscription(models.Model):
         unique_together = ['user', 'course']
         ordering = ['-created_at']
 
+    counter_fields = ('course_id', 'is_active')
+
     def __str__(self):
         return f'{self.user.email} -> {self.course.title}'
 
+    def get_counter_deltas(self):
+        """Only active subscriptions count towards the course."""
+        return {'subscribers_count': 1} if self.is_active else {}
+
 
-class Payment(models.Model):
+class Payment(CourseCountersMixin, models.Model):
     """Payment model for course purchases."""
 
     STATUS_PENDING = 'pending'
@@ -190,5 +431,219 @@ class Payment(models.Model):
         verbose_name_plural = 'Платежи'
         ordering = ['-created_at']
 
+    counter_fields = ('course_id', 'status', 'amount')
+
+    def __str__(self):
+        return f'{self.user.email} - {self.course.title} - {self.amount}'
+
+    def get_counter_deltas(self):
+        """Only succeeded payments count towards course revenue."""
+        if self.status != self.STATUS_SUCCEEDED:
+            return {}
+        return {'payments_count': 1, 'revenue': self.amount}
+
+
+class CourseStripePrice(models.Model):
+    """Stripe product of a course and its current price, reused by checkouts."""
+
+    course = models.OneToOneField(
+        Course,
+        on_delete=models.CASCADE,
+        related_name='stripe_price',
+        verbose_name='Курс',
+    )
+    product_id = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name='ID продукта в Stripe',
+    )
+    price_id = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name='ID цены в Stripe',
+    )
+    # Course price and currency the Stripe price was created for
+    amount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        blank=True,
+        null=True,
+        verbose_name='Сумма',
+    )
+    currency = models.CharField(max_length=3, blank=True, verbose_name='Валюта')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Цена курса в Stripe'
+        verbose_name_plural = 'Цены курсов в Stripe'
+
+    def __str__(self):
+        return f'{self.course_id}: {self.price_id} ({self.amount} {self.currency})'
+
+
+class ChangeEvent(models.Model):
+    """Change of a course or a lesson, collected into subscriber digests."""
+
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+        related_name='change_events',
+        verbose_name='Курс',
+    )
+    lesson = models.ForeignKey(
+        Lesson,
+        on_delete=models.CASCADE,
+        related_name='change_events',
+        verbose_name='Урок',
+        blank=True,
+        null=True,
+    )
+    change_key = models.CharField(
+        max_length=64,
+        unique=True,
+        verbose_name='Ключ изменения',
+    )
+    summary = models.CharField(max_length=255, verbose_name='Описание')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = 'Изменение'
+        verbose_name_plural = 'Изменения'
+        ordering = ['created_at', 'id']
+
+    def __str__(self):
+        return self.summary
+
+
+class NotificationOutbox(models.Model):
+    """
+    Notification of one change to one batch of subscribers.
+
+    A change is identified by ``change_key``, the unique constraint on
+    (change_key, batch) makes enqueueing the same change twice a no-op.
+    ``checkpoint`` and ``failed_recipients`` record the progress of a
+    delivery, so a delivery resumed after a crash skips the recipients
+    already handled.
+    """
+
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Ожидает отправки'),
+        (STATUS_SENDING, 'Отправляется'),
+        (STATUS_SENT, 'Отправлено'),
+        (STATUS_FAILED, 'Не удалось'),
+    ]
+
+    # Empty for digests, which span all courses of a subscriber
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+        related_name='notifications',
+        verbose_name='Курс',
+        blank=True,
+        null=True,
+    )
+    lesson = models.ForeignKey(
+        Lesson,
+        on_delete=models.CASCADE,
+        related_name='notifications',
+        verbose_name='Урок',
+        blank=True,
+        null=True,
+    )
+    change_key = models.CharField(max_length=64, verbose_name='Ключ изменения')
+    batch = models.PositiveIntegerField(verbose_name='Пакет получателей')
+    subject = models.CharField(max_length=255, verbose_name='Тема')
+    message = models.TextField(verbose_name='Текст')
+    recipients = models.JSONField(default=list, verbose_name='Получатели')
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        verbose_name='Статус',
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Попытки')
+    # Recipients before this position are handled in the current delivery
+    checkpoint = models.PositiveIntegerField(
+        default=0, verbose_name='Обработано получателей'
+    )
+    failed_recipients = models.JSONField(
+        default=list, verbose_name='Ошибки доставки'
+    )
+    retry_at = models.DateTimeField(
+        blank=True, null=True, verbose_name='Повтор после'
+    )
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Уведомление'
+        verbose_name_plural = 'Уведомления'
+        ordering = ['created_at', 'batch']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['change_key', 'batch'],
+                name='unique_notification_batch',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} #{self.batch} ({self.status})'
+
+
+class QueuedTask(models.Model):
+    """
+    Task call stored by the local task backend until a pool runs it.
+
+    Used instead of the Celery broker when TASK_BACKEND is 'local', see
+    courses.services.local_task_service.
+    """
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Ожидает'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Выполнена'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    task_id = models.CharField(max_length=255, unique=True)
+    name = models.CharField(max_length=255, verbose_name='Задача')
+    args = models.JSONField(default=list, verbose_name='Аргументы')
+    kwargs = models.JSONField(default=dict, verbose_name='Именованные аргументы')
+    retries = models.PositiveIntegerField(default=0, verbose_name='Повторы')
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        verbose_name='Статус',
+    )
+    # Not run before this moment
+    eta = models.DateTimeField(default=timezone.now, verbose_name='Запуск после')
+    locked_at = models.DateTimeField(blank=True, null=True)
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = 'Задача в очереди'
+        verbose_name_plural = 'Задачи в очереди'
+        ordering = ['eta', 'id']
+        indexes = [
+            models.Index(fields=['status', 'eta']),
+        ]
+
     def __str__(self):
-        return f'{self.user.email} - {self.course.title} - {self.amount}'
\ No newline at end of file
+        return f'{self.name}[{self.task_id}] ({self.status})'
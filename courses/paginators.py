@@ -1,17 +1,181 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import (
+    BasePagination,
+    CursorPagination,
+    PageNumberPagination,
+)
+from rest_framework.settings import api_settings
 
 
-class CoursePagination(PageNumberPagination):
-    """Pagination for Course views."""
+class CursorOrPageNumberPagination(BasePagination):
+    """
+    Pagination that serves keyset cursors or classic page numbers.
+
+    Cursor mode is used when the request carries a cursor or asks for it
+    with ``?pagination=cursor``; it skips the COUNT query and the deep
+    OFFSET. Page-number mode stays the default for old clients.
+    """
+
+    page_number_class = PageNumberPagination
+    cursor_class = CursorPagination
+    mode_query_param = "pagination"
+    default_mode = "page"
+
+    def __init__(self):
+        self.page_number_paginator = self.page_number_class()
+        self.cursor_paginator = self.cursor_class()
+        self.active_paginator = self.page_number_paginator
+
+    def get_mode(self, request):
+        """Return "cursor" or "page" for the given request."""
+        if self.cursor_paginator.cursor_query_param in request.query_params:
+            return "cursor"
+        mode = request.query_params.get(self.mode_query_param, self.default_mode)
+        return "cursor" if mode == "cursor" else "page"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.get_mode(request) == "cursor":
+            self.active_paginator = self.cursor_paginator
+        else:
+            self.active_paginator = self.page_number_paginator
+        return self.active_paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.active_paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.page_number_paginator.get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        parameters = self.page_number_paginator.get_schema_operation_parameters(view)
+        names = {parameter["name"] for parameter in parameters}
+        parameters += [
+            parameter
+            for parameter in self.cursor_paginator.get_schema_operation_parameters(
+                view
+            )
+            if parameter["name"] not in names
+        ]
+        return parameters
+
+    def get_results(self, data):
+        return self.active_paginator.get_results(data)
+
+    def to_html(self):
+        return self.active_paginator.to_html()
+
+    @property
+    def display_page_controls(self):
+        return getattr(self.active_paginator, "display_page_controls", False)
+
+
+class RankedCursorPagination(CursorPagination):
+    """
+    Cursor pagination that keeps the ?q= search rank order.
+
+    A ranked queryset is paged by rank with id as the tie-breaker,
+    any other queryset by ``ordering``.
+    """
+
+    rank_ordering = ("-search_rank", "id")
 
-    page_size = 5  # Количество курсов на странице
+    def get_ordering(self, request, queryset, view):
+        if "search_rank" in queryset.query.annotations:
+            return self.rank_ordering
+        return super().get_ordering(request, queryset, view)
+
+
+class CoursePageNumberPagination(PageNumberPagination):
+    """Page-number pagination for Course views."""
+
+    # Количество курсов на странице, как у остальных списков по умолчанию
+    page_size = api_settings.PAGE_SIZE
     page_size_query_param = "page_size"  # Параметр для изменения размера страницы
     max_page_size = 50  # Максимальное количество на странице
 
 
-class LessonPagination(PageNumberPagination):
-    """Pagination for Lesson views."""
+class CourseCursorPagination(RankedCursorPagination):
+    """Cursor pagination for Course views."""
+
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = 50
+    ordering = ("-created_at", "-id")  # id - для однозначного порядка
+
+
+class CoursePagination(CursorOrPageNumberPagination):
+    """Pagination for Course views."""
+
+    page_number_class = CoursePageNumberPagination
+    cursor_class = CourseCursorPagination
+
+
+class LessonPageNumberPagination(PageNumberPagination):
+    """Page-number pagination for Lesson views."""
 
     page_size = 10  # Количество уроков на странице
     page_size_query_param = "page_size"
     max_page_size = 100
+
+
+class LessonCursorPagination(RankedCursorPagination):
+    """Cursor pagination for Lesson views."""
+
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ("created_at", "id")
+
+
+class LessonPagination(CursorOrPageNumberPagination):
+    """Pagination for Lesson views."""
+
+    page_number_class = LessonPageNumberPagination
+    cursor_class = LessonCursorPagination
+
+
+class SubscriptionPageNumberPagination(PageNumberPagination):
+    """Page-number pagination for Subscription views."""
+
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class SubscriptionCursorPagination(CursorPagination):
+    """Cursor pagination for Subscription views."""
+
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ("-created_at", "-id")
+
+
+class SubscriptionPagination(CursorOrPageNumberPagination):
+    """Pagination for Subscription views."""
+
+    page_number_class = SubscriptionPageNumberPagination
+    cursor_class = SubscriptionCursorPagination
+
+
+class PaymentPageNumberPagination(PageNumberPagination):
+    """Page-number pagination for Payment views."""
+
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class PaymentCursorPagination(CursorPagination):
+    """Cursor pagination for Payment views."""
+
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ("-created_at", "-id")
+
+
+class PaymentPagination(CursorOrPageNumberPagination):
+    """Pagination for Payment views."""
+
+    page_number_class = PaymentPageNumberPagination
+    cursor_class = PaymentCursorPagination
@@ -1,7 +1,13 @@
-from rest_framework import permissions
+from users.permissions import (
+    SCOPE_ALL,
+    SCOPE_NONE,
+    SCOPE_OWNER,
+    ScopedPermission,
+)
+from users.services.role_service import RoleService
 
 
-class CoursePermissions(permissions.BasePermission):
+class CoursePermissions(ScopedPermission):
     """Кастомные разрешения для курсов."""
 
     def has_permission(self, request, view):
@@ -13,63 +19,30 @@ class CoursePermissions(permissions.BasePermission):
         if view.action == "create":
             return (
                 request.user.is_authenticated
-                and not request.user.groups.filter(name="moderators").exists()
+                and not RoleService.is_moderator(request.user)
             )
 
         # Для остальных действий нужна аутентификация
         return request.user.is_authenticated
 
-    def has_object_permission(self, request, view, obj):
-        # Модераторы могут просматривать и редактировать, но не удалять
-        if request.user.groups.filter(name="moderators").exists():
-            if view.action in ["retrieve", "update", "partial_update"]:
-                return True
-            if view.action == "destroy":
-                return False
+    def get_scope(self, request, view):
+        # Список содержит то, что можно просматривать
+        action = "retrieve" if view.action == "list" else view.action
 
-        # Владельцы могут все
-        if obj.owner == request.user:
-            return True
+        # Модераторы могут просматривать и редактировать, но не удалять
+        if RoleService.is_moderator(request.user):
+            if action in ["retrieve", "update", "partial_update"]:
+                return SCOPE_ALL
+            if action == "destroy":
+                return SCOPE_NONE
 
         # Для просмотра разрешаем всем авторизованным
-        if view.action == "retrieve":
-            return request.user.is_authenticated
-
-        return False
-
-
-class LessonPermissions(permissions.BasePermission):
-    """Кастомные разрешения для уроков."""
-
-    def has_permission(self, request, view):
-        # Разрешаем просмотр списка всем авторизованным
-        if view.action in ["list", "retrieve"]:
-            return True
-
-        # Разрешаем создание только не-модераторам
-        if view.action == "create":
-            return (
-                request.user.is_authenticated
-                and not request.user.groups.filter(name="moderators").exists()
-            )
-
-        # Для остальных действий нужна аутентификация
-        return request.user.is_authenticated
-
-    def has_object_permission(self, request, view, obj):
-        # Модераторы могут просматривать и редактировать, но не удалять
-        if request.user.groups.filter(name="moderators").exists():
-            if view.action in ["retrieve", "update", "partial_update"]:
-                return True
-            if view.action == "destroy":
-                return False
+        if action == "retrieve" and request.user.is_authenticated:
+            return SCOPE_ALL
 
         # Владельцы могут все
-        if obj.owner == request.user:
-            return True
+        return SCOPE_OWNER
 
-        # Для просмотра разрешаем всем авторизованным
-        if view.action == "retrieve":
-            return request.user.is_authenticated
 
-        return False
+class LessonPermissions(CoursePermissions):
+    """Кастомные разрешения для уроков."""
@@ -1,30 +1,145 @@
+from functools import cached_property
+
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from .models import Course, Lesson, Payment, Subscription
 from .services.stripe_service import StripeService
+from .validators import validate_youtube_url
 
 User = get_user_model()
 
 
-class LessonSerializer(serializers.ModelSerializer):
+class SearchResultMixin:
+    """Add rank and highlighted matches to full-text search results."""
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if hasattr(instance, "search_rank"):
+            data["search"] = {
+                "rank": instance.search_rank,
+                "title": instance.search_title,
+                "snippet": instance.search_snippet,
+            }
+        return data
+
+
+class SparseFieldsetSerializerMixin:
+    """
+    Keep only the fields selected by ``SparseFieldsetMixin`` views.
+
+    The selection arrives as ``sparse_fields`` in the context and applies
+    to the top-level serializer only, nested ones stay complete.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = self.context.get("sparse_fields")
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if selected is None or parent is not None:
+            return fields
+        return {name: field for name, field in fields.items() if name in selected}
+
+
+class LessonSerializer(
+    SparseFieldsetSerializerMixin, SearchResultMixin, serializers.ModelSerializer
+):
     """Serializer for Lesson model."""
 
     class Meta:
         model = Lesson
         fields = "__all__"
+        profiles = {
+            "summary": ("id", "course", "title", "video_url", "last_updated"),
+        }
 
 
-class CourseSerializer(serializers.ModelSerializer):
-    """Serializer for Course model."""
+class LessonBulkListSerializer(serializers.ListSerializer):
+    """
+    Create or update a list of lessons in one transaction.
+
+    Updates are matched to ``instance`` by the ``id`` of every item.
+    """
+
+    @cached_property
+    def lessons_by_id(self):
+        return {lesson.pk: lesson for lesson in self.instance or ()}
+
+    def to_internal_value(self, data):
+        self.matched_lessons = []
+        if self.instance is not None and isinstance(data, list):
+            ids = [item.get("id") for item in data if isinstance(item, dict)]
+            if len(set(ids)) != len(ids):
+                raise serializers.ValidationError(
+                    {api_settings.NON_FIELD_ERRORS_KEY: ["Duplicate lesson ids"]}
+                )
+        return super().to_internal_value(data)
+
+    def run_child_validation(self, data):
+        if self.instance is not None:
+            lesson = None
+            if isinstance(data, dict):
+                lesson = self.lessons_by_id.get(data.get("id"))
+            if lesson is None:
+                raise serializers.ValidationError({"id": ["Lesson not found"]})
+            self.child.instance = lesson
+            self.matched_lessons.append(lesson)
+        return super().run_child_validation(data)
+
+    def create(self, validated_data):
+        return Lesson.bulk_create_counted(
+            [Lesson(**attrs) for attrs in validated_data]
+        )
+
+    def update(self, instance, validated_data):
+        fields = set()
+        for lesson, attrs in zip(self.matched_lessons, validated_data):
+            for name, value in attrs.items():
+                setattr(lesson, name, value)
+            fields.update(attrs)
+        Lesson.bulk_update_counted(self.matched_lessons, fields)
+        return self.matched_lessons
 
-    lessons_count = serializers.IntegerField(source="lessons.count", read_only=True)
+
+class LessonBulkSerializer(LessonSerializer):
+    """Serializer for lessons written through the bulk endpoint."""
+
+    class Meta(LessonSerializer.Meta):
+        list_serializer_class = LessonBulkListSerializer
+        extra_kwargs = {"video_url": {"validators": [validate_youtube_url]}}
+
+
+class CourseSerializer(
+    SparseFieldsetSerializerMixin, SearchResultMixin, serializers.ModelSerializer
+):
+    """Serializer for Course model."""
 
     class Meta:
         model = Course
         fields = "__all__"
+        read_only_fields = Course.COUNTER_FIELDS
+        profiles = {
+            "summary": ("id", "title", "price", "lessons_count", "last_updated"),
+        }
+
+
+class CourseWithLessonsSerializer(CourseSerializer):
+    """Serializer for Course model with nested lessons."""
+
+    lessons = LessonSerializer(
+        source="prefetched_lessons", many=True, read_only=True
+    )
 
+    class Meta(CourseSerializer.Meta):
+        profiles = {
+            "summary": CourseSerializer.Meta.profiles["summary"] + ("lessons",),
+        }
 
-class PaymentSerializer(serializers.ModelSerializer):
+
+class PaymentSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     """Serializer for Payment model."""
 
     user_email = serializers.EmailField(source="user.email", read_only=True)
@@ -56,6 +171,16 @@ class PaymentSerializer(serializers.ModelSerializer):
             "payment_url",
             "created_at",
         ]
+        profiles = {
+            "summary": (
+                "id",
+                "course",
+                "course_title",
+                "amount",
+                "status",
+                "created_at",
+            ),
+        }
 
 
 class PaymentCreateSerializer(serializers.ModelSerializer):
@@ -83,18 +208,8 @@ class PaymentCreateSerializer(serializers.ModelSerializer):
         user = request.user
         course = validated_data["course"]
 
-        # Create Stripe product
-        product_id = StripeService.create_product(
-            name=course.title,
-            description=course.description or "",
-        )
-
-        # Create Stripe price
-        price_id = StripeService.create_price(
-            product_id=product_id,
-            amount=float(course.price),
-            currency="rub",
-        )
+        # Stripe product and price are reused while the course price holds
+        product_id, price_id = StripeService.get_course_price(course)
 
         # Create Stripe checkout session
         success_url = f'{request.build_absolute_uri("/")}api/payments/success/'
@@ -127,7 +242,9 @@ class PaymentCreateSerializer(serializers.ModelSerializer):
         return payment
 
 
-class SubscriptionSerializer(serializers.ModelSerializer):
+class SubscriptionSerializer(
+    SparseFieldsetSerializerMixin, serializers.ModelSerializer
+):
     """Serializer for Subscription model."""
 
     user_email = serializers.EmailField(source='user.email', read_only=True)
@@ -142,6 +259,24 @@ class SubscriptionSerializer(serializers.ModelSerializer):
             'course',
             'course_title',
             'is_active',
+            'notification_mode',
             'created_at',
         ]
-        read_only_fields = ['user', 'is_active', 'created_at']
\ No newline at end of file
+        read_only_fields = ['user', 'is_active', 'created_at']
+        profiles = {
+            'summary': ('id', 'course', 'course_title', 'is_active', 'created_at'),
+        }
+
+
+class SubscriptionSettingsSerializer(SubscriptionSerializer):
+    """Serializer changing how a subscriber is notified."""
+
+    class Meta(SubscriptionSerializer.Meta):
+        read_only_fields = ['user', 'course', 'is_active', 'created_at']
+
+    def update(self, instance, validated_data):
+        mode = validated_data.get('notification_mode', instance.notification_mode)
+        if mode != instance.notification_mode:
+            # The first digest only covers changes made after the switch
+            instance.digest_sent_at = timezone.now()
+        return super().update(instance, validated_data)
@@ -0,0 +1,218 @@
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+GLOBAL_VERSION_KEY = "courses:version:global"
+COURSE_VERSION_KEY = "courses:version:course:{course_id}"
+STATS_KEY = "courses:cache:stats:{name}"
+RESPONSE_KEY = "courses:response:{scope}:{digest}"
+LOCK_KEY = "{key}:lock:{version}"
+
+CACHE_HIT = "hit"
+CACHE_STALE = "stale"
+CACHE_MISS = "miss"
+
+
+class CacheService:
+    """Service for versioned caching of course catalog data."""
+
+    @staticmethod
+    def get_version(key: str) -> int:
+        """
+        Get current version stored under key, initializing it if missing.
+
+        A fresh version starts from the current time in nanoseconds, so an
+        evicted version key never resurrects entries cached under an old one.
+
+        Args:
+            key: Version key
+
+        Returns:
+            Current version number
+        """
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, time.time_ns(), timeout=None)
+            version = cache.get(key, 0)
+        return version
+
+    @staticmethod
+    def bump_version(key: str) -> None:
+        """
+        Increment the version stored under key.
+
+        Args:
+            key: Version key
+        """
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+
+    @staticmethod
+    def global_version() -> int:
+        """Get the catalog-wide version used by list responses."""
+        return CacheService.get_version(GLOBAL_VERSION_KEY)
+
+    @staticmethod
+    def course_version(course_id) -> int:
+        """Get the version of a single course and its lessons."""
+        return CacheService.get_version(COURSE_VERSION_KEY.format(course_id=course_id))
+
+    @staticmethod
+    def invalidate_course(course_id) -> None:
+        """
+        Invalidate cached responses for a course and for the catalog.
+
+        The versions are bumped right away and once more after the current
+        transaction commits, so entries rebuilt from pre-commit data in the
+        meantime are discarded as well.
+
+        Args:
+            course_id: ID of the changed course
+        """
+
+        def bump():
+            if course_id:
+                CacheService.bump_version(
+                    COURSE_VERSION_KEY.format(course_id=course_id)
+                )
+            CacheService.bump_version(GLOBAL_VERSION_KEY)
+
+        bump()
+        transaction.on_commit(bump)
+
+    @staticmethod
+    def make_key(scope: str, *parts) -> str:
+        """
+        Build a response cache key.
+
+        The version is not part of the key: it is stored with the value,
+        so the previous value stays available for stale-while-revalidate.
+
+        Args:
+            scope: Logical endpoint name
+            *parts: Anything else the response depends on
+
+        Returns:
+            Cache key
+        """
+        digest = hashlib.md5(repr(parts).encode()).hexdigest()
+        return RESPONSE_KEY.format(scope=scope, digest=digest)
+
+    @staticmethod
+    def single_flight(
+        key: str,
+        version,
+        compute,
+        timeout: int = None,
+        lease: int = None,
+        stale_timeout: int = None,
+        wait: float = None,
+    ) -> tuple:
+        """
+        Get a cached value, computing it at most once per key and version.
+
+        The first caller to miss takes a short lease and recomputes. While
+        it does, other callers are served the previous (stale) value, or,
+        if there is none, wait for the leader with growing pauses for at
+        most ``wait`` seconds and then compute it themselves.
+
+        Args:
+            key: Cache key, without the version
+            version: Version the value must match to count as fresh
+            compute: Callable producing the value, None means "do not cache"
+            timeout: Seconds a value stays fresh
+            lease: Seconds the recompute lock is held at most
+            stale_timeout: Extra seconds a value is kept to be served stale
+            wait: Seconds a caller without any value waits for the leader
+
+        Returns:
+            Tuple of (value, one of CACHE_HIT/CACHE_STALE/CACHE_MISS)
+        """
+        if timeout is None:
+            timeout = settings.RESPONSE_CACHE_TIMEOUT
+        if lease is None:
+            lease = settings.RESPONSE_CACHE_LOCK_LEASE
+        if stale_timeout is None:
+            stale_timeout = settings.RESPONSE_CACHE_STALE_TIMEOUT
+        if wait is None:
+            wait = settings.RESPONSE_CACHE_WAIT
+
+        entry = cache.get(key)
+        if entry is not None:
+            entry_version, fresh_until, value = entry
+            if entry_version == version and fresh_until > time.time():
+                return value, CACHE_HIT
+
+        lock_key = LOCK_KEY.format(key=key, version=version)
+        token = uuid.uuid4().hex
+        if cache.add(lock_key, token, lease):
+            try:
+                value = compute()
+                if value is not None:
+                    cache.set(
+                        key,
+                        (version, time.time() + timeout, value),
+                        timeout + stale_timeout,
+                    )
+                return value, CACHE_MISS
+            finally:
+                if cache.get(lock_key) == token:
+                    cache.delete(lock_key)
+
+        if entry is not None:
+            return entry[2], CACHE_STALE
+
+        deadline = time.monotonic() + min(wait, lease)
+        pause = 0.01
+        while (remaining := deadline - time.monotonic()) > 0:
+            time.sleep(min(pause, remaining))
+            pause *= 2
+            entry = cache.get(key)
+            if entry is not None and entry[0] == version:
+                return entry[2], CACHE_HIT
+            if cache.get(lock_key) is None:
+                # The leader finished without caching a value
+                break
+
+        # The leader did not deliver in time, compute without caching
+        return compute(), CACHE_MISS
+
+    @staticmethod
+    def record(name: str) -> None:
+        """Increment the hit or miss counter."""
+        key = STATS_KEY.format(name=name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            if not cache.add(key, 1, timeout=None):
+                cache.incr(key)
+
+    @staticmethod
+    def get_stats() -> dict:
+        """
+        Get response cache counters.
+
+        Returns:
+            Dictionary with hits, misses and hit ratio
+        """
+        hits = cache.get(STATS_KEY.format(name="hits"), 0)
+        misses = cache.get(STATS_KEY.format(name="misses"), 0)
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / total, 4) if total else 0.0,
+        }
+
+    @staticmethod
+    def reset_stats() -> None:
+        """Reset response cache counters."""
+        cache.delete_many(
+            [STATS_KEY.format(name="hits"), STATS_KEY.format(name="misses")]
+        )
@@ -0,0 +1,228 @@
+import csv
+from datetime import datetime, time, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Prefetch, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.text import compress_sequence
+from rest_framework.utils.encoders import JSONEncoder
+
+from courses.models import Course, Lesson, Payment, Subscription
+from courses.serializers import (
+    CourseWithLessonsSerializer,
+    PaymentSerializer,
+    SubscriptionSerializer,
+)
+
+FORMAT_NDJSON = "ndjson"
+FORMAT_CSV = "csv"
+
+FORMATS = {
+    FORMAT_NDJSON: ("application/x-ndjson", "jsonl"),
+    FORMAT_CSV: ("text/csv", "csv"),
+}
+
+# Relations only staff may add to an export
+STAFF_RELATIONS = ("subscriptions", "payments")
+
+COURSE_COLUMNS = ("id", "title", "description", "price", "last_updated", "updated_at")
+LESSON_COLUMNS = (
+    "id",
+    "title",
+    "description",
+    "video_url",
+    "last_updated",
+    "updated_at",
+)
+
+
+class _Echo:
+    """File-like object handing back whatever csv.writer writes."""
+
+    def write(self, value):
+        return value
+
+
+class ExportService:
+    """Service for streaming the whole course catalog."""
+
+    @staticmethod
+    def parse_updated_since(value):
+        """
+        Parse an ISO date or datetime, naive values are taken as UTC.
+
+        Args:
+            value: Raw parameter value, may be empty
+
+        Returns:
+            Aware datetime or None
+
+        Raises:
+            ValueError: If the value is not a date or datetime
+        """
+        if not value:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError(f"Invalid date or datetime: {value}")
+            parsed = datetime.combine(day, time.min)
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed, dt_timezone.utc)
+        return parsed
+
+    @staticmethod
+    def get_queryset(include=(), updated_since=None):
+        """
+        Build the course queryset of an export.
+
+        A course counts as updated when its row or one of its lessons
+        changed, lesson writes do not touch the course timestamp.
+
+        Args:
+            include: Extra relations to prefetch (subscriptions, payments)
+            updated_since: Only export courses changed at or after this time
+
+        Returns:
+            Course queryset ordered by primary key
+        """
+        queryset = Course.objects.order_by("pk").prefetch_related(
+            Prefetch(
+                "lessons",
+                queryset=Lesson.objects.order_by("created_at", "id"),
+                to_attr="prefetched_lessons",
+            )
+        )
+        if "subscriptions" in include:
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    "subscriptions",
+                    queryset=Subscription.objects.select_related("user").order_by("id"),
+                    to_attr="prefetched_subscriptions",
+                )
+            )
+        if "payments" in include:
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    "payments",
+                    queryset=Payment.objects.select_related("user").order_by("id"),
+                    to_attr="prefetched_payments",
+                )
+            )
+        if updated_since is not None:
+            changed_lessons = Lesson.objects.filter(
+                course=OuterRef("pk"), updated_at__gte=updated_since
+            )
+            queryset = queryset.filter(
+                Q(updated_at__gte=updated_since) | Q(Exists(changed_lessons))
+            )
+        return queryset
+
+    @staticmethod
+    def iter_ndjson(queryset, include=(), chunk_size=None):
+        """
+        Yield one JSON document per course, lessons nested.
+
+        Args:
+            queryset: Queryset from ``get_queryset``
+            include: Extra relations to serialize
+            chunk_size: Courses fetched (and prefetched) per query
+        """
+        encoder = JSONEncoder(ensure_ascii=False)
+        chunk_size = chunk_size or settings.CATALOG_EXPORT_CHUNK_SIZE
+        for course in queryset.iterator(chunk_size=chunk_size):
+            data = CourseWithLessonsSerializer(course).data
+            if "subscriptions" in include:
+                data["subscriptions"] = SubscriptionSerializer(
+                    course.prefetched_subscriptions, many=True
+                ).data
+            if "payments" in include:
+                data["payments"] = PaymentSerializer(
+                    course.prefetched_payments, many=True
+                ).data
+            yield encoder.encode(data) + "\n"
+
+    @staticmethod
+    def iter_csv(queryset, chunk_size=None):
+        """
+        Yield a header and one CSV row per lesson.
+
+        Courses without lessons get a single row with empty lesson columns.
+
+        Args:
+            queryset: Queryset from ``get_queryset``
+            chunk_size: Courses fetched (and prefetched) per query
+        """
+        writer = csv.writer(_Echo())
+        chunk_size = chunk_size or settings.CATALOG_EXPORT_CHUNK_SIZE
+        yield writer.writerow(
+            [f"course_{name}" for name in COURSE_COLUMNS]
+            + [f"lesson_{name}" for name in LESSON_COLUMNS]
+        )
+        for course in queryset.iterator(chunk_size=chunk_size):
+            course_row = [getattr(course, name) for name in COURSE_COLUMNS]
+            lessons = course.prefetched_lessons
+            if not lessons:
+                yield writer.writerow(course_row + [""] * len(LESSON_COLUMNS))
+            for lesson in lessons:
+                yield writer.writerow(
+                    course_row + [getattr(lesson, name) for name in LESSON_COLUMNS]
+                )
+
+    @staticmethod
+    def stream(
+        export_format,
+        include=(),
+        updated_since=None,
+        compress=False,
+        chunk_size=None,
+    ):
+        """
+        Stream an export as bytes, buffered into blocks of about 64 KiB.
+
+        Args:
+            export_format: FORMAT_NDJSON or FORMAT_CSV
+            include: Extra relations, only supported for NDJSON
+            updated_since: Only export courses changed at or after this time
+            compress: Gzip the stream on the fly
+            chunk_size: Courses fetched per query
+
+        Returns:
+            Iterator of bytes
+
+        Raises:
+            ValueError: If the format or the relations are not supported
+        """
+        if export_format not in FORMATS:
+            raise ValueError(f"Unsupported export format: {export_format}")
+        unknown = set(include) - set(STAFF_RELATIONS)
+        if unknown:
+            raise ValueError(f"Unsupported relations: {', '.join(sorted(unknown))}")
+        if include and export_format != FORMAT_NDJSON:
+            raise ValueError("Relations can only be included in NDJSON exports")
+
+        queryset = ExportService.get_queryset(include, updated_since)
+        if export_format == FORMAT_NDJSON:
+            lines = ExportService.iter_ndjson(queryset, include, chunk_size)
+        else:
+            lines = ExportService.iter_csv(queryset, chunk_size)
+
+        chunks = ExportService._buffer(lines)
+        return compress_sequence(chunks) if compress else chunks
+
+    @staticmethod
+    def _buffer(lines, size=64 * 1024):
+        buffer = []
+        buffered = 0
+        for line in lines:
+            data = line.encode()
+            buffer.append(data)
+            buffered += len(data)
+            if buffered >= size:
+                yield b"".join(buffer)
+                buffer = []
+                buffered = 0
+        if buffer:
+            yield b"".join(buffer)
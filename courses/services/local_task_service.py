@@ -0,0 +1,311 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import django
+from celery import current_app
+from celery.exceptions import Retry
+from celery.schedules import maybe_schedule
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from courses.models import QueuedTask
+
+logger = logging.getLogger(__name__)
+
+# Finished calls are kept this long, periodic runs are deduplicated
+# against them across processes
+KEEP_FINISHED = timedelta(days=1)
+
+# Seconds between two purges of finished calls
+PURGE_INTERVAL = 600
+
+
+class LocalTaskService:
+    """
+    Service for the database task queue of the local task backend.
+
+    Task calls are stored as QueuedTask rows: they survive restarts and,
+    like ``TaskService.dispatch``, only become visible once the enqueuing
+    transaction commits. Due rows are claimed with a conditional update,
+    a row whose process went away is claimed again after
+    TASK_LOCAL_LEASE seconds. Claimed calls run like on a Celery worker,
+    so retries and autoretry store the call again with its countdown.
+    """
+
+    @staticmethod
+    def enqueue(
+        name, args=None, kwargs=None, task_id=None, eta=None, countdown=None, retries=0
+    ) -> str:
+        """
+        Store a task call.
+
+        A retry re-arms the stored call with the same ID, any other call
+        with the ID of a stored call is dropped.
+
+        Args:
+            name: Registered task name
+            args: Positional task arguments
+            kwargs: Keyword task arguments
+            task_id: ID of the call, generated if omitted
+            eta: Datetime (or ISO string) the call is not run before
+            countdown: Seconds the call is delayed, if no eta is given
+            retries: Number of retries of the call so far
+
+        Returns:
+            ID of the call
+        """
+        if isinstance(eta, str):
+            eta = parse_datetime(eta)
+        if eta is None:
+            eta = timezone.now() + timedelta(seconds=countdown or 0)
+        task_id = task_id or str(uuid4())
+        values = {
+            "name": name,
+            "args": list(args or ()),
+            "kwargs": dict(kwargs or {}),
+            "eta": eta,
+            "retries": retries,
+        }
+        if retries:
+            QueuedTask.objects.update_or_create(
+                task_id=task_id,
+                defaults={
+                    **values,
+                    "status": QueuedTask.STATUS_PENDING,
+                    "locked_at": None,
+                },
+            )
+        else:
+            QueuedTask.objects.bulk_create(
+                [QueuedTask(task_id=task_id, **values)], ignore_conflicts=True
+            )
+        transaction.on_commit(LocalTaskExecutor.wake)
+        return task_id
+
+    @staticmethod
+    def _due(now):
+        stale = now - timedelta(seconds=settings.TASK_LOCAL_LEASE)
+        return Q(status=QueuedTask.STATUS_PENDING, eta__lte=now) | Q(
+            status=QueuedTask.STATUS_RUNNING, locked_at__lt=stale
+        )
+
+    @staticmethod
+    def claim(limit) -> list:
+        """
+        Take due calls for running.
+
+        Args:
+            limit: Maximum number of calls
+
+        Returns:
+            IDs of the claimed QueuedTask rows
+        """
+        now = timezone.now()
+        due = QueuedTask.objects.filter(LocalTaskService._due(now))
+        claimed = []
+        for pk in due.order_by("eta", "id").values_list("pk", flat=True)[:limit]:
+            # Another process may have claimed it since the select
+            if due.filter(pk=pk).update(
+                status=QueuedTask.STATUS_RUNNING, locked_at=now
+            ):
+                claimed.append(pk)
+        return claimed
+
+    @staticmethod
+    def execute(pk) -> None:
+        """
+        Run a claimed call as a Celery worker would.
+
+        Args:
+            pk: ID of the claimed QueuedTask row
+        """
+        item = QueuedTask.objects.get(pk=pk)
+        running = QueuedTask.objects.filter(pk=pk, status=QueuedTask.STATUS_RUNNING)
+        try:
+            if item.name not in current_app.tasks:
+                # Task modules are autodiscovered when a worker starts
+                current_app.loader.import_default_modules()
+            task = current_app.tasks[item.name]
+            task.push_request(
+                id=item.task_id,
+                args=item.args,
+                kwargs=item.kwargs,
+                retries=item.retries,
+                is_eager=False,
+                called_directly=False,
+                delivery_info={},
+            )
+            try:
+                task.run(*item.args, **item.kwargs)
+            finally:
+                task.pop_request()
+        except Retry:
+            # The retry stored the call again
+            return
+        except Exception:
+            logger.exception("Task %s[%s] failed", item.name, item.task_id)
+            running.update(
+                status=QueuedTask.STATUS_FAILED,
+                error=traceback.format_exc(),
+                finished_at=timezone.now(),
+            )
+            return
+        running.update(status=QueuedTask.STATUS_DONE, finished_at=timezone.now())
+
+    @staticmethod
+    def run_pending() -> int:
+        """
+        Run all due calls in this thread, for tests and draining.
+
+        Returns:
+            Number of calls run
+        """
+        count = 0
+        while claimed := LocalTaskService.claim(1):
+            LocalTaskService.execute(claimed[0])
+            count += 1
+        return count
+
+    @staticmethod
+    def enqueue_periodic(last_runs) -> None:
+        """
+        Enqueue the due entries of the Celery beat schedule.
+
+        A run is keyed by entry and the time it was scheduled for, so
+        processes sharing the database enqueue it once, however far apart
+        they notice it.
+
+        Args:
+            last_runs: Dict of entry name to last run, updated in place
+        """
+        for name, entry in current_app.conf.beat_schedule.items():
+            schedule = maybe_schedule(entry["schedule"], app=current_app)
+            now = schedule.now()
+            last_run = last_runs.setdefault(name, now)
+            if schedule.is_due(last_run).is_due:
+                last_runs[name] = now
+                due_at = LocalTaskService._scheduled_at(schedule, last_run, now)
+                LocalTaskService.enqueue(
+                    entry["task"],
+                    entry.get("args"),
+                    entry.get("kwargs"),
+                    task_id=f"beat:{name}:{due_at:%Y-%m-%dT%H:%M}",
+                )
+
+    @staticmethod
+    def _scheduled_at(schedule, last_run, now):
+        if hasattr(schedule, "remaining_delta"):
+            # Crontab entries fire at fixed times, the run is the first
+            # one after the last
+            last_run, delta, _ = schedule.remaining_delta(last_run)
+            return last_run + delta
+        if hasattr(schedule, "run_every"):
+            # Interval entries are aligned to the epoch
+            every = schedule.run_every.total_seconds()
+            return datetime.fromtimestamp(
+                now.timestamp() // every * every, tz=now.tzinfo
+            )
+        return now
+
+    @staticmethod
+    def purge() -> int:
+        """Delete calls that finished more than KEEP_FINISHED ago."""
+        return QueuedTask.objects.filter(
+            status=QueuedTask.STATUS_DONE,
+            finished_at__lt=timezone.now() - KEEP_FINISHED,
+        ).delete()[0]
+
+
+def _run_in_pool(pk):
+    try:
+        LocalTaskService.execute(pk)
+    finally:
+        # Pool threads and processes outlive the call
+        connections.close_all()
+
+
+class LocalTaskExecutor:
+    """
+    Bounded pool running the local task queue inside this process.
+
+    A poller claims due calls only while a pool slot is free, the rest
+    wait in the database. It also enqueues the periodic tasks of the beat
+    schedule, so no Celery beat is needed either. The run_local_tasks
+    command runs it in the foreground, ``start`` in a background thread.
+    """
+
+    _lock = threading.Lock()
+    _pid = None
+    _wakeup = threading.Event()
+
+    @classmethod
+    def start(cls) -> None:
+        """Start the poller of this process unless it is running."""
+        with cls._lock:
+            # A forked process does not inherit the poller thread
+            if cls._pid == os.getpid():
+                return
+            cls._pid = os.getpid()
+            cls._wakeup = threading.Event()
+            threading.Thread(
+                target=cls._poll, name="local-task-poller", daemon=True
+            ).start()
+
+    @classmethod
+    def run(cls) -> None:
+        """Run the poller in the calling thread, it never returns."""
+        with cls._lock:
+            cls._pid = os.getpid()
+            cls._wakeup = threading.Event()
+        cls._poll()
+
+    @classmethod
+    def wake(cls) -> None:
+        """Make the poller look for due calls now."""
+        cls._wakeup.set()
+
+    @staticmethod
+    def _pool():
+        workers = settings.TASK_LOCAL_WORKERS
+        if settings.TASK_LOCAL_POOL == "process":
+            return ProcessPoolExecutor(
+                workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            )
+        return ThreadPoolExecutor(workers, thread_name_prefix="local-task")
+
+    @classmethod
+    def _poll(cls):
+        pool = cls._pool()
+        running = set()
+        last_runs = {}
+        next_purge = 0
+        while True:
+            cls._wakeup.clear()
+            try:
+                LocalTaskService.enqueue_periodic(last_runs)
+                if time.monotonic() >= next_purge:
+                    LocalTaskService.purge()
+                    next_purge = time.monotonic() + PURGE_INTERVAL
+                running = {future for future in running if not future.done()}
+                free = settings.TASK_LOCAL_WORKERS - len(running)
+                for pk in LocalTaskService.claim(free) if free > 0 else []:
+                    future = pool.submit(_run_in_pool, pk)
+                    future.add_done_callback(lambda future: cls.wake())
+                    running.add(future)
+            except Exception:
+                logger.exception("Could not poll the local task queue")
+            finally:
+                connections.close_all()
+            cls._wakeup.wait(settings.TASK_LOCAL_POLL_INTERVAL)
@@ -0,0 +1,349 @@
+import hashlib
+from datetime import timedelta
+from itertools import groupby, islice
+from operator import itemgetter
+
+from celery.utils.time import get_exponential_backoff_interval
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, Min, OuterRef, Q
+from django.utils import timezone
+
+from courses.models import ChangeEvent, NotificationOutbox, Subscription
+
+DIGEST_PERIODS = {
+    Subscription.MODE_HOURLY: "последний час",
+    Subscription.MODE_DAILY: "последние сутки",
+}
+
+
+class NotificationService:
+    """
+    Service for the notification outbox.
+
+    Every change is stored as one outbox item per batch of subscribers
+    before anything is sent. Items are claimed before delivery and only
+    undelivered recipients stay on an item, so duplicate enqueues, beat
+    runs and retries never send a message twice. Subscribers in a digest
+    mode get their changes collected into one outbox item per window.
+    """
+
+    @staticmethod
+    def make_change_key(*parts) -> str:
+        """Build the outbox key of a change from the values identifying it."""
+        value = ":".join(str(part) for part in parts)
+        return hashlib.sha256(value.encode()).hexdigest()
+
+    @staticmethod
+    def iter_subscriber_emails(course_id):
+        """
+        Stream emails of active course subscribers notified immediately.
+
+        Args:
+            course_id: ID of the course
+        """
+        return (
+            Subscription.objects.filter(
+                course_id=course_id,
+                is_active=True,
+                notification_mode=Subscription.MODE_IMMEDIATE,
+            )
+            .order_by("id")
+            .values_list("user__email", flat=True)
+            .iterator(chunk_size=settings.NOTIFICATION_CHUNK_SIZE)
+        )
+
+    @staticmethod
+    def record_change(course_id, change_key, summary, lesson_id=None) -> None:
+        """
+        Record a change for digests, recording it again is a no-op.
+
+        Args:
+            course_id: ID of the changed course
+            change_key: Key from ``make_change_key``
+            summary: One line describing the change
+            lesson_id: ID of the changed lesson, if any
+        """
+        ChangeEvent.objects.bulk_create(
+            [
+                ChangeEvent(
+                    course_id=course_id,
+                    lesson_id=lesson_id,
+                    change_key=change_key,
+                    summary=summary[:255],
+                )
+            ],
+            ignore_conflicts=True,
+        )
+
+    @staticmethod
+    def enqueue(course_id, change_key, subject, message, lesson_id=None):
+        """
+        Store a change as one outbox item per batch of subscribers.
+
+        Nothing is stored when the change is already in the outbox.
+
+        Args:
+            course_id: ID of the course whose subscribers are notified
+            change_key: Key from ``make_change_key``
+            subject: Email subject
+            message: Email body
+            lesson_id: ID of the changed lesson, if any
+
+        Returns:
+            IDs of the pending items of the change
+        """
+        outbox = NotificationOutbox.objects.filter(change_key=change_key)
+        if not outbox.exists():
+            emails = NotificationService.iter_subscriber_emails(course_id)
+            size = settings.NOTIFICATION_CHUNK_SIZE
+            items = []
+            while chunk := list(islice(emails, size)):
+                items.append(
+                    NotificationOutbox(
+                        course_id=course_id,
+                        lesson_id=lesson_id,
+                        change_key=change_key,
+                        batch=len(items),
+                        subject=subject,
+                        message=message,
+                        recipients=chunk,
+                    )
+                )
+            # A concurrent enqueue of the same change wins the conflicts
+            NotificationOutbox.objects.bulk_create(items, ignore_conflicts=True)
+        return list(
+            outbox.filter(status=NotificationOutbox.STATUS_PENDING).values_list(
+                "pk", flat=True
+            )
+        )
+
+    @staticmethod
+    def _digest_message(mode, courses):
+        sections = "\n\n".join(
+            f'Курс "{title}":\n' + "\n".join(f"- {line}" for line in summaries)
+            for title, summaries in courses
+        )
+        return (
+            f"Уважаемый подписчик!\n\n"
+            f"Изменения в ваших курсах за {DIGEST_PERIODS[mode]}:\n\n"
+            f"{sections}\n\n"
+            f"С уважением,\n"
+            f"Команда LMS"
+        )
+
+    @staticmethod
+    def enqueue_digests(mode):
+        """
+        Store one digest per subscriber with changes since their last one.
+
+        A subscriber gets a single message covering all their courses in
+        the given mode, repeated changes of the same course or lesson are
+        listed once, by their latest summary. Digests and the moved
+        ``digest_sent_at`` marks are committed together, in chunks of
+        NOTIFICATION_CHUNK_SIZE subscribers.
+
+        Args:
+            mode: Subscription.MODE_HOURLY or Subscription.MODE_DAILY
+
+        Returns:
+            IDs of the pending digest items
+        """
+        now = timezone.now()
+        subscriptions = Subscription.objects.filter(
+            Exists(
+                ChangeEvent.objects.filter(
+                    course=OuterRef("course_id"),
+                    created_at__gt=OuterRef("digest_sent_at"),
+                    created_at__lte=now,
+                )
+            ),
+            is_active=True,
+            notification_mode=mode,
+        )
+        oldest = subscriptions.aggregate(oldest=Min("digest_sent_at"))["oldest"]
+        if oldest is None:
+            return []
+
+        events = {}
+        for course_id, lesson_id, created_at, summary in (
+            ChangeEvent.objects.filter(
+                course__in=subscriptions.values("course_id"),
+                created_at__gt=oldest,
+                created_at__lte=now,
+            )
+            .order_by("created_at", "id")
+            .values_list("course_id", "lesson_id", "created_at", "summary")
+        ):
+            events.setdefault(course_id, []).append((lesson_id, created_at, summary))
+
+        rows = subscriptions.order_by("user_id", "course__title", "id").values_list(
+            "id",
+            "user_id",
+            "user__email",
+            "course_id",
+            "course__title",
+            "digest_sent_at",
+        )
+        digests = []
+        for user_id, user_rows in groupby(rows, key=itemgetter(1)):
+            subscription_ids = []
+            courses = []
+            for pk, _, email, course_id, title, sent_at in user_rows:
+                subscription_ids.append(pk)
+                # Keyed by lesson, None stands for the course itself
+                summaries = {}
+                for lesson_id, created_at, summary in events.get(course_id, ()):
+                    if created_at > sent_at:
+                        summaries[lesson_id] = summary
+                if summaries:
+                    courses.append((title, list(summaries.values())))
+            digests.append(
+                (
+                    subscription_ids,
+                    NotificationOutbox(
+                        change_key=NotificationService.make_change_key(
+                            "digest", mode, user_id, now.isoformat()
+                        ),
+                        batch=0,
+                        subject="Сводка обновлений ваших курсов",
+                        message=NotificationService._digest_message(mode, courses),
+                        recipients=[email],
+                    ),
+                )
+            )
+
+        keys = []
+        digests = iter(digests)
+        while chunk := list(islice(digests, settings.NOTIFICATION_CHUNK_SIZE)):
+            with transaction.atomic():
+                NotificationOutbox.objects.bulk_create(
+                    [item for _, item in chunk], ignore_conflicts=True
+                )
+                Subscription.objects.filter(
+                    pk__in=[pk for ids, _ in chunk for pk in ids]
+                ).update(digest_sent_at=now)
+            keys.extend(item.change_key for _, item in chunk)
+        return list(
+            NotificationOutbox.objects.filter(
+                change_key__in=keys, status=NotificationOutbox.STATUS_PENDING
+            ).values_list("pk", flat=True)
+        )
+
+    @staticmethod
+    def _undelivered():
+        stale = timezone.now() - timedelta(seconds=settings.NOTIFICATION_CLAIM_TIMEOUT)
+        return Q(status=NotificationOutbox.STATUS_PENDING) | Q(
+            status=NotificationOutbox.STATUS_SENDING, claimed_at__lt=stale
+        )
+
+    @staticmethod
+    def undelivered_ids() -> list:
+        """IDs of items whose worker went away or whose retry is due."""
+        return list(
+            NotificationOutbox.objects.filter(NotificationService._undelivered())
+            .exclude(retry_at__gt=timezone.now())
+            .values_list("pk", flat=True)
+        )
+
+    @staticmethod
+    def claim(outbox_id):
+        """
+        Take an undelivered item for delivery.
+
+        Args:
+            outbox_id: ID of the outbox item
+
+        Returns:
+            The claimed item, None if it is delivered or being delivered
+        """
+        claimed = (
+            NotificationOutbox.objects.filter(pk=outbox_id)
+            .filter(NotificationService._undelivered())
+            .update(
+                status=NotificationOutbox.STATUS_SENDING,
+                claimed_at=timezone.now(),
+                attempts=F("attempts") + 1,
+            )
+        )
+        if not claimed:
+            return None
+        return NotificationOutbox.objects.get(pk=outbox_id)
+
+    @staticmethod
+    def _claimed(item):
+        return NotificationOutbox.objects.filter(
+            pk=item.pk,
+            status=NotificationOutbox.STATUS_SENDING,
+            claimed_at=item.claimed_at,
+        )
+
+    @staticmethod
+    def checkpoint(item, position, failed) -> bool:
+        """
+        Save the progress of a delivery and renew its claim.
+
+        Args:
+            item: Claimed outbox item
+            position: Number of recipients handled so far
+            failed: Recipients the delivery failed for so far
+
+        Returns:
+            False if the item was claimed by another worker meanwhile
+        """
+        now = timezone.now()
+        saved = NotificationService._claimed(item).update(
+            checkpoint=position, failed_recipients=list(failed), claimed_at=now
+        )
+        if saved:
+            item.checkpoint = position
+            item.failed_recipients = list(failed)
+            item.claimed_at = now
+        return bool(saved)
+
+    @staticmethod
+    def complete(item, position, failed) -> bool:
+        """
+        Record the outcome of a delivery.
+
+        Failed and not yet handled recipients stay on the item, it is
+        retried with exponential backoff and jitter until
+        NOTIFICATION_MAX_ATTEMPTS and then marked as failed.
+
+        Args:
+            item: Claimed outbox item
+            position: Number of recipients handled
+            failed: Recipients the delivery failed for
+
+        Returns:
+            False if the item was claimed by another worker meanwhile
+        """
+        recipients = list(failed) + item.recipients[position:]
+        values = {
+            "checkpoint": 0,
+            "failed_recipients": [],
+            "claimed_at": None,
+            "retry_at": None,
+        }
+        if not recipients:
+            values["status"] = NotificationOutbox.STATUS_SENT
+            values["sent_at"] = timezone.now()
+        else:
+            values["recipients"] = recipients
+            if item.attempts >= settings.NOTIFICATION_MAX_ATTEMPTS:
+                values["status"] = NotificationOutbox.STATUS_FAILED
+            else:
+                values["status"] = NotificationOutbox.STATUS_PENDING
+                values["retry_at"] = timezone.now() + timedelta(
+                    seconds=get_exponential_backoff_interval(
+                        factor=settings.NOTIFICATION_RETRY_BACKOFF,
+                        retries=item.attempts - 1,
+                        maximum=settings.NOTIFICATION_RETRY_BACKOFF_MAX,
+                        full_jitter=True,
+                    )
+                )
+        if not NotificationService._claimed(item).update(**values):
+            return False
+        for name, value in values.items():
+            setattr(item, name, value)
+        return True
@@ -0,0 +1,243 @@
+import re
+
+from django.db import connection as default_connection
+from django.db.models import BooleanField, CharField, F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, Substr
+
+# Tables indexed for full-text search, both have title and description
+SEARCH_TABLES = ("courses_course", "courses_lesson")
+
+# Text search configuration of the PostgreSQL tsvector columns
+POSTGRES_CONFIG = "russian"
+
+MAX_TERMS = 10
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_STOP = "</mark>"
+# Characters of the description used as snippet without an index
+SNIPPET_LENGTH = 200
+
+_SQLITE_INSTALL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5("
+    "title, description, content='{table}', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table} BEGIN "
+    "INSERT INTO {table}_fts(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table} BEGIN "
+    "INSERT INTO {table}_fts({table}_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS {table}_fts_au "
+    "AFTER UPDATE OF title, description ON {table} BEGIN "
+    "INSERT INTO {table}_fts({table}_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO {table}_fts(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+)
+_SQLITE_UNINSTALL = (
+    "DROP TRIGGER IF EXISTS {table}_fts_ai",
+    "DROP TRIGGER IF EXISTS {table}_fts_ad",
+    "DROP TRIGGER IF EXISTS {table}_fts_au",
+    "DROP TABLE IF EXISTS {table}_fts",
+)
+_SQLITE_REBUILD = ("INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')",)
+
+_POSTGRES_INSTALL = (
+    "ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('{config}'::regconfig, coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('{config}'::regconfig, coalesce(description, '')), 'B')"
+    ") STORED",
+    "CREATE INDEX IF NOT EXISTS {table}_search_vector_idx "
+    "ON {table} USING GIN (search_vector)",
+)
+_POSTGRES_UNINSTALL = (
+    "DROP INDEX IF EXISTS {table}_search_vector_idx",
+    "ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector",
+)
+_POSTGRES_REBUILD = ("REINDEX INDEX {table}_search_vector_idx",)
+
+
+class SearchService:
+    """
+    Service for full-text search over courses and lessons.
+
+    The index lives in the database: an external-content FTS5 table kept
+    in sync by triggers on SQLite, a generated tsvector column with a GIN
+    index on PostgreSQL. Every write path (save, bulk_create, queryset
+    update) therefore keeps it current without application code.
+    """
+
+    @staticmethod
+    def _run(statements, connection=None):
+        connection = connection or default_connection
+        if connection.vendor == "sqlite":
+            statements = statements["sqlite"]
+        elif connection.vendor == "postgresql":
+            statements = statements["postgresql"]
+        else:
+            return
+        with connection.cursor() as cursor:
+            for table in SEARCH_TABLES:
+                for statement in statements:
+                    cursor.execute(
+                        statement.format(table=table, config=POSTGRES_CONFIG)
+                    )
+
+    @staticmethod
+    def install(connection=None):
+        """
+        Create the search index and its triggers if they are missing.
+
+        Args:
+            connection: Database connection, the default one if omitted
+        """
+        SearchService._run(
+            {"sqlite": _SQLITE_INSTALL, "postgresql": _POSTGRES_INSTALL},
+            connection,
+        )
+
+    @staticmethod
+    def uninstall(connection=None):
+        """Drop the search index and its triggers."""
+        SearchService._run(
+            {"sqlite": _SQLITE_UNINSTALL, "postgresql": _POSTGRES_UNINSTALL},
+            connection,
+        )
+
+    @staticmethod
+    def rebuild(connection=None):
+        """Recreate missing triggers and reindex all existing rows."""
+        SearchService.install(connection)
+        SearchService._run(
+            {"sqlite": _SQLITE_REBUILD, "postgresql": _POSTGRES_REBUILD},
+            connection,
+        )
+
+    @staticmethod
+    def is_installed(connection=None):
+        """Tell whether the index exists on the given connection."""
+        connection = connection or default_connection
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                tables = connection.introspection.table_names(cursor)
+                return all(f"{table}_fts" in tables for table in SEARCH_TABLES)
+            if connection.vendor == "postgresql":
+                introspection = connection.introspection
+                return all(
+                    "search_vector"
+                    in {
+                        column.name
+                        for column in introspection.get_table_description(
+                            cursor, table
+                        )
+                    }
+                    for table in SEARCH_TABLES
+                )
+        return False
+
+    @staticmethod
+    def get_terms(query: str) -> list:
+        """Split a user query into at most MAX_TERMS word terms."""
+        return re.findall(r"\w+", query or "")[:MAX_TERMS]
+
+    @staticmethod
+    def search(queryset, query: str):
+        """
+        Filter a Course or Lesson queryset by a full-text query.
+
+        Every term is prefix-matched and all terms must match. Results get
+        ``search_rank`` (higher is better), ``search_title`` and
+        ``search_snippet`` with matches wrapped in <mark> tags, and are
+        ordered by rank. Databases without an index fall back to unranked
+        ``icontains`` matching without highlights.
+
+        Args:
+            queryset: Queryset of an indexed model
+            query: Raw user query
+
+        Returns:
+            Filtered, annotated and ordered queryset
+        """
+        terms = SearchService.get_terms(query)
+        if not terms:
+            return queryset.none()
+
+        table = queryset.model._meta.db_table
+        vendor = default_connection.vendor
+        if vendor == "sqlite":
+            match = " ".join(f'"{term}"*' for term in terms)
+            fts = f"{table}_fts"
+
+            def aux(function):
+                return (
+                    f"(SELECT {function} FROM {fts} WHERE {fts} MATCH %s "
+                    f'AND {fts}.rowid = "{table}"."id")'
+                )
+
+            queryset = queryset.filter(
+                pk__in=RawSQL(
+                    f"SELECT rowid FROM {fts} WHERE {fts} MATCH %s", [match]
+                )
+            ).annotate(
+                search_rank=RawSQL(
+                    aux(f"-bm25({fts}, 10.0, 1.0)"),
+                    [match],
+                    output_field=FloatField(),
+                ),
+                search_title=RawSQL(
+                    aux(f"highlight({fts}, 0, %s, %s)"),
+                    [HIGHLIGHT_START, HIGHLIGHT_STOP, match],
+                    output_field=CharField(),
+                ),
+                search_snippet=RawSQL(
+                    aux(f"snippet({fts}, 1, %s, %s, '…', 24)"),
+                    [HIGHLIGHT_START, HIGHLIGHT_STOP, match],
+                    output_field=CharField(),
+                ),
+            )
+        elif vendor == "postgresql":
+            tsquery = f"to_tsquery('{POSTGRES_CONFIG}'::regconfig, %s)"
+            match = " & ".join(f"{term}:*" for term in terms)
+            options = f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}"
+            headline = (
+                f"ts_headline('{POSTGRES_CONFIG}'::regconfig, {{}}, {tsquery}, %s)"
+            )
+            queryset = queryset.annotate(
+                search_match=RawSQL(
+                    f'"{table}"."search_vector" @@ {tsquery}',
+                    [match],
+                    output_field=BooleanField(),
+                ),
+                search_rank=RawSQL(
+                    f'ts_rank("{table}"."search_vector", {tsquery})',
+                    [match],
+                    output_field=FloatField(),
+                ),
+                search_title=RawSQL(
+                    headline.format(f'"{table}"."title"'),
+                    [match, f"{options}, HighlightAll=true"],
+                    output_field=CharField(),
+                ),
+                search_snippet=RawSQL(
+                    headline.format(f'coalesce("{table}"."description", \'\')'),
+                    [match, f"{options}, MaxWords=35, MinWords=15"],
+                    output_field=CharField(),
+                ),
+            ).filter(search_match=True)
+        else:
+            # No index on this database, every term has to appear somewhere
+            match = Q()
+            for term in terms:
+                match &= Q(title__icontains=term) | Q(description__icontains=term)
+            queryset = queryset.filter(match).annotate(
+                search_rank=Value(0.0, output_field=FloatField()),
+                search_title=F("title"),
+                search_snippet=Coalesce(
+                    Substr("description", 1, SNIPPET_LENGTH),
+                    Value(""),
+                    output_field=CharField(),
+                ),
+            )
+
+        return queryset.order_by("-search_rank", "pk")
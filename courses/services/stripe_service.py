@@ -1,20 +1,33 @@
+import logging
+
 import stripe
 from django.conf import settings
 
+from courses.models import CourseStripePrice
+
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
+logger = logging.getLogger(__name__)
+
 
 class StripeService:
     """Service for working with Stripe API."""
 
     @staticmethod
-    def create_product(name: str, description: str = None) -> str:
+    def _request_options(idempotency_key):
+        return {"idempotency_key": idempotency_key} if idempotency_key else {}
+
+    @staticmethod
+    def create_product(
+        name: str, description: str = None, idempotency_key: str = None
+    ) -> str:
         """
         Create product in Stripe.
 
         Args:
             name: Product name
             description: Product description
+            idempotency_key: Key making repeated requests return one product
 
         Returns:
             Stripe product ID
@@ -23,13 +36,19 @@ class StripeService:
             product = stripe.Product.create(
                 name=name,
                 description=description,
+                **StripeService._request_options(idempotency_key),
             )
             return product.id
         except stripe.error.StripeError as e:
             raise Exception(f"Stripe product creation error: {str(e)}")
 
     @staticmethod
-    def create_price(product_id: str, amount: float, currency: str = "usd") -> str:
+    def create_price(
+        product_id: str,
+        amount: float,
+        currency: str = "usd",
+        idempotency_key: str = None,
+    ) -> str:
         """
         Create price for product in Stripe.
 
@@ -37,23 +56,99 @@ class StripeService:
             product_id: Stripe product ID
             amount: Price amount
             currency: Currency code
+            idempotency_key: Key making repeated requests return one price
 
         Returns:
             Stripe price ID
         """
         try:
             # Convert amount to cents
-            amount_in_cents = int(amount * 100)
+            amount_in_cents = round(amount * 100)
 
             price = stripe.Price.create(
                 product=product_id,
                 unit_amount=amount_in_cents,
                 currency=currency,
+                **StripeService._request_options(idempotency_key),
             )
             return price.id
         except stripe.error.StripeError as e:
             raise Exception(f"Stripe price creation error: {str(e)}")
 
+    @staticmethod
+    def archive_price(price_id: str) -> None:
+        """
+        Archive price in Stripe, it can no longer be used for new checkouts.
+
+        Args:
+            price_id: Stripe price ID
+        """
+        try:
+            stripe.Price.modify(price_id, active=False)
+        except stripe.error.StripeError as e:
+            raise Exception(f"Stripe price archiving error: {str(e)}")
+
+    @staticmethod
+    def get_course_price(course, currency: str = None) -> tuple:
+        """
+        Get Stripe product and price of a course, creating them if needed.
+
+        The mapping is stored per course: the product is created once, a
+        new price only when the course price or the currency changed, and
+        the replaced price is archived. Stripe is called without holding
+        database locks. Idempotency keys make concurrent checkouts get the
+        same objects, and compare-and-set updates let only one of them
+        store and archive.
+
+        Args:
+            course: Course to sell
+            currency: Currency code, STRIPE_CURRENCY if omitted
+
+        Returns:
+            Tuple of Stripe product ID and price ID
+        """
+        currency = (currency or settings.STRIPE_CURRENCY).lower()
+        amount = course.price
+        mapping, _ = CourseStripePrice.objects.get_or_create(course=course)
+        if (
+            mapping.price_id
+            and mapping.amount == amount
+            and mapping.currency == currency
+        ):
+            return mapping.product_id, mapping.price_id
+
+        # Keys are scoped to this course row, IDs may repeat after a reset
+        key = f"course-{course.pk}-{course.created_at.timestamp()}"
+        mappings = CourseStripePrice.objects.filter(pk=mapping.pk)
+        if not mapping.product_id:
+            product_id = StripeService.create_product(
+                name=course.title,
+                description=course.description or "",
+                idempotency_key=f"{key}-product",
+            )
+            # Stored right away, a failing price must not orphan it
+            mappings.filter(product_id="").update(product_id=product_id)
+            mapping.refresh_from_db()
+
+        old_price_id = mapping.price_id
+        price_id = StripeService.create_price(
+            product_id=mapping.product_id,
+            amount=float(amount),
+            currency=currency,
+            idempotency_key=f"{key}-price-{old_price_id}-{amount}-{currency}",
+        )
+        stored = mappings.filter(price_id=old_price_id).update(
+            price_id=price_id, amount=amount, currency=currency
+        )
+        if stored and old_price_id:
+            try:
+                StripeService.archive_price(old_price_id)
+            except Exception:
+                logger.warning(
+                    "Could not archive Stripe price %s", old_price_id, exc_info=True
+                )
+        return mapping.product_id, price_id
+
     @staticmethod
     def create_checkout_session(
         price_id: str,
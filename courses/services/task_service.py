@@ -0,0 +1,183 @@
+import json
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+
+from celery import Task, current_app
+from celery.backends.base import DisabledBackend
+from celery.result import AsyncResult
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+BACKEND_CELERY = "celery"
+BACKEND_LOCAL = "local"
+
+
+class BackendTask(Task):
+    """
+    Celery task sent to the backend selected by TASK_BACKEND.
+
+    'celery' publishes calls to the broker. 'local' stores them in the
+    database for ``LocalTaskExecutor``, so ``delay``, ``apply_async`` and
+    retries work without a broker or a worker.
+    """
+
+    def apply_async(self, args=None, kwargs=None, task_id=None, **options):
+        if settings.TASK_BACKEND != BACKEND_LOCAL or self.app.conf.task_always_eager:
+            return super().apply_async(args, kwargs, task_id=task_id, **options)
+
+        from .local_task_service import LocalTaskService
+
+        task_id = LocalTaskService.enqueue(
+            self.name,
+            args,
+            kwargs,
+            task_id=task_id,
+            eta=options.get("eta"),
+            countdown=options.get("countdown"),
+            retries=options.get("retries", 0),
+        )
+        # The result backend may be a broker-side store that is not running
+        return AsyncResult(task_id, backend=DisabledBackend(self.app), app=self.app)
+
+
+class TaskService:
+    """
+    Service for dispatching Celery tasks once the transaction commits.
+
+    A dispatched task is enqueued by ``transaction.on_commit``, so workers
+    never see rows that are not committed yet. Tasks whose transaction
+    commits while a ``batch()`` is open are collected, duplicate (task,
+    arguments) pairs are enqueued once, and all of them are published
+    over one producer when the outermost batch ends.
+    """
+
+    @staticmethod
+    def _batches() -> list:
+        if not hasattr(_local, "batches"):
+            _local.batches = []
+        return _local.batches
+
+    @staticmethod
+    @contextmanager
+    def batch():
+        """Collect committed dispatches and publish them together on exit."""
+        batches = TaskService._batches()
+        batches.append({})
+        try:
+            yield
+        finally:
+            calls = batches.pop()
+            if batches:
+                for key, call in calls.items():
+                    batches[-1].setdefault(key, call)
+            else:
+                TaskService.publish(calls.values())
+
+    @staticmethod
+    def dispatch(task, *args, **kwargs) -> None:
+        """
+        Enqueue ``task.delay(*args, **kwargs)`` once the transaction commits.
+
+        Args:
+            task: Celery task
+            *args: Positional task arguments
+            **kwargs: Keyword task arguments
+        """
+
+        def enqueue():
+            batches = TaskService._batches()
+            if not batches:
+                TaskService.publish([(task, args, kwargs)])
+                return
+            key = json.dumps([task.name, args, kwargs], sort_keys=True, default=str)
+            batches[-1].setdefault(key, (task, args, kwargs))
+
+        transaction.on_commit(enqueue)
+
+    @staticmethod
+    def _producer():
+        if settings.TASK_BACKEND == BACKEND_LOCAL:
+            # Calls go to the database, there is no broker to connect to
+            return nullcontext()
+        return current_app.producer_or_acquire()
+
+    @staticmethod
+    def publish(calls) -> None:
+        """
+        Publish task calls back to back over one broker producer.
+
+        Publishing runs after the transaction committed, so a call that
+        cannot be published is logged and kept in the database for
+        ``redeliver`` instead of failing a request whose writes are
+        already saved.
+
+        Args:
+            calls: Iterable of (task, args, kwargs)
+        """
+        calls = list(calls)
+        if not calls:
+            return
+        failed = []
+        with TaskService._producer() as producer:
+            for task, args, kwargs in calls:
+                try:
+                    task.apply_async(args, kwargs, producer=producer)
+                except Exception:
+                    logger.exception("Could not publish %s%r", task.name, args)
+                    failed.append((task, args, kwargs))
+        for task, args, kwargs in failed:
+            TaskService._keep(task, args, kwargs)
+
+    @staticmethod
+    def _keep(task, args, kwargs) -> None:
+        from .local_task_service import LocalTaskService
+
+        try:
+            LocalTaskService.enqueue(task.name, args, kwargs)
+        except Exception:
+            logger.exception("Could not keep %s%r for redelivery", task.name, args)
+
+    @staticmethod
+    def redeliver(limit=100) -> int:
+        """
+        Publish calls kept after their publish failed.
+
+        Kept calls are rows of the local task queue. With TASK_BACKEND
+        'local' its pool runs them, so nothing is published here.
+
+        Args:
+            limit: Maximum number of calls
+
+        Returns:
+            Number of published calls
+        """
+        if settings.TASK_BACKEND == BACKEND_LOCAL:
+            return 0
+
+        from courses.models import QueuedTask
+
+        from .local_task_service import LocalTaskService
+
+        claimed = QueuedTask.objects.filter(pk__in=LocalTaskService.claim(limit))
+        published = []
+        with TaskService._producer() as producer:
+            for item in claimed.order_by("eta", "id"):
+                try:
+                    current_app.tasks[item.name].apply_async(
+                        item.args, item.kwargs, task_id=item.task_id, producer=producer
+                    )
+                except Exception:
+                    logger.exception("Could not redeliver %s%r", item.name, item.args)
+                    break
+                published.append(item.pk)
+        claimed.filter(pk__in=published).delete()
+        # The broker is still down, the rest waits for the next run
+        claimed.exclude(pk__in=published).update(
+            status=QueuedTask.STATUS_PENDING, locked_at=None
+        )
+        return len(published)
@@ -0,0 +1,50 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Course, Lesson, Payment, Subscription
+
+COUNTED_MODELS = (Lesson, Subscription, Payment)
+
+
+def _counted_receiver(signal):
+    def decorator(handler):
+        for model in COUNTED_MODELS:
+            handler = receiver(signal, sender=model)(handler)
+        return handler
+
+    return decorator
+
+
+@_counted_receiver(pre_save)
+def remember_stored_counters(sender, instance, raw=False, **kwargs):
+    """Capture the contribution of the row a save is about to change."""
+    if raw:
+        return
+    instance._stored = None if instance._state.adding else instance.stored_counters()
+
+
+@_counted_receiver(post_save)
+def count_saved(sender, instance, raw=False, **kwargs):
+    """Shift course counters by the difference a save made."""
+    if raw:
+        return
+    sender._apply_counter_changes(
+        (
+            getattr(instance, "_stored", None),
+            (instance.course_id, instance.get_counter_deltas()),
+        )
+    )
+    instance._remember_counters()
+
+
+@_counted_receiver(post_delete)
+def count_deleted(sender, instance, origin=None, **kwargs):
+    """Take a deleted row, also of a cascade or queryset delete, off its course."""
+    if isinstance(origin, Course) and origin.pk == instance.course_id:
+        # The course itself goes away with this delete
+        return
+    counted = getattr(instance, "_counted", None)
+    if counted is None:
+        counted = (instance.course_id, instance.get_counter_deltas())
+    sender._apply_counter_changes((counted, None))
+    instance._counted = None
@@ -1,63 +1,230 @@
+import logging
+import time
+
 from celery import shared_task
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection
 from django.conf import settings
+from django.db import DatabaseError
 from django.utils import timezone
 from datetime import timedelta
-from .models import Course, Subscription, Lesson
+from .models import Course, Lesson, NotificationOutbox, Subscription
+from .services.cache_service import CacheService
+from .services.notification_service import NotificationService
+from .services.task_service import TaskService
 
+logger = logging.getLogger(__name__)
 
-@shared_task
-def send_course_update_notification(course_id):
+# Notification tasks are idempotent through the outbox, so transient
+# database errors are retried with exponential backoff and jitter
+RETRY_OPTIONS = {
+    'autoretry_for': (DatabaseError,),
+    'max_retries': settings.NOTIFICATION_MAX_ATTEMPTS,
+    'retry_backoff': settings.NOTIFICATION_RETRY_BACKOFF,
+    'retry_backoff_max': settings.NOTIFICATION_RETRY_BACKOFF_MAX,
+    'retry_jitter': True,
+}
+
+
+def fan_out_notification(course_id, change_key, subject, message, lesson_id=None):
     """
-    Send email notification to all subscribers about course update.
+    Store a change in the outbox and queue delivery of its pending batches.
 
     Args:
-        course_id: ID of the updated course
+        course_id: ID of the course whose subscribers are notified
+        change_key: Key identifying the change
+        subject: Email subject
+        message: Email body
+        lesson_id: ID of the changed lesson, if any
+
+    Returns:
+        Number of batches queued for delivery
+    """
+    # Duplicate tasks of one change running at once stream the
+    # subscribers once, the others reuse the pending batches
+    pending, _ = CacheService.single_flight(
+        f'notifications:enqueue:{change_key}',
+        1,
+        lambda: NotificationService.enqueue(
+            course_id, change_key, subject, message, lesson_id=lesson_id
+        ),
+        timeout=settings.RESPONSE_CACHE_LOCK_LEASE,
+        stale_timeout=0,
+    )
+    with TaskService.batch():
+        for outbox_id in pending:
+            TaskService.dispatch(deliver_notification, outbox_id)
+    return len(pending)
+
+
+def send_individually(subject, message, emails, on_progress=None):
     """
+    Send a notification to every recipient in its own message.
+
+    All messages share one mail connection, a failed recipient does not
+    stop the others, and sends are spread out to stay under
+    NOTIFICATION_SEND_RATE messages per second. Sending stops early when
+    the mail server cannot be reached or ``on_progress`` returns False,
+    the rest is left for a retry.
+
+    Args:
+        subject: Email subject
+        message: Email body
+        emails: Recipient addresses
+        on_progress: Called with (handled count, failed addresses) every
+            NOTIFICATION_CHECKPOINT_INTERVAL recipients
+
+    Returns:
+        Tuple of (number of handled recipients, failed addresses)
+    """
+    started = time.monotonic()
+    interval = settings.NOTIFICATION_CHECKPOINT_INTERVAL
+    send_rate = settings.NOTIFICATION_SEND_RATE
+    handled = 0
+    failed = []
+    connection = get_connection(fail_silently=False)
     try:
-        course = Course.objects.get(id=course_id)
-        subscribers = Subscription.objects.filter(
-            course=course,
-            is_active=True
-        ).select_related('user')
-
-        if not subscribers:
-            return f'No active subscribers for course: {course.title}'
-
-        subject = f'Обновление курса: {course.title}'
-        message = (
-            f'Уважаемый подписчик!\n\n'
-            f'Курс "{course.title}" был обновлен.\n'
-            f'Последнее обновление: {course.last_updated}\n\n'
-            f'Описание курса: {course.description[:200]}...\n\n'
-            f'Перейдите по ссылке для просмотра: '
-            f'{settings.SITE_URL}/courses/{course.id}/\n\n'
-            f'С уважением,\n'
-            f'Команда LMS'
-        )
+        for email in emails:
+            if send_rate:
+                delay = started + handled / send_rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            try:
+                # No-op while the connection is open
+                connection.open()
+            except Exception:
+                logger.exception('Could not connect to the mail server')
+                break
+            try:
+                connection.send_messages([
+                    EmailMessage(
+                        subject=subject,
+                        body=message,
+                        from_email=settings.DEFAULT_FROM_EMAIL,
+                        to=[email],
+                        connection=connection,
+                    )
+                ])
+            except Exception:
+                logger.exception('Could not send notification to %s', email)
+                failed.append(email)
+                # The failure may have broken the connection
+                connection.close()
+            handled += 1
+            if on_progress and handled % interval == 0:
+                if not on_progress(handled, failed):
+                    logger.warning('Delivery was taken over, stopping')
+                    break
+    finally:
+        connection.close()
 
-        emails = [subscriber.user.email for subscriber in subscribers]
+    sent = handled - len(failed)
+    elapsed = time.monotonic() - started
+    rate = sent / elapsed if elapsed else sent
+    report = (
+        f'Sent {sent} of {len(emails)} messages in {elapsed:.2f}s '
+        f'({rate:.0f}/s), {len(failed)} failed'
+    )
+    if failed or handled < len(emails):
+        logger.warning('%s: %s', report, ', '.join(failed))
+    else:
+        logger.info(report)
+    return handled, failed
 
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=emails,
-            fail_silently=False,
-        )
 
-        return (
-            f'Notification sent to {len(emails)} subscribers '
-            f'for course: {course.title}'
+@shared_task(bind=True, **RETRY_OPTIONS)
+def deliver_notification(self, outbox_id):
+    """
+    Deliver one outbox item to its recipients.
+
+    The item is claimed first, so concurrent or repeated runs for the
+    same item send nothing. Progress is checkpointed while sending: a
+    delivery resumed after a crash skips the recipients already handled,
+    and failed or unreached recipients are retried with backoff.
+
+    Args:
+        outbox_id: ID of the NotificationOutbox item
+
+    Returns:
+        Dict with the item status and the sent, failed and skipped counts
+    """
+    item = NotificationService.claim(outbox_id)
+    if item is None:
+        return {
+            'outbox_id': outbox_id,
+            'status': 'claimed',
+            'sent': 0,
+            'failed': 0,
+            'skipped': 0,
+        }
+
+    position = item.checkpoint
+    failed = list(item.failed_recipients)
+
+    def checkpoint(handled, new_failed):
+        return NotificationService.checkpoint(
+            item, position + handled, failed + new_failed
         )
 
-    except Course.DoesNotExist:
-        return f'Course with id {course_id} does not exist'
-    except Exception as e:
-        return f'Error sending notifications: {str(e)}'
+    handled, new_failed = send_individually(
+        item.subject,
+        item.message,
+        item.recipients[position:],
+        on_progress=checkpoint,
+    )
+    owned = NotificationService.complete(
+        item, position + handled, failed + new_failed
+    )
+    result = {
+        'outbox_id': outbox_id,
+        'status': item.status if owned else 'claimed',
+        'sent': handled - len(new_failed),
+        'failed': len(new_failed),
+        # Handled by an interrupted earlier run
+        'skipped': position,
+    }
+    if owned and item.status == NotificationOutbox.STATUS_PENDING:
+        raise self.retry(eta=item.retry_at)
+    return result
+
 
+@shared_task(**RETRY_OPTIONS)
+def send_course_update_notification(course_id):
+    """
+    Send email notification to all subscribers about course update.
 
-@shared_task
+    Args:
+        course_id: ID of the updated course
+
+    Returns:
+        Dict with the number of queued batches, and why nothing was
+        queued if the notification was skipped
+    """
+    course = Course.objects.filter(id=course_id).first()
+    if course is None:
+        return {'course_id': course_id, 'queued': 0, 'skipped': 'missing'}
+
+    change_key = NotificationService.make_change_key(
+        'course', course.id, course.last_updated.isoformat()
+    )
+    NotificationService.record_change(course.id, change_key, 'Курс обновлен')
+
+    subject = f'Обновление курса: {course.title}'
+    message = (
+        f'Уважаемый подписчик!\n\n'
+        f'Курс "{course.title}" был обновлен.\n'
+        f'Последнее обновление: {course.last_updated}\n\n'
+        f'Описание курса: {(course.description or "")[:200]}...\n\n'
+        f'Перейдите по ссылке для просмотра: '
+        f'{settings.SITE_URL}/courses/{course.id}/\n\n'
+        f'С уважением,\n'
+        f'Команда LMS'
+    )
+
+    batches = fan_out_notification(course.id, change_key, subject, message)
+    return {'course_id': course.id, 'queued': batches}
+
+
+@shared_task(**RETRY_OPTIONS)
 def send_lesson_update_notification(lesson_id):
     """
     Send email notification about lesson update.
@@ -65,78 +232,190 @@ def send_lesson_update_notification(lesson_id):
 
     Args:
         lesson_id: ID of the updated lesson
+
+    Returns:
+        Dict with the number of queued batches, and why nothing was
+        queued if the notification was skipped
     """
-    try:
-        lesson = Lesson.objects.get(id=lesson_id)
-        course = lesson.course
-
-        # Check if course was updated in the last 4 hours
-        four_hours_ago = timezone.now() - timedelta(hours=4)
-        if course.last_updated > four_hours_ago:
-            return (
-                f'Course {course.title} was updated recently '
-                f'(less than 4 hours ago). Skipping notification.'
-            )
-
-        subscribers = Subscription.objects.filter(
-            course=course,
-            is_active=True
-        ).select_related('user')
-
-        if not subscribers:
-            return f'No active subscribers for lesson: {lesson.title}'
-
-        subject = f'Обновлен урок в курсе: {course.title}'
-        message = (
-            f'Уважаемый подписчик!\n\n'
-            f'В курсе "{course.title}" обновлен урок: {lesson.title}\n'
-            f'Последнее обновление урока: {lesson.last_updated}\n\n'
-            f'Описание урока: {lesson.description[:200]}...\n\n'
-            f'Перейдите по ссылке для просмотра: '
-            f'{settings.SITE_URL}/lessons/{lesson.id}/\n\n'
-            f'С уважением,\n'
-            f'Команда LMS'
-        )
+    lesson = Lesson.objects.select_related('course').filter(id=lesson_id).first()
+    if lesson is None:
+        return {'lesson_id': lesson_id, 'queued': 0, 'skipped': 'missing'}
 
-        emails = [subscriber.user.email for subscriber in subscribers]
+    course = lesson.course
+    change_key = NotificationService.make_change_key(
+        'lesson', lesson.id, lesson.last_updated.isoformat()
+    )
+    # Digests list the change even when the email below is skipped
+    NotificationService.record_change(
+        course.id, change_key, f'Обновлен урок: {lesson.title}', lesson.id
+    )
 
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=emails,
-            fail_silently=False,
-        )
+    # Check if course was updated in the last 4 hours
+    four_hours_ago = timezone.now() - timedelta(hours=4)
+    if course.last_updated > four_hours_ago:
+        return {'lesson_id': lesson.id, 'queued': 0, 'skipped': 'course_updated'}
 
-        return (
-            f'Lesson update notification sent to {len(emails)} subscribers '
-            f'for lesson: {lesson.title}'
+    subject = f'Обновлен урок в курсе: {course.title}'
+    message = (
+        f'Уважаемый подписчик!\n\n'
+        f'В курсе "{course.title}" обновлен урок: {lesson.title}\n'
+        f'Последнее обновление урока: {lesson.last_updated}\n\n'
+        f'Описание урока: {(lesson.description or "")[:200]}...\n\n'
+        f'Перейдите по ссылке для просмотра: '
+        f'{settings.SITE_URL}/lessons/{lesson.id}/\n\n'
+        f'С уважением,\n'
+        f'Команда LMS'
+    )
+
+    batches = fan_out_notification(
+        course.id,
+        change_key,
+        subject,
+        message,
+        lesson_id=lesson.id,
+    )
+    return {'lesson_id': lesson.id, 'queued': batches}
+
+
+@shared_task(**RETRY_OPTIONS)
+def send_lessons_update_notification(course_id, lesson_ids):
+    """
+    Send one email notification about several lessons of a course.
+    Only send if course wasn't updated in the last 4 hours.
+
+    Args:
+        course_id: ID of the course the lessons belong to
+        lesson_ids: IDs of the created or updated lessons
+
+    Returns:
+        Dict with the number of queued batches, and why nothing was
+        queued if the notification was skipped
+    """
+    course = Course.objects.filter(id=course_id).first()
+    if course is None:
+        return {'course_id': course_id, 'queued': 0, 'skipped': 'missing'}
+
+    lessons = list(
+        Lesson.objects.filter(id__in=lesson_ids, course_id=course_id)
+        .order_by('created_at', 'id')
+        .values_list('id', 'title', 'last_updated')
+    )
+    if not lessons:
+        return {'course_id': course.id, 'queued': 0, 'skipped': 'no_lessons'}
+
+    # Same keys as single lesson updates, so digests list a lesson once
+    for lesson_id, title, last_updated in lessons:
+        NotificationService.record_change(
+            course.id,
+            NotificationService.make_change_key(
+                'lesson', lesson_id, last_updated.isoformat()
+            ),
+            f'Обновлен урок: {title}',
+            lesson_id,
         )
 
-    except Lesson.DoesNotExist:
-        return f'Lesson with id {lesson_id} does not exist'
-    except Exception as e:
-        return f'Error sending notifications: {str(e)}'
+    # Check if course was updated in the last 4 hours
+    four_hours_ago = timezone.now() - timedelta(hours=4)
+    if course.last_updated > four_hours_ago:
+        return {'course_id': course.id, 'queued': 0, 'skipped': 'course_updated'}
 
+    lesson_lines = '\n'.join(
+        f'- {title}: {settings.SITE_URL}/lessons/{lesson_id}/'
+        for lesson_id, title, _ in lessons
+    )
+    subject = f'Обновлены уроки в курсе: {course.title}'
+    message = (
+        f'Уважаемый подписчик!\n\n'
+        f'В курсе "{course.title}" обновлены уроки:\n'
+        f'{lesson_lines}\n\n'
+        f'С уважением,\n'
+        f'Команда LMS'
+    )
 
-@shared_task
+    batches = fan_out_notification(
+        course.id,
+        NotificationService.make_change_key(
+            'lessons',
+            course.id,
+            *(
+                f'{lesson_id}@{last_updated.isoformat()}'
+                for lesson_id, _, last_updated in lessons
+            ),
+        ),
+        subject,
+        message,
+    )
+    return {'course_id': course.id, 'lessons': len(lessons), 'queued': batches}
+
+
+@shared_task(**RETRY_OPTIONS)
+def send_subscriber_digests(mode):
+    """
+    Send digests to subscribers who chose hourly or daily notifications.
+
+    Every subscriber with changes since their last digest gets one
+    message for all their courses. This task runs periodically via
+    celery-beat.
+
+    Args:
+        mode: Subscription.MODE_HOURLY or Subscription.MODE_DAILY
+
+    Returns:
+        Dict with the number of queued digests
+    """
+    if mode not in (Subscription.MODE_HOURLY, Subscription.MODE_DAILY):
+        return {'mode': mode, 'queued': 0, 'skipped': 'unknown_mode'}
+
+    pending = NotificationService.enqueue_digests(mode)
+    with TaskService.batch():
+        for outbox_id in pending:
+            TaskService.dispatch(deliver_notification, outbox_id)
+    return {'mode': mode, 'queued': len(pending)}
+
+
+@shared_task(**RETRY_OPTIONS)
 def send_pending_notifications():
     """
-    Send pending notifications for recently updated courses and lessons.
+    Deliver notifications that are still in the outbox.
+
+    Courses updated in the last hour are enqueued again first, changes
+    already in the outbox are skipped, so nothing is sent twice.
+    Batches waiting for a backoff delay are left to their own retry.
     This task runs periodically via celery-beat.
+
+    Returns:
+        Dict with the number of checked courses and retried batches
     """
     # Find courses updated in the last hour
     one_hour_ago = timezone.now() - timedelta(hours=1)
     recently_updated_courses = Course.objects.filter(
         last_updated__gte=one_hour_ago
-    )
+    ).values_list('id', flat=True)
+
+    courses = 0
+    undelivered = NotificationService.undelivered_ids()
+    with TaskService.batch():
+        for course_id in recently_updated_courses:
+            TaskService.dispatch(send_course_update_notification, course_id)
+            courses += 1
+        for outbox_id in undelivered:
+            TaskService.dispatch(deliver_notification, outbox_id)
+
+    return {'courses': courses, 'retried': len(undelivered)}
 
-    results = []
-    for course in recently_updated_courses:
-        result = send_course_update_notification.delay(course.id)
-        results.append(f'Course {course.title}: {result}')
 
-    return f'Sent notifications for {len(results)} courses'
+@shared_task
+def redeliver_tasks():
+    """
+    Publish task calls that could not be published after their commit.
+
+    This task runs periodically via celery-beat, calls it cannot publish
+    either wait for the next run.
+
+    Returns:
+        Dict with the number of published calls
+    """
+    return {'published': TaskService.redeliver()}
 
 
 # Add SITE_URL to settings if not exists
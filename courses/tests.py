@@ -1,10 +1,76 @@
-from django.test import TestCase
+import contextlib
+import csv
+import gzip
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+import stripe
+from celery.exceptions import Retry
+from celery.schedules import crontab
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
-from django.contrib.auth.models import Group
+from django.contrib.auth.models import AnonymousUser, Group
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from config.celery import app as celery_app, message_priority
 from users.models import User
-from .models import Course, Lesson, Subscription
+from users.permissions import (
+    CourseLessonPermission,
+    IsOwner,
+    IsOwnerOrModerator,
+    IsOwnerOrModeratorOrReadOnly,
+)
+from .models import (
+    ChangeEvent,
+    Course,
+    CourseStripePrice,
+    Lesson,
+    NotificationOutbox,
+    Payment,
+    QueuedTask,
+    Subscription,
+)
+from .permissions import CoursePermissions, LessonPermissions
+from .tasks import (
+    deliver_notification,
+    redeliver_tasks,
+    send_course_update_notification,
+    send_individually,
+    send_lesson_update_notification,
+    send_lessons_update_notification,
+    send_pending_notifications,
+    send_subscriber_digests,
+)
+from .middleware import TaskBatchMiddleware
+from .services.local_task_service import LocalTaskExecutor, LocalTaskService
+from .services.notification_service import NotificationService
+from .services.stripe_service import StripeService
+from .services.task_service import TaskService
+from .services.cache_service import (
+    CACHE_HIT,
+    CACHE_MISS,
+    CACHE_STALE,
+    LOCK_KEY,
+    CacheService,
+)
 from .validators import validate_youtube_url
 from django.core.exceptions import ValidationError
 
@@ -505,17 +571,17 @@ class PaginationTestCase(APITestCase):
         self.assertIn("previous", response.data)
         self.assertIn("results", response.data)
 
-        # По умолчанию page_size=5
-        self.assertEqual(len(response.data["results"]), 5)
+        # По умолчанию page_size=10 (PAGE_SIZE из настроек)
+        self.assertEqual(len(response.data["results"]), 10)
         self.assertEqual(response.data["count"], 15)
 
     def test_pagination_custom_page_size(self):
         """Test custom page size."""
         self.client.force_authenticate(user=self.user)
-        response = self.client.get(f"{self.courses_url}?page_size=10")
+        response = self.client.get(f"{self.courses_url}?page_size=5")
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data["results"]), 10)
+        self.assertEqual(len(response.data["results"]), 5)
         self.assertEqual(response.data["count"], 15)
 
     def test_pagination_max_page_size(self):
@@ -535,7 +601,7 @@ class PaginationTestCase(APITestCase):
         response = self.client.get(f"{self.courses_url}?page=2")
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIsNotNone(response.data["next"])
+        self.assertIsNone(response.data["next"])
         self.assertIsNotNone(response.data["previous"])
         self.assertEqual(len(response.data["results"]), 5)
 
@@ -575,3 +641,1493 @@ class LessonPaginationTestCase(APITestCase):
         # По умолчанию page_size=10 для уроков
         self.assertEqual(len(response.data["results"]), 10)
         self.assertEqual(response.data["count"], 25)
+
+
+class CourseCountersTestCase(APITestCase):
+    """Test denormalized course counters."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@test.com", password="user123")
+        self.other = User.objects.create_user(
+            email="other@test.com", password="other123"
+        )
+        self.course = Course.objects.create(title="Курс", description="Описание")
+
+    def _counters(self):
+        self.course.refresh_from_db()
+        return (
+            self.course.lessons_count,
+            self.course.subscribers_count,
+            self.course.payments_count,
+            self.course.revenue,
+        )
+
+    def test_lesson_writes_update_counter(self):
+        """Test lessons_count follows lesson create, move and delete."""
+        other_course = Course.objects.create(title="Другой курс")
+        lesson = Lesson.objects.create(course=self.course, title="Урок")
+        Lesson.objects.create(course=self.course, title="Урок 2")
+        self.assertEqual(self._counters()[0], 2)
+
+        lesson = Lesson.objects.get(pk=lesson.pk)
+        lesson.course = other_course
+        lesson.save()
+        other_course.refresh_from_db()
+        self.assertEqual(self._counters()[0], 1)
+        self.assertEqual(other_course.lessons_count, 1)
+
+        lesson.delete()
+        other_course.refresh_from_db()
+        self.assertEqual(other_course.lessons_count, 0)
+
+    def test_subscription_and_payment_counters(self):
+        """Test subscriber and succeeded payment aggregates."""
+        subscription = Subscription.objects.create(user=self.user, course=self.course)
+        Subscription.objects.create(
+            user=self.other, course=self.course, is_active=False
+        )
+        self.assertEqual(self._counters()[1], 1)
+
+        subscription.is_active = False
+        subscription.save()
+        subscription.save()
+        self.assertEqual(self._counters()[1], 0)
+
+        payment = Payment.objects.create(
+            user=self.user, course=self.course, amount=Decimal("100.00")
+        )
+        self.assertEqual(self._counters()[2:], (0, Decimal("0")))
+
+        payment.status = Payment.STATUS_SUCCEEDED
+        payment.save()
+        self.assertEqual(self._counters()[2:], (1, Decimal("100.00")))
+
+    def test_cascade_and_queryset_deletes_update_counters(self):
+        """Test deletes that bypass Model.delete() are counted too."""
+        Lesson.objects.create(course=self.course, title="Урок")
+        lesson = Lesson.objects.create(course=self.course, title="Урок 2")
+        Subscription.objects.create(user=self.user, course=self.course)
+        payment = Payment.objects.create(
+            user=self.user, course=self.course, amount=Decimal("10.00")
+        )
+        payment.status = Payment.STATUS_SUCCEEDED
+        payment.save()
+        self.assertEqual(self._counters(), (2, 1, 1, Decimal("10.00")))
+
+        Lesson.objects.filter(pk=lesson.pk).delete()
+        self.user.delete()
+        self.assertEqual(self._counters(), (1, 0, 0, Decimal("0")))
+
+    def test_decrement_of_drifted_counter_stops_at_zero(self):
+        """Test a counter that drifted to zero is not decremented below it."""
+        lesson = Lesson.objects.create(course=self.course, title="Урок")
+        Course.objects.filter(pk=self.course.pk).update(lessons_count=0)
+        lesson.delete()
+        self.assertEqual(self._counters()[0], 0)
+
+    def test_recount_command_repairs_drift(self):
+        """Test recount_course_stats fixes counters changed behind the ORM."""
+        Lesson.objects.create(course=self.course, title="Урок")
+        Course.objects.filter(pk=self.course.pk).update(
+            lessons_count=42, revenue=Decimal("5")
+        )
+
+        version = CacheService.course_version(self.course.pk)
+        global_version = CacheService.global_version()
+        out = StringIO()
+        call_command("recount_course_stats", stdout=out)
+
+        self.assertEqual(self._counters(), (1, 0, 0, Decimal("0")))
+        self.assertNotEqual(CacheService.course_version(self.course.pk), version)
+        self.assertNotEqual(CacheService.global_version(), global_version)
+        self.assertIn("1 repaired", out.getvalue())
+
+    def test_course_list_has_no_per_course_queries(self):
+        """Test lessons_count is serialized without extra queries."""
+        for i in range(5):
+            course = Course.objects.create(title=f"Курс {i}")
+            Lesson.objects.create(course=course, title=f"Урок {i}")
+
+        self.client.force_authenticate(user=self.user)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("course-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"][0]["lessons_count"], 1)
+
+
+class CursorPaginationTestCase(APITestCase):
+    """Test cursor pagination mode."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@test.com", password="user123")
+        course = Course.objects.create(title="Курс", description="Описание")
+        for i in range(12):
+            Course.objects.create(title=f"Курс {i}", description=f"Описание {i}")
+            Lesson.objects.create(course=course, title=f"Урок {i}")
+
+        self.client.force_authenticate(user=self.user)
+
+    def _collect(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn("count", response.data)
+            ids.extend(item["id"] for item in response.data["results"])
+            url = response.data["next"]
+        return ids
+
+    def test_course_cursor_walks_all_pages(self):
+        """Test cursor pages cover every course once in Meta.ordering order."""
+        ids = self._collect(f"{reverse('course-list')}?pagination=cursor")
+        expected = list(
+            Course.objects.order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+    def test_cursor_mode_skips_count_query(self):
+        """Test cursor mode issues a single query per page."""
+        with self.assertNumQueries(1):
+            response = self.client.get(f"{reverse('lesson-list')}?pagination=cursor")
+        self.assertEqual(len(response.data["results"]), 10)
+        self.assertIsNotNone(response.data["next"])
+
+        ids = self._collect(response.data["next"])
+        self.assertEqual(len(ids), 2)
+
+    def test_page_number_mode_is_default(self):
+        """Test old clients still get page-number responses."""
+        response = self.client.get(reverse("lesson-list"))
+        self.assertEqual(response.data["count"], 12)
+
+    def test_course_pages_keep_global_page_size(self):
+        """Test course pages still hold PAGE_SIZE items in both modes."""
+        for query in ("", "?pagination=cursor"):
+            response = self.client.get(f"{reverse('course-list')}{query}")
+            self.assertEqual(len(response.data["results"]), 10)
+
+
+class ConditionalRequestTestCase(APITestCase):
+    """Test ETag / Last-Modified handling."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@test.com", password="user123")
+        self.course = Course.objects.create(title="Курс", description="Описание")
+        self.lesson = Lesson.objects.create(course=self.course, title="Урок")
+        self.client.force_authenticate(user=self.user)
+
+    def test_course_not_modified(self):
+        """Test If-None-Match and If-Modified-Since return 304."""
+        url = reverse("course-detail", args=[self.course.id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+        self.assertIn("Last-Modified", response)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=self.client.get(url)["Last-Modified"]
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_course_lessons_etag_changes_with_lessons(self):
+        """Test the lessons action validators follow lesson writes."""
+        url = reverse("course-lessons", args=[self.course.id])
+        etag = self.client.get(url)["ETag"]
+
+        Lesson.objects.create(course=self.course, title="Новый урок")
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_course_conditional_update(self):
+        """Test the ETag of a course GET guards its PATCH."""
+        url = reverse("course-detail", args=[self.course.id])
+        etag = self.client.get(url)["ETag"]
+
+        response = self.client.patch(url, {"title": "Правка"}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response["ETag"], self.client.get(url)["ETag"])
+
+        response = self.client.patch(url, {"title": "Ещё"}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+    @mock.patch("courses.views.send_lesson_update_notification.apply_async")
+    def test_lesson_conditional_update(self, apply_async):
+        """Test If-Match guards lesson updates against lost writes."""
+        url = reverse("lesson-detail", args=[self.lesson.id])
+        etag = self.client.get(url)["ETag"]
+
+        response = self.client.patch(
+            url, {"title": "Правка"}, HTTP_IF_MATCH='"stale"'
+        )
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+        response = self.client.patch(url, {"title": "Правка"}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class ResponseCacheTestCase(APITestCase):
+    """Test versioned response caching of the catalog."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="user@test.com", password="user123")
+        self.course = Course.objects.create(title="Курс", description="Описание")
+        self.client.force_authenticate(user=self.user)
+
+    def test_list_is_served_from_cache(self):
+        """Test a repeated list request does not touch the database."""
+        url = reverse("course-list")
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.data["count"], 1)
+        self.assertEqual(CacheService.get_stats()["hits"], 1)
+        self.assertEqual(CacheService.get_stats()["misses"], 1)
+
+    @override_settings(RESPONSE_CACHE_ENABLED=False)
+    def test_disabled_without_shared_cache(self):
+        """Test responses are not cached when the cache is process-local."""
+        url = reverse("course-list")
+        self.client.get(url)
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.data["count"], 1)
+        self.assertEqual(CacheService.get_stats()["misses"], 0)
+
+    def test_stale_response_has_no_validators(self):
+        """Test a stale body is not sent with the validators of the new row."""
+        url = reverse("course-detail", args=[self.course.id])
+        self.client.get(url)
+        self.course.title = "Новое название"
+        self.course.save()
+
+        add = cache.add
+
+        def held_lock(key, *args, **kwargs):
+            # Another worker is rebuilding the entry
+            return False if ":lock:" in key else add(key, *args, **kwargs)
+
+        with mock.patch.object(cache, "add", side_effect=held_lock):
+            response = self.client.get(url)
+        self.assertEqual(response.data["title"], "Курс")
+        self.assertNotIn("ETag", response)
+        self.assertNotIn("Last-Modified", response)
+
+        response = self.client.get(url)
+        self.assertEqual(response.data["title"], "Новое название")
+        self.assertIn("ETag", response)
+
+    def test_query_params_are_part_of_key(self):
+        """Test different query strings are cached separately."""
+        url = reverse("course-list")
+        self.client.get(url)
+        response = self.client.get(f"{url}?pagination=cursor")
+        self.assertNotIn("count", response.data)
+
+    def test_writes_invalidate_course_and_catalog(self):
+        """Test course and lesson writes bump the cached versions."""
+        detail_url = reverse("course-detail", args=[self.course.id])
+        lessons_url = reverse("course-lessons", args=[self.course.id])
+        self.client.get(detail_url)
+        self.client.get(lessons_url)
+
+        self.course.title = "Новое название"
+        self.course.save()
+        Lesson.objects.create(course=self.course, title="Урок")
+
+        self.assertEqual(self.client.get(detail_url).data["title"], "Новое название")
+        self.assertEqual(self.client.get(detail_url).data["lessons_count"], 1)
+        self.assertEqual(len(self.client.get(lessons_url).data), 1)
+        self.assertEqual(
+            self.client.get(reverse("course-list")).data["results"][0]["title"],
+            "Новое название",
+        )
+
+
+class SingleFlightTestCase(TestCase):
+    """Test request coalescing in CacheService.single_flight."""
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return f"value-{self.calls}"
+
+    def test_value_computed_once_per_version(self):
+        """Test fresh values are reused and new versions recomputed."""
+        self.assertEqual(
+            CacheService.single_flight("key", 1, self.compute), ("value-1", CACHE_MISS)
+        )
+        self.assertEqual(
+            CacheService.single_flight("key", 1, self.compute), ("value-1", CACHE_HIT)
+        )
+        self.assertEqual(
+            CacheService.single_flight("key", 2, self.compute), ("value-2", CACHE_MISS)
+        )
+
+    def test_stale_value_served_while_rebuilding(self):
+        """Test callers losing the lock race get the previous value."""
+        CacheService.single_flight("key", 1, self.compute)
+        cache.add(LOCK_KEY.format(key="key", version=2), "leader", 5)
+
+        value, state = CacheService.single_flight("key", 2, self.compute)
+
+        self.assertEqual((value, state), ("value-1", CACHE_STALE))
+        self.assertEqual(self.calls, 1)
+
+    def test_waiter_stops_when_leader_gives_up(self):
+        """Test a waiter computes once the lock is gone without a value."""
+        lock_key = LOCK_KEY.format(key="key", version=1)
+        cache.add(lock_key, "leader", 5)
+        sleep = time.sleep
+
+        def leader_gives_up(seconds):
+            cache.delete(lock_key)
+            sleep(seconds)
+
+        started = time.monotonic()
+        with mock.patch("courses.services.cache_service.time.sleep", leader_gives_up):
+            value, state = CacheService.single_flight("key", 1, self.compute, wait=5)
+        self.assertEqual((value, state), ("value-1", CACHE_MISS))
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_waiter_falls_back_after_lease(self):
+        """Test a caller without any value computes once the lease expires."""
+        cache.add(LOCK_KEY.format(key="key", version=1), "leader", 5)
+        value, state = CacheService.single_flight("key", 1, self.compute, lease=0.1)
+        self.assertEqual((value, state), ("value-1", CACHE_MISS))
+
+
+class CourseExpandTestCase(APITestCase):
+    """Test ?expand=lessons on the course endpoints."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="user@test.com", password="user123")
+        self.course = Course.objects.create(title="Курс", description="Описание")
+        for i in range(12):
+            Lesson.objects.create(course=self.course, title=f"Урок {i}")
+        self.client.force_authenticate(user=self.user)
+
+    def test_retrieve_with_lessons(self):
+        """Test nested lessons are ordered and capped by the lesson page size."""
+        url = reverse("course-detail", args=[self.course.id])
+        response = self.client.get(f"{url}?expand=lessons")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        titles = [lesson["title"] for lesson in response.data["lessons"]]
+        self.assertEqual(titles, [f"Урок {i}" for i in range(10)])
+        self.assertEqual(response.data["lessons_count"], 12)
+
+        response = self.client.get(f"{url}?expand=lessons&lessons_page_size=500")
+        self.assertEqual(len(response.data["lessons"]), 12)
+
+    def test_list_query_count_is_fixed(self):
+        """Test the expanded list does not query per course."""
+        for i in range(4):
+            course = Course.objects.create(title=f"Курс {i}")
+            Lesson.objects.create(course=course, title=f"Урок курса {i}")
+
+        with self.assertNumQueries(3):
+            response = self.client.get(f"{reverse('course-list')}?expand=lessons")
+
+        self.assertEqual(len(response.data["results"]), 5)
+        for course in response.data["results"]:
+            self.assertIn("lessons", course)
+
+    def test_plain_retrieve_has_no_lessons(self):
+        """Test lessons are only nested on request."""
+        url = reverse("course-detail", args=[self.course.id])
+        self.assertNotIn("lessons", self.client.get(url).data)
+
+
+class CatalogExportTestCase(APITestCase):
+    """Test the streaming catalog export."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@test.com", password="user123")
+        self.staff = User.objects.create_user(
+            email="staff@test.com", password="staff123", is_staff=True
+        )
+        self.course = Course.objects.create(title="Курс", description="Описание")
+        for i in range(3):
+            Lesson.objects.create(course=self.course, title=f"Урок {i}")
+        self.empty_course = Course.objects.create(title="Пустой курс")
+        Subscription.objects.create(user=self.user, course=self.course)
+        self.url = reverse("catalog-export")
+        self.client.force_authenticate(user=self.user)
+
+    def _content(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b"".join(response.streaming_content).decode()
+
+    def test_ndjson_streams_courses_with_lessons(self):
+        """Test one JSON line per course, lessons nested in order."""
+        response = self.client.get(self.url)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+
+        rows = [json.loads(line) for line in self._content(response).splitlines()]
+        self.assertEqual(
+            [row["id"] for row in rows], [self.course.id, self.empty_course.id]
+        )
+        self.assertEqual(
+            [lesson["title"] for lesson in rows[0]["lessons"]],
+            ["Урок 0", "Урок 1", "Урок 2"],
+        )
+        self.assertNotIn("subscriptions", rows[0])
+
+    def test_csv_has_one_row_per_lesson(self):
+        """Test CSV rows, courses without lessons keep a row."""
+        response = self.client.get(f"{self.url}?export_format=csv")
+        rows = list(csv.DictReader(StringIO(self._content(response))))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[-1]["course_title"], "Пустой курс")
+        self.assertEqual(rows[-1]["lesson_id"], "")
+
+    def test_updated_since_includes_lesson_changes(self):
+        """Test courses are filtered by their own and their lessons' changes."""
+        since = timezone.now()
+        before = since - timedelta(days=1)
+        Course.objects.update(updated_at=before)
+        Lesson.objects.update(updated_at=before)
+        Lesson.objects.filter(course=self.course).first().save()
+
+        response = self.client.get(self.url, {"updated_since": since.isoformat()})
+        rows = [json.loads(line) for line in self._content(response).splitlines()]
+        self.assertEqual([row["id"] for row in rows], [self.course.id])
+
+        response = self.client.get(self.url, {"updated_since": "yesterday"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_relations_are_staff_only(self):
+        """Test subscriptions and payments require a staff user."""
+        url = f"{self.url}?include=subscriptions,payments"
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.staff)
+        row = json.loads(self._content(self.client.get(url)).splitlines()[0])
+        self.assertEqual(row["subscriptions"][0]["user_email"], "user@test.com")
+        self.assertEqual(row["payments"], [])
+
+        response = self.client.get(f"{url}&export_format=csv")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_gzip_on_accept_encoding(self):
+        """Test the stream is compressed for clients accepting gzip."""
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        content = gzip.decompress(b"".join(response.streaming_content)).decode()
+        self.assertEqual(len(content.splitlines()), 2)
+
+    def test_export_command(self):
+        """Test export_catalog writes a gzipped file in chunks."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "catalog.csv.gz")
+            call_command(
+                "export_catalog",
+                "--format=csv",
+                "--gzip",
+                "--chunk-size=1",
+                f"--output={path}",
+                stderr=StringIO(),
+            )
+            with gzip.open(path, "rt") as export:
+                rows = list(csv.DictReader(export))
+        self.assertEqual(len(rows), 4)
+
+
+@mock.patch.object(TaskService, "_producer", contextlib.nullcontext)
+class LessonBulkTestCase(APITestCase):
+    """Test bulk lesson create and update."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@test.com", password="user123")
+        self.course = Course.objects.create(title="Курс", description="Описание")
+        self.other_course = Course.objects.create(title="Другой курс")
+        self.url = reverse("lesson-bulk")
+        self.client.force_authenticate(user=self.user)
+
+    @mock.patch("courses.views.send_lessons_update_notification.apply_async")
+    def test_bulk_create(self, apply_async):
+        """Test lessons are inserted together with one notification per course."""
+        data = [
+            {
+                "course": self.course.id,
+                "title": f"Урок {i}",
+                "video_url": "https://youtu.be/test",
+            }
+            for i in range(60)
+        ] + [{"course": self.other_course.id, "title": "Урок"}]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 61)
+        self.assertTrue(all(lesson["id"] for lesson in response.data))
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.lessons_count, 60)
+        self.assertEqual(apply_async.call_count, 2)
+        course_id, lesson_ids = apply_async.call_args_list[0].args[0]
+        self.assertEqual(course_id, self.course.id)
+        self.assertEqual(len(lesson_ids), 60)
+
+    @mock.patch("courses.views.send_lessons_update_notification.apply_async")
+    def test_bulk_create_is_all_or_nothing(self, apply_async):
+        """Test one invalid video URL rejects the whole batch."""
+        data = [
+            {"course": self.course.id, "title": "Урок"},
+            {
+                "course": self.course.id,
+                "title": "Урок",
+                "video_url": "https://vimeo.com/123456",
+            },
+        ]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("video_url", response.data[1])
+        self.assertFalse(Lesson.objects.exists())
+        apply_async.assert_not_called()
+
+    @mock.patch("courses.views.send_lessons_update_notification.apply_async")
+    def test_bulk_update(self, apply_async):
+        """Test lessons are updated by id, moved lessons shift counters."""
+        first = Lesson.objects.create(course=self.course, title="Урок 1")
+        second = Lesson.objects.create(course=self.course, title="Урок 2")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                self.url,
+                [
+                    {"id": first.id, "title": "Правка"},
+                    {"id": second.id, "course": self.other_course.id},
+                ],
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.title, "Правка")
+        self.assertGreater(first.updated_at, first.created_at)
+        self.assertEqual(second.title, "Урок 2")
+        self.course.refresh_from_db()
+        self.other_course.refresh_from_db()
+        self.assertEqual(self.course.lessons_count, 1)
+        self.assertEqual(self.other_course.lessons_count, 1)
+        self.assertEqual(apply_async.call_count, 2)
+
+        response = self.client.patch(
+            self.url, [{"id": 0, "title": "Правка"}], format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class FullTextSearchTestCase(APITestCase):
+    """Test ?q= full-text search on courses and lessons."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="user@test.com", password="user123")
+        self.python = Course.objects.create(
+            title="Python для начинающих", description="Основы программирования"
+        )
+        self.django = Course.objects.create(
+            title="Веб-разработка", description="Django и Python на практике"
+        )
+        Course.objects.create(title="Дизайн", description="Figma")
+        self.lesson = Lesson.objects.create(
+            course=self.django, title="Модели", description="ORM и миграции"
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_course_search_ranks_and_highlights(self):
+        """Test title matches rank first and matches are highlighted."""
+        response = self.client.get(reverse("course-list"), {"q": "python"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data["results"]
+        self.assertEqual(
+            [course["id"] for course in results], [self.python.id, self.django.id]
+        )
+        self.assertEqual(
+            results[0]["search"]["title"], "<mark>Python</mark> для начинающих"
+        )
+        self.assertIn("<mark>Python</mark>", results[1]["search"]["snippet"])
+        self.assertGreater(results[0]["search"]["rank"], results[1]["search"]["rank"])
+
+    def test_cursor_pages_keep_rank_order(self):
+        """Test cursor mode pages search results by rank, not by date."""
+        url = reverse("course-list")
+        expected = [
+            course["id"] for course in self.client.get(url, {"q": "python"}).data[
+                "results"
+            ]
+        ]
+        params = {"q": "python", "pagination": "cursor", "page_size": 1}
+        seen = []
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen += [course["id"] for course in response.data["results"]]
+            url, params = response.data["next"], None
+
+        self.assertEqual(seen, expected)
+        self.assertEqual(seen, [self.python.id, self.django.id])
+
+    def test_index_follows_writes(self):
+        """Test saves, bulk updates and deletes are reflected in results."""
+        url = reverse("lesson-list")
+        self.assertEqual(self.client.get(url, {"q": "миграц"}).data["count"], 1)
+
+        Lesson.objects.filter(pk=self.lesson.pk).update(description="Запросы")
+        self.assertEqual(self.client.get(url, {"q": "миграц"}).data["count"], 0)
+        self.assertEqual(self.client.get(url, {"q": "запрос"}).data["count"], 1)
+
+        self.lesson.delete()
+        self.assertEqual(self.client.get(url, {"q": "запрос"}).data["count"], 0)
+
+    def test_query_syntax_is_not_interpreted(self):
+        """Test operators and quotes in the query are treated as words."""
+        url = reverse("course-list")
+        response = self.client.get(url, {"q": 'python" OR (дизайн*'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 0)
+        self.assertEqual(self.client.get(url, {"q": "!!!"}).data["count"], 0)
+
+    def test_unindexed_database_falls_back_to_icontains(self):
+        """Test other databases get unranked substring matches, not a 500."""
+        with mock.patch(
+            "courses.services.search_service.default_connection",
+            SimpleNamespace(vendor="mysql"),
+        ):
+            response = self.client.get(reverse("course-list"), {"q": "python"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data["results"]
+        self.assertEqual(
+            [course["id"] for course in results], [self.python.id, self.django.id]
+        )
+        self.assertEqual(results[0]["search"]["title"], "Python для начинающих")
+
+    def test_rebuild_command(self):
+        """Test the index is repopulated from the tables."""
+        out = StringIO()
+        call_command("rebuild_search_index", stdout=out)
+        self.assertIn("rebuilt", out.getvalue())
+        response = self.client.get(reverse("course-list"), {"q": "figma"})
+        self.assertEqual(response.data["count"], 1)
+
+
+class SparseFieldsetTestCase(APITestCase):
+    """Test ?fields=, ?omit= and ?profile= on list endpoints."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="user@test.com", password="user123")
+        self.course = Course.objects.create(title="Курс", description="Описание")
+        Lesson.objects.create(course=self.course, title="Урок", description="Текст")
+        Subscription.objects.create(user=self.user, course=self.course)
+        self.client.force_authenticate(user=self.user)
+
+    def _get(self, url, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, " ".join(query["sql"] for query in queries)
+
+    def test_fields_defer_columns(self):
+        """Test only the selected columns are serialized and fetched."""
+        lesson = Lesson.objects.get()
+        response, sql = self._get(reverse("lesson-list"), {"fields": "title"})
+        self.assertEqual(response.data["results"], [{"id": lesson.id, "title": "Урок"}])
+        self.assertNotIn('"description"', sql)
+
+    def test_omit_and_summary_profile(self):
+        """Test omitted fields and the summary profile."""
+        response, sql = self._get(reverse("course-list"), {"omit": "description"})
+        self.assertNotIn("description", response.data["results"][0])
+        self.assertIn("price", response.data["results"][0])
+        self.assertNotIn('"description"', sql)
+
+        response, _ = self._get(reverse("course-list"), {"profile": "summary"})
+        self.assertEqual(
+            set(response.data["results"][0]),
+            {"id", "title", "price", "lessons_count", "last_updated"},
+        )
+
+        response, _ = self._get(
+            reverse("subscription-list"),
+            {"profile": "summary", "pagination": "cursor"},
+        )
+        self.assertEqual(response.data["results"][0]["course_title"], "Курс")
+        self.assertNotIn("user_email", response.data["results"][0])
+
+    def test_invalid_selection(self):
+        """Test unknown fields and profiles are rejected."""
+        url = reverse("course-list")
+        response = self.client.get(url, {"fields": "title,secret"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(url, {"profile": "tiny"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_detail_is_complete(self):
+        """Test the selection only applies to list reads."""
+        url = reverse("course-detail", args=[self.course.id])
+        self.assertIn("description", self.client.get(url, {"fields": "title"}).data)
+
+
+class PermissionScopeTestCase(APITestCase):
+    """Test object-level and queryset-level permission decisions agree."""
+
+    ACTIONS = {
+        "list": "GET",
+        "retrieve": "GET",
+        "update": "PUT",
+        "partial_update": "PATCH",
+        "destroy": "DELETE",
+        "subscribe": "POST",
+    }
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(email="owner@test.com", password="pw")
+        self.other = User.objects.create_user(email="other@test.com", password="pw")
+        self.moderator = User.objects.create_user(
+            email="moderator@test.com", password="pw"
+        )
+        self.moderator.groups.add(Group.objects.create(name="moderators"))
+        self.course = Course.objects.create(title="Курс")
+        Lesson.objects.create(course=self.course, title="Урок")
+        for user in (self.owner, self.other):
+            Subscription.objects.create(user=user, course=self.course)
+            Payment.objects.create(user=user, course=self.course, amount=10)
+
+    def _request(self, user, method):
+        request = Request(APIRequestFactory().generic(method, "/"))
+        request.user = user
+        return request
+
+    def assertAgree(self, permission, queryset, owner_field="owner"):
+        for user in (self.owner, self.other, self.moderator, AnonymousUser()):
+            for action, method in self.ACTIONS.items():
+                request = self._request(user, method)
+                view = SimpleNamespace(action=action, owner_field=owner_field)
+                with self.subTest(permission=permission, user=user, action=action):
+                    allowed = {
+                        obj.pk for obj in queryset
+                        if permission.has_object_permission(request, view, obj)
+                    }
+                    scoped = permission.filter_queryset(request, view, queryset)
+                    self.assertEqual(set(scoped.values_list("pk", flat=True)), allowed)
+
+    def test_scopes_agree_with_object_checks(self):
+        """Test every policy filters exactly the rows it allows."""
+        policies = (
+            IsOwner(),
+            IsOwnerOrModerator(),
+            IsOwnerOrModeratorOrReadOnly(),
+            CourseLessonPermission(),
+            CoursePermissions(),
+        )
+        for permission in policies:
+            self.assertAgree(permission, Subscription.objects.all(), "user")
+            self.assertAgree(permission, Payment.objects.all(), "user")
+            self.assertAgree(permission, Course.objects.all())
+        self.assertAgree(LessonPermissions(), Lesson.objects.all())
+        self.assertAgree(IsOwner(), User.objects.all())
+
+    def test_owner_check_compares_ids(self):
+        """Test object checks do not load the owner row."""
+        payment = Payment.objects.get(user=self.owner)
+        view = SimpleNamespace(action="retrieve", owner_field="user")
+        with self.assertNumQueries(0):
+            self.assertTrue(
+                IsOwner().has_object_permission(
+                    self._request(self.owner, "GET"), view, payment
+                )
+            )
+
+    def test_views_scope_rows_in_sql(self):
+        """Test payment and subscription endpoints only fetch own rows."""
+        self.client.force_authenticate(user=self.owner)
+        response = self.client.get(reverse("payment-list"))
+        self.assertEqual(
+            [payment["id"] for payment in response.data["results"]],
+            list(Payment.objects.filter(user=self.owner).values_list("pk", flat=True)),
+        )
+        response = self.client.get(reverse("subscription-list"))
+        self.assertEqual(len(response.data["results"]), 1)
+
+        other_payment = Payment.objects.get(user=self.other)
+        response = self.client.get(reverse("payment-detail", args=[other_payment.pk]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(NOTIFICATION_CHUNK_SIZE=2)
+@mock.patch.object(TaskService, "_producer", contextlib.nullcontext)
+class NotificationOutboxTestCase(TestCase):
+    """Test notifications go through the deduplicating outbox."""
+
+    def setUp(self):
+        self.course = Course.objects.create(title="Курс", description="Описание")
+        for i in range(5):
+            user = User.objects.create_user(email=f"user{i}@test.com", password="pw")
+            Subscription.objects.create(
+                user=user, course=self.course, is_active=i != 4
+            )
+
+    def _run_inline(self, task):
+        return mock.patch.object(
+            task,
+            "apply_async",
+            side_effect=lambda args, kwargs, **options: task(*args, **kwargs),
+        )
+
+    def test_subscribers_are_batched(self):
+        """Test one outbox item is stored per batch of active subscribers."""
+        with mock.patch("courses.tasks.deliver_notification.apply_async") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                result = send_course_update_notification(self.course.id)
+        self.assertEqual(result, {"course_id": self.course.id, "queued": 2})
+        items = NotificationOutbox.objects.order_by("batch")
+        self.assertEqual(
+            [item.recipients for item in items],
+            [
+                ["user0@test.com", "user1@test.com"],
+                ["user2@test.com", "user3@test.com"],
+            ],
+        )
+        self.assertEqual(
+            sorted(call.args[0][0] for call in delay.call_args_list),
+            sorted(item.pk for item in items),
+        )
+
+    def test_duplicate_fan_outs_stream_subscribers_once(self):
+        """Test tasks of the same change share one enqueue computation."""
+        cache.clear()
+        with mock.patch(
+            "courses.tasks.deliver_notification.apply_async"
+        ) as delay, mock.patch.object(
+            NotificationService, "enqueue", wraps=NotificationService.enqueue
+        ) as enqueue, self.captureOnCommitCallbacks(execute=True):
+            for _ in range(2):
+                send_course_update_notification(self.course.id)
+        enqueue.assert_called_once()
+        self.assertEqual(delay.call_count, 4)
+        self.assertEqual(NotificationOutbox.objects.count(), 2)
+
+    def test_null_descriptions(self):
+        """Test courses and lessons without a description are announced."""
+        Course.objects.filter(pk=self.course.pk).update(
+            description=None, last_updated=timezone.now() - timedelta(hours=5)
+        )
+        lesson = Lesson.objects.create(course=self.course, title="Урок")
+        Lesson.objects.filter(pk=lesson.pk).update(description=None)
+        with mock.patch("courses.tasks.deliver_notification.apply_async"):
+            with self.captureOnCommitCallbacks(execute=True):
+                lesson_result = send_lesson_update_notification(lesson.id)
+                course_result = send_course_update_notification(self.course.id)
+        self.assertEqual(lesson_result, {"lesson_id": lesson.id, "queued": 2})
+        self.assertEqual(course_result, {"course_id": self.course.id, "queued": 2})
+
+    def test_duplicates_are_not_sent(self):
+        """Test repeated enqueues, beat runs and deliveries send once."""
+        with self._run_inline(deliver_notification), self._run_inline(
+            send_course_update_notification
+        ), self.captureOnCommitCallbacks(execute=True):
+            send_course_update_notification(self.course.id)
+            send_course_update_notification(self.course.id)
+            send_pending_notifications()
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            [f"user{i}@test.com" for i in range(4)],
+        )
+        self.assertEqual(
+            set(NotificationOutbox.objects.values_list("status", flat=True)),
+            {NotificationOutbox.STATUS_SENT},
+        )
+        item = NotificationOutbox.objects.first()
+        self.assertEqual(deliver_notification(item.pk)["status"], "claimed")
+        self.assertEqual(len(mail.outbox), 4)
+
+        # A new change of the course is a new notification
+        self.course.save()
+        with self._run_inline(
+            deliver_notification
+        ), self.captureOnCommitCallbacks(execute=True):
+            send_course_update_notification(self.course.id)
+        self.assertEqual(len(mail.outbox), 8)
+
+    def test_chunk_sends_individual_messages(self):
+        """Test every recipient gets its own message over one connection."""
+        emails = ["a@test.com", "b@test.com", "c@test.com"]
+        with mock.patch.object(
+            EmailBackend, "open", autospec=True, side_effect=EmailBackend.open
+        ) as backend_open:
+            handled, failed = send_individually("Тема", "Текст", emails)
+        self.assertEqual((handled, failed), (3, []))
+        self.assertEqual([message.to for message in mail.outbox], [[e] for e in emails])
+        self.assertEqual(len({call.args[0] for call in backend_open.call_args_list}), 1)
+
+    @override_settings(NOTIFICATION_MAX_ATTEMPTS=2)
+    def test_retries_only_failed_recipients(self):
+        """Test a failed recipient is retried without resending the others."""
+        send_messages = EmailBackend.send_messages
+
+        def flaky(backend, messages):
+            if messages[0].to == ["user1@test.com"]:
+                raise OSError("connection lost")
+            return send_messages(backend, messages)
+
+        with mock.patch("courses.tasks.deliver_notification.apply_async"):
+            send_course_update_notification(self.course.id)
+        item = NotificationOutbox.objects.get(batch=0)
+
+        with mock.patch.object(EmailBackend, "send_messages", flaky):
+            with self.assertLogs("courses.tasks", "WARNING") as logs:
+                with self.assertRaises(Retry):
+                    deliver_notification(item.pk)
+            self.assertIn("Sent 1 of 2 messages", logs.output[-1])
+            self.assertIn("user1@test.com", logs.output[-1])
+            item.refresh_from_db()
+            self.assertEqual(item.status, NotificationOutbox.STATUS_PENDING)
+            self.assertEqual(item.recipients, ["user1@test.com"])
+            self.assertGreaterEqual(item.retry_at, item.created_at)
+
+            with self.assertLogs("courses.tasks", "WARNING"):
+                result = deliver_notification(item.pk)
+            self.assertEqual(
+                result,
+                {
+                    "outbox_id": item.pk,
+                    "status": NotificationOutbox.STATUS_FAILED,
+                    "sent": 0,
+                    "failed": 1,
+                    "skipped": 0,
+                },
+            )
+            item.refresh_from_db()
+            self.assertEqual(item.status, NotificationOutbox.STATUS_FAILED)
+
+        self.assertEqual(
+            [message.to for message in mail.outbox], [["user0@test.com"]]
+        )
+        self.assertNotIn(item.pk, NotificationService.undelivered_ids())
+
+    def _stale_item(self, **fields):
+        with mock.patch("courses.tasks.deliver_notification.apply_async"):
+            send_course_update_notification(self.course.id)
+        item = NotificationOutbox.objects.get(batch=0)
+        NotificationOutbox.objects.filter(pk=item.pk).update(
+            status=NotificationOutbox.STATUS_SENDING,
+            claimed_at=timezone.now() - timedelta(hours=1),
+            attempts=1,
+            **fields,
+        )
+        return item
+
+    def test_delivery_resumes_from_checkpoint(self):
+        """Test a delivery taken over after a crash skips handled recipients."""
+        item = self._stale_item(checkpoint=1)
+        self.assertIn(item.pk, NotificationService.undelivered_ids())
+        result = deliver_notification(item.pk)
+        self.assertEqual(
+            (result["sent"], result["skipped"], result["status"]),
+            (1, 1, NotificationOutbox.STATUS_SENT),
+        )
+        self.assertEqual([message.to for message in mail.outbox], [["user1@test.com"]])
+        item.refresh_from_db()
+        self.assertEqual((item.checkpoint, item.failed_recipients), (0, []))
+
+    @override_settings(NOTIFICATION_CHECKPOINT_INTERVAL=1)
+    def test_unreachable_server_is_retried_with_backoff(self):
+        """Test recipients after a connection failure wait for the backoff."""
+        checkpoints = []
+        checkpoint = NotificationService.checkpoint
+
+        def record(item, position, failed):
+            checkpoints.append(position)
+            return checkpoint(item, position, failed)
+
+        item = self._stale_item()
+        started = timezone.now()
+        with mock.patch.object(
+            EmailBackend, "open", side_effect=[None, OSError("refused")]
+        ), mock.patch.object(NotificationService, "checkpoint", record):
+            with self.assertLogs("courses.tasks", "WARNING"):
+                with self.assertRaises(Retry):
+                    deliver_notification(item.pk)
+        finished = timezone.now()
+        self.assertEqual(checkpoints, [1])
+        self.assertEqual([message.to for message in mail.outbox], [["user0@test.com"]])
+        item.refresh_from_db()
+        self.assertEqual(item.status, NotificationOutbox.STATUS_PENDING)
+        self.assertEqual(item.recipients, ["user1@test.com"])
+        # Full jitter: anywhere up to the backoff of a second attempt
+        self.assertGreaterEqual(item.retry_at, started)
+        self.assertLessEqual(item.retry_at, finished + timedelta(seconds=120))
+
+    def test_lost_claim_stops_delivery(self):
+        """Test a worker stops once another one took its delivery over."""
+        item = self._stale_item()
+        item = NotificationService.claim(item.pk)
+        NotificationOutbox.objects.filter(pk=item.pk).update(claimed_at=timezone.now())
+        self.assertFalse(NotificationService.checkpoint(item, 1, []))
+        self.assertFalse(NotificationService.complete(item, 2, []))
+        item.refresh_from_db()
+        self.assertEqual(item.status, NotificationOutbox.STATUS_SENDING)
+
+
+@mock.patch.object(TaskService, "_producer", contextlib.nullcontext)
+class SubscriberDigestTestCase(APITestCase):
+    """Test digest subscribers get one summary per window."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="digest@test.com", password="pw")
+        self.other = User.objects.create_user(email="now@test.com", password="pw")
+        self.course = Course.objects.create(title="Курс А", description="Описание")
+        self.second = Course.objects.create(title="Курс Б", description="Описание")
+        self.lesson = Lesson.objects.create(
+            course=self.course, title="Урок 1", description="Описание"
+        )
+        for course in (self.course, self.second):
+            self.subscription = Subscription.objects.create(
+                user=self.user,
+                course=course,
+                notification_mode=Subscription.MODE_HOURLY,
+            )
+        Subscription.objects.create(user=self.other, course=self.course)
+        Subscription.objects.update(
+            digest_sent_at=timezone.now() - timedelta(minutes=1)
+        )
+
+    def _deliver(self):
+        return mock.patch.object(
+            deliver_notification,
+            "apply_async",
+            side_effect=lambda args, kwargs, **options: deliver_notification(*args),
+        )
+
+    def test_changes_are_coalesced(self):
+        """Test repeated edits of several courses end up in one message."""
+        with self._deliver(), self.captureOnCommitCallbacks(execute=True):
+            send_course_update_notification(self.course.id)
+            send_lesson_update_notification(self.lesson.id)
+            self.lesson.save()
+            send_lesson_update_notification(self.lesson.id)
+            self.second.save()
+            send_course_update_notification(self.second.id)
+        self.assertEqual(ChangeEvent.objects.count(), 4)
+        self.assertEqual(
+            [message.to for message in mail.outbox], [["now@test.com"]]
+        )
+
+        with self._deliver(), self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(
+                send_subscriber_digests(Subscription.MODE_DAILY),
+                {"mode": "daily", "queued": 0},
+            )
+            send_subscriber_digests(Subscription.MODE_HOURLY)
+        self.assertEqual(len(mail.outbox), 2)
+        digest = mail.outbox[1]
+        self.assertEqual(digest.to, ["digest@test.com"])
+        self.assertEqual(digest.body.count("Обновлен урок: Урок 1"), 1)
+        self.assertLess(digest.body.index("Курс А"), digest.body.index("Курс Б"))
+        self.assertEqual(digest.body.count("Курс обновлен"), 2)
+
+        # Nothing changed since the last digest
+        self.assertEqual(
+            send_subscriber_digests(Subscription.MODE_HOURLY),
+            {"mode": "hourly", "queued": 0},
+        )
+
+    def test_lessons_with_the_same_title_are_listed_apart(self):
+        """Test digest lines are deduplicated by lesson, not by summary."""
+        twin = Lesson.objects.create(
+            course=self.course, title="Урок 1", description="Описание"
+        )
+        with self._deliver(), self.captureOnCommitCallbacks(execute=True):
+            send_lessons_update_notification(self.course.id, [self.lesson.id, twin.id])
+            send_subscriber_digests(Subscription.MODE_HOURLY)
+        digest = mail.outbox[-1]
+        self.assertEqual(digest.to, ["digest@test.com"])
+        self.assertEqual(digest.body.count("Обновлен урок: Урок 1"), 2)
+
+    def test_update_notification_mode(self):
+        """Test subscribers switch modes on their own subscriptions only."""
+        url = reverse("subscription-detail", args=[self.subscription.pk])
+        self.client.force_authenticate(user=self.other)
+        response = self.client.patch(url, {"notification_mode": "daily"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.force_authenticate(user=self.user)
+        before = self.subscription.digest_sent_at
+        response = self.client.patch(
+            url, {"notification_mode": "daily", "course": self.course.pk}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["notification_mode"], "daily")
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.course, self.second)
+        self.assertGreater(self.subscription.digest_sent_at, before)
+
+        response = self.client.patch(url, {"notification_mode": "weekly"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@mock.patch.object(TaskService, "_producer")
+@mock.patch("courses.tasks.send_course_update_notification.apply_async")
+class TaskServiceTestCase(TestCase):
+    """Test tasks are dispatched after commit, deduplicated and batched."""
+
+    task = send_course_update_notification
+
+    def test_dispatch_waits_for_commit(self, apply_async, producer):
+        """Test nothing is published before the transaction commits."""
+        with self.captureOnCommitCallbacks() as callbacks:
+            TaskService.dispatch(self.task, 1)
+        apply_async.assert_not_called()
+        self.assertEqual(len(callbacks), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with contextlib.suppress(RuntimeError), transaction.atomic():
+                TaskService.dispatch(self.task, 2)
+                raise RuntimeError
+        apply_async.assert_not_called()
+
+    def test_batch_collapses_duplicates(self, apply_async, producer):
+        """Test a batch publishes every distinct call once over one producer."""
+        with TaskService.batch():
+            with self.captureOnCommitCallbacks(execute=True):
+                TaskService.dispatch(self.task, 1)
+                TaskService.dispatch(self.task, 1)
+                TaskService.dispatch(self.task, 2)
+            apply_async.assert_not_called()
+
+        self.assertEqual(
+            [call.args for call in apply_async.call_args_list],
+            [((1,), {}), ((2,), {})],
+        )
+        producer.assert_called_once()
+        self.assertEqual(
+            {call.kwargs["producer"] for call in apply_async.call_args_list},
+            {producer.return_value.__enter__.return_value},
+        )
+
+    def test_publish_errors_are_kept_for_redelivery(self, apply_async, producer):
+        """Test calls the broker refused are logged, kept and published later."""
+        apply_async.side_effect = [OSError("broker down"), None]
+        with self.assertLogs("courses.services.task_service", "ERROR"):
+            TaskService.publish([(self.task, (1,), {}), (self.task, (2,), {})])
+        self.assertEqual(apply_async.call_count, 2)
+        kept = QueuedTask.objects.get()
+        self.assertEqual([kept.name, kept.args], [self.task.name, [1]])
+
+        apply_async.side_effect = OSError("still down")
+        with self.assertLogs("courses.services.task_service", "ERROR"):
+            self.assertEqual(redeliver_tasks(), {"published": 0})
+        kept.refresh_from_db()
+        self.assertEqual(kept.status, QueuedTask.STATUS_PENDING)
+
+        apply_async.side_effect = None
+        self.assertEqual(redeliver_tasks(), {"published": 1})
+        apply_async.assert_called_with(
+            [1], {}, task_id=kept.task_id, producer=mock.ANY
+        )
+        self.assertFalse(QueuedTask.objects.exists())
+
+
+class TaskRoutingTestCase(TestCase):
+    """Test workloads are routed to their queues from TASK_QUEUES."""
+
+    def _route(self, name):
+        route = celery_app.amqp.router.route({}, name, (), {})
+        return route["queue"].name, route.get("priority")
+
+    def test_tasks_are_routed(self):
+        """Test notifications, maintenance and payments get their queues."""
+        notifications = self._route("courses.tasks.deliver_notification")
+        maintenance = self._route("users.tasks.check_inactive_users")
+        payments = self._route("courses.tasks.handle_stripe_webhook")
+        self.assertEqual(
+            [notifications[0], maintenance[0], payments[0]],
+            ["notifications", "maintenance", "payments"],
+        )
+        self.assertEqual(self._route("users.tasks.persist_session")[0], "default")
+        self.assertEqual(
+            [payments[1], notifications[1], maintenance[1]],
+            [message_priority(9), message_priority(3), message_priority(0)],
+        )
+
+    def test_settings_are_read_after_import(self):
+        """Test a settings module importing config.settings configures Celery."""
+        probe = (
+            "import django\n"
+            "django.setup()\n"
+            "from config.celery import app\n"
+            "route = app.amqp.router.route({}, 'courses.tasks.handle_stripe_webhook')\n"
+            "print(route['priority'], app.conf.beat_schedule['send-daily-digests'])\n"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "local_settings.py"), "w") as file:
+                file.write(
+                    "from config.settings import *\n"
+                    "TASK_QUEUES = {**TASK_QUEUES, 'payments': "
+                    "{**TASK_QUEUES['payments'], 'priority': 5}}\n"
+                    "DIGEST_DAILY_HOUR = 7\n"
+                )
+            result = subprocess.run(
+                [sys.executable, "-c", probe],
+                capture_output=True,
+                text=True,
+                env={
+                    **os.environ,
+                    "DJANGO_SETTINGS_MODULE": "local_settings",
+                    "PYTHONPATH": os.pathsep.join([directory, str(settings.BASE_DIR)]),
+                },
+            )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertTrue(result.stdout.startswith(f"{message_priority(5)} "))
+        self.assertIn("<crontab: 10 7 ", result.stdout)
+
+    def test_worker_profile(self):
+        """Test a worker consumes one queue with its profile."""
+        out = StringIO()
+        call_command("run_worker", "notifications", "--print", stdout=out)
+        self.assertIn("--queues notifications", out.getvalue())
+        self.assertIn("--prefetch-multiplier 1", out.getvalue())
+
+    @override_settings(NOTIFICATION_SEND_RATE=2)
+    def test_send_rate(self):
+        """Test sends are spread out to the configured rate."""
+        with mock.patch("courses.tasks.time.sleep") as sleep:
+            send_individually("Тема", "Текст", ["a@test.com", "b@test.com"])
+        sleep.assert_called_once()
+        self.assertAlmostEqual(sleep.call_args.args[0], 0.5, delta=0.1)
+
+
+@override_settings(TASK_BACKEND="local", NOTIFICATION_CHUNK_SIZE=2)
+class LocalTaskBackendTestCase(TestCase):
+    """Test tasks run from the database queue without a broker."""
+
+    def setUp(self):
+        self.course = Course.objects.create(title="Курс", description="Описание")
+        for i in range(3):
+            user = User.objects.create_user(email=f"user{i}@test.com", password="pw")
+            Subscription.objects.create(user=user, course=self.course)
+
+    def _drain(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return LocalTaskService.run_pending()
+
+    def test_calls_are_stored_and_run(self):
+        """Test delay stores a call that the executor runs later."""
+        with self.captureOnCommitCallbacks(execute=True):
+            send_course_update_notification.delay(self.course.id)
+        item = QueuedTask.objects.get()
+        self.assertEqual(item.name, send_course_update_notification.name)
+        self.assertEqual(item.args, [self.course.id])
+        self.assertEqual(mail.outbox, [])
+
+        self.assertEqual(self._drain(), 1)
+        # The fan-out dispatched one delivery per batch
+        self.assertEqual(self._drain(), 2)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(
+            set(QueuedTask.objects.values_list("status", flat=True)),
+            {QueuedTask.STATUS_DONE},
+        )
+        self.assertEqual(self._drain(), 0)
+
+    def test_retry_is_stored_with_its_eta(self):
+        """Test a retrying task is stored again instead of run at once."""
+        with mock.patch("courses.tasks.deliver_notification.apply_async"):
+            send_course_update_notification(self.course.id)
+        outbox = NotificationOutbox.objects.get(batch=0)
+        deliver_notification.delay(outbox.pk)
+
+        with mock.patch.object(
+            EmailBackend, "send_messages", side_effect=OSError("refused")
+        ), self.assertLogs("courses.tasks", "WARNING"):
+            self._drain()
+        item = QueuedTask.objects.get()
+        outbox.refresh_from_db()
+        self.assertEqual(
+            (item.status, item.retries, item.eta),
+            (QueuedTask.STATUS_PENDING, 1, outbox.retry_at),
+        )
+
+    def test_failures_and_stale_calls(self):
+        """Test failed calls are recorded and abandoned ones run again."""
+        LocalTaskService.enqueue("courses.tasks.missing")
+        stale = QueuedTask.objects.create(
+            task_id="stale",
+            name=send_pending_notifications.name,
+            status=QueuedTask.STATUS_RUNNING,
+            locked_at=timezone.now() - timedelta(days=1),
+        )
+        with self.assertLogs("courses.services.local_task_service", "ERROR"):
+            self.assertEqual(self._drain(), 2)
+        failed = QueuedTask.objects.get(name="courses.tasks.missing")
+        self.assertEqual(failed.status, QueuedTask.STATUS_FAILED)
+        self.assertIn("NotRegistered", failed.error)
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, QueuedTask.STATUS_DONE)
+
+    @mock.patch.object(LocalTaskExecutor, "start")
+    def test_pool_starts_only_when_asked(self, start):
+        """Test web processes leave polling to run_local_tasks by default."""
+        TaskBatchMiddleware(lambda request: None)
+        start.assert_not_called()
+        with override_settings(TASK_LOCAL_AUTOSTART=True):
+            TaskBatchMiddleware(lambda request: None)
+        start.assert_called_once()
+
+        with mock.patch.object(LocalTaskExecutor, "run") as run:
+            call_command("run_local_tasks", stdout=StringIO())
+        run.assert_called_once()
+        with override_settings(TASK_BACKEND="celery"), self.assertRaises(
+            CommandError
+        ):
+            call_command("run_local_tasks", stdout=StringIO())
+
+    def test_periodic_run_keyed_by_scheduled_time(self):
+        """Test pollers noticing a run in different minutes enqueue it once."""
+        last_run = timezone.now().replace(hour=1, minute=30, second=0)
+        for seen_at in (
+            last_run.replace(hour=2, minute=0, second=59),
+            last_run.replace(hour=2, minute=1, second=1),
+        ):
+            entry = {
+                "task": send_pending_notifications.name,
+                "schedule": crontab(minute=0, nowfun=lambda seen_at=seen_at: seen_at),
+            }
+            with mock.patch.dict(
+                celery_app.conf.beat_schedule, {"entry": entry}, clear=True
+            ):
+                LocalTaskService.enqueue_periodic({"entry": last_run})
+        self.assertEqual(
+            list(QueuedTask.objects.values_list("task_id", flat=True)),
+            [f"beat:entry:{last_run:%Y-%m-%d}T02:00"],
+        )
+
+    def test_periodic_tasks_are_enqueued_once(self):
+        """Test every process enqueues a due beat entry under one key."""
+        last_run = timezone.now() - timedelta(days=2)
+        for _ in range(2):
+            last_runs = dict.fromkeys(celery_app.conf.beat_schedule, last_run)
+            LocalTaskService.enqueue_periodic(last_runs)
+        self.assertEqual(
+            sorted(QueuedTask.objects.values_list("name", flat=True)),
+            sorted(
+                entry["task"] for entry in celery_app.conf.beat_schedule.values()
+            ),
+        )
+
+
+class CourseStripePriceTestCase(APITestCase):
+    """Test checkouts reuse the Stripe product and price of a course."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="buyer@test.com", password="pw")
+        self.course = Course.objects.create(
+            title="Курс", description="Описание", price=Decimal("19.99")
+        )
+        self.client.force_authenticate(self.user)
+        self.counter = iter(range(1, 100))
+        patches = {
+            "stripe.Product.create": lambda **kwargs: SimpleNamespace(id="prod_1"),
+            "stripe.Price.create": lambda **kwargs: SimpleNamespace(
+                id=f"price_{next(self.counter)}"
+            ),
+            "stripe.Price.modify": None,
+            "stripe.checkout.Session.create": lambda **kwargs: SimpleNamespace(
+                id="cs_1", url="https://checkout.test/cs_1", payment_intent=None
+            ),
+        }
+        self.mocks = {}
+        for target, side_effect in patches.items():
+            patcher = mock.patch(target, side_effect=side_effect)
+            self.mocks[target] = patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _buy(self):
+        response = self.client.post(reverse("payment-list"), {"course": self.course.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Payment.objects.latest("id")
+
+    def test_price_is_reused(self):
+        """Test only the checkout session is created for a known price."""
+        first = self._buy()
+        second = self._buy()
+        self.assertEqual(
+            (second.stripe_product_id, second.stripe_price_id),
+            (first.stripe_product_id, first.stripe_price_id),
+        )
+        self.assertEqual(self.mocks["stripe.Product.create"].call_count, 1)
+        self.assertEqual(self.mocks["stripe.Price.create"].call_count, 1)
+        self.assertEqual(
+            self.mocks["stripe.Price.create"].call_args.kwargs["unit_amount"], 1999
+        )
+        self.assertEqual(self.mocks["stripe.checkout.Session.create"].call_count, 2)
+        self.mocks["stripe.Price.modify"].assert_not_called()
+
+    def test_price_change_replaces_price(self):
+        """Test a new price is created and the old one archived."""
+        first = self._buy()
+        self.course.price = Decimal("25.00")
+        self.course.save()
+        second = self._buy()
+        self.assertEqual(second.stripe_product_id, first.stripe_product_id)
+        self.assertNotEqual(second.stripe_price_id, first.stripe_price_id)
+        self.assertEqual(self.mocks["stripe.Product.create"].call_count, 1)
+        self.mocks["stripe.Price.modify"].assert_called_once_with(
+            first.stripe_price_id, active=False
+        )
+        mapping = CourseStripePrice.objects.get(course=self.course)
+        self.assertEqual(
+            (mapping.price_id, mapping.amount, mapping.currency),
+            (second.stripe_price_id, Decimal("25.00"), "rub"),
+        )
+
+    def test_failed_price_keeps_product(self):
+        """Test a product survives a failing price and is not created twice."""
+        price_create = self.mocks["stripe.Price.create"]
+        price_create.side_effect = stripe.error.APIConnectionError("down")
+        with self.assertRaises(Exception):
+            StripeService.get_course_price(self.course)
+        self.assertEqual(
+            CourseStripePrice.objects.get(course=self.course).product_id, "prod_1"
+        )
+
+        price_create.side_effect = lambda **kwargs: SimpleNamespace(id="price_1")
+        self.assertEqual(
+            StripeService.get_course_price(self.course), ("prod_1", "price_1")
+        )
+        self.assertEqual(self.mocks["stripe.Product.create"].call_count, 1)
+        self.assertIn("idempotency_key", price_create.call_args.kwargs)
+
+    def test_currency_change_replaces_price(self):
+        """Test switching the currency creates a price in the new currency."""
+        self._buy()
+        with override_settings(STRIPE_CURRENCY="EUR"):
+            self._buy()
+        self.assertEqual(self.mocks["stripe.Price.create"].call_count, 2)
+        self.assertEqual(
+            self.mocks["stripe.Price.create"].call_args.kwargs["currency"], "eur"
+        )
+        self.mocks["stripe.Price.modify"].assert_called_once()
@@ -1,12 +1,15 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
+    CatalogExportView,
     CourseViewSet,
+    LessonBulkView,
     LessonListCreateView,
     LessonRetrieveUpdateDestroyView,
     PaymentListCreateView,
     PaymentRetrieveView,
     SubscriptionListView,
+    SubscriptionUpdateView,
     StripeWebhookView,
     PaymentSuccessView,
     PaymentCancelView,
@@ -18,8 +21,12 @@ router.register(r'courses', CourseViewSet)
 urlpatterns = [
     path('', include(router.urls)),
 
+    # Catalog export
+    path('export/', CatalogExportView.as_view(), name='catalog-export'),
+
     # Lessons endpoints
     path('lessons/', LessonListCreateView.as_view(), name='lesson-list'),
+    path('lessons/bulk/', LessonBulkView.as_view(), name='lesson-bulk'),
     path('lessons/<int:pk>/', LessonRetrieveUpdateDestroyView.as_view(),
          name='lesson-detail'),
 
@@ -29,6 +36,8 @@ urlpatterns = [
 
     # Subscriptions endpoints
     path('subscriptions/', SubscriptionListView.as_view(), name='subscription-list'),
+    path('subscriptions/<int:pk>/', SubscriptionUpdateView.as_view(),
+         name='subscription-detail'),
 
     # Stripe endpoints
     path('payments/webhook/', StripeWebhookView.as_view(), name='stripe-webhook'),
@@ -1,39 +1,157 @@
 from rest_framework import viewsets, generics, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from django.http import JsonResponse
+from users.permissions import IsOwner, ScopedQuerysetMixin
+import re
+from functools import partial
+from django.db.models import Count, Max, Prefetch
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 
+from .mixins import (
+    CachedResponseMixin,
+    ConditionalRequestMixin,
+    SparseFieldsetMixin,
+    make_etag,
+)
 from .models import Course, Lesson, Payment, Subscription
+from .paginators import (
+    CoursePagination,
+    LessonPageNumberPagination,
+    LessonPagination,
+    PaymentPagination,
+    SubscriptionPagination,
+)
 from .serializers import (
     CourseSerializer,
+    CourseWithLessonsSerializer,
+    LessonBulkSerializer,
     LessonSerializer,
     PaymentSerializer,
     PaymentCreateSerializer,
     SubscriptionSerializer,
+    SubscriptionSettingsSerializer,
+)
+from .services.export_service import (
+    FORMAT_NDJSON,
+    FORMATS,
+    STAFF_RELATIONS,
+    ExportService,
 )
+from .services.search_service import SearchService
 from .services.stripe_service import StripeService
-from .tasks import send_course_update_notification, send_lesson_update_notification
+from .services.task_service import TaskService
+from .tasks import (
+    send_course_update_notification,
+    send_lesson_update_notification,
+    send_lessons_update_notification,
+)
 
 
-class CourseViewSet(viewsets.ModelViewSet):
+class CourseViewSet(
+    ConditionalRequestMixin,
+    CachedResponseMixin,
+    SparseFieldsetMixin,
+    viewsets.ModelViewSet,
+):
     """
     API endpoint for Course model.
     """
 
     queryset = Course.objects.all()
     serializer_class = CourseSerializer
+    pagination_class = CoursePagination
+    cache_actions = ('list', 'retrieve', 'lessons')
+    cache_scope = 'courses'
+    expand_actions = ('list', 'retrieve')
+
+    def get_expand(self):
+        """Return relations requested with ?expand=lessons."""
+        if self.action not in self.expand_actions:
+            return set()
+        expand = self.request.query_params.get('expand', '')
+        return {name.strip() for name in expand.split(',') if name.strip()}
+
+    def get_lessons_limit(self):
+        """Number of nested lessons, bounded like LessonPagination pages."""
+        paginator = LessonPageNumberPagination
+        try:
+            limit = int(self.request.query_params['lessons_page_size'])
+        except (KeyError, ValueError):
+            return paginator.page_size
+        return min(max(limit, 1), paginator.max_page_size)
+
+    def get_queryset(self):
+        """
+        Prefetch ordered lessons in one query when they are expanded
+        and apply the ?q= full-text search to lists.
+        """
+        queryset = super().get_queryset()
+        if self.action == 'list' and 'q' in self.request.query_params:
+            queryset = SearchService.search(
+                queryset, self.request.query_params['q']
+            )
+        if 'lessons' in self.get_expand():
+            lessons = Lesson.objects.order_by('created_at', 'id')
+            # A sliced prefetch has to land in its own attribute
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    'lessons',
+                    queryset=lessons[:self.get_lessons_limit()],
+                    to_attr='prefetched_lessons',
+                )
+            )
+        return queryset
+
+    def get_serializer_class(self):
+        """Nest lessons into courses when they are expanded."""
+        if 'lessons' in self.get_expand():
+            return CourseWithLessonsSerializer
+        return super().get_serializer_class()
+
+    def get_conditional_state(self):
+        """Validators from the course row (and its lessons when included)."""
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.get_queryset().prefetch_related(None).filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+        # Keyed by representation, not action, so the ETag of a GET also
+        # guards the PUT/PATCH of the same course
+        if self.action == 'lessons' or 'lessons' in self.get_expand():
+            representation = (
+                'course-lessons' if self.action == 'lessons' else 'course-expanded'
+            )
+            row = queryset.annotate(
+                lessons_updated_at=Max('lessons__updated_at'),
+                lessons_total=Count('lessons'),
+            ).values_list(
+                'id', 'updated_at', 'lessons_updated_at', 'lessons_total'
+            ).first()
+            if row is None:
+                return None
+            last_modified = max(filter(None, row[1:3]))
+        else:
+            row = queryset.values_list(
+                'id', 'updated_at', *Course.COUNTER_FIELDS
+            ).first()
+            if row is None:
+                return None
+            last_modified = row[1]
+            representation = 'course'
+        return make_etag(representation, *row), last_modified
 
     def perform_update(self, serializer):
         """Send notifications after course update."""
         instance = serializer.save()
         # Trigger async notification task
-        send_course_update_notification.delay(instance.id)
+        TaskService.dispatch(send_course_update_notification, instance.id)
 
     @swagger_auto_schema(
         method='get',
@@ -48,6 +166,11 @@ class CourseViewSet(viewsets.ModelViewSet):
         """
         Get lessons for specific course.
         """
+        return self.conditional_response(
+            partial(self.cached_response, self._lessons), request, pk=pk
+        )
+
+    def _lessons(self, request, pk=None):
         course = self.get_object()
         lessons = course.lessons.all()
         serializer = LessonSerializer(lessons, many=True)
@@ -115,22 +238,91 @@ class CourseViewSet(viewsets.ModelViewSet):
             )
 
 
-class LessonListCreateView(generics.ListCreateAPIView):
+class LessonListCreateView(SparseFieldsetMixin, generics.ListCreateAPIView):
     """
     API endpoint for listing and creating lessons.
     """
 
     queryset = Lesson.objects.all()
     serializer_class = LessonSerializer
+    pagination_class = LessonPagination
+
+    def get_queryset(self):
+        """Apply the ?q= full-text search to the list."""
+        queryset = super().get_queryset()
+        if self.request.method == 'GET' and 'q' in self.request.query_params:
+            queryset = SearchService.search(
+                queryset, self.request.query_params['q']
+            )
+        return queryset
 
     def perform_create(self, serializer):
         """Send notifications after lesson creation."""
         instance = serializer.save()
         # Trigger async notification task
-        send_lesson_update_notification.delay(instance.id)
+        TaskService.dispatch(send_lesson_update_notification, instance.id)
 
 
-class LessonRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class LessonBulkView(generics.GenericAPIView):
+    """
+    API endpoint for creating (POST) or updating (PATCH) lessons in bulk.
+    """
+
+    queryset = Lesson.objects.all()
+    serializer_class = LessonBulkSerializer
+    permission_classes = [IsAuthenticated]
+    bulk_max_size = 100
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('many', True)
+        kwargs.setdefault('allow_empty', False)
+        kwargs.setdefault('max_length', self.bulk_max_size)
+        return super().get_serializer(*args, **kwargs)
+
+    @swagger_auto_schema(
+        request_body=LessonBulkSerializer(many=True),
+        responses={201: LessonBulkSerializer(many=True)},
+    )
+    def post(self, request):
+        """Create lessons."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.notify(serializer.save())
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @swagger_auto_schema(
+        request_body=LessonBulkSerializer(many=True),
+        responses={200: LessonBulkSerializer(many=True)},
+    )
+    def patch(self, request):
+        """Update lessons, every item identified by its id."""
+        ids = []
+        if isinstance(request.data, list):
+            ids = [
+                item['id'] for item in request.data
+                if isinstance(item, dict) and isinstance(item.get('id'), int)
+            ]
+        serializer = self.get_serializer(
+            list(self.get_queryset().filter(pk__in=ids)),
+            data=request.data,
+            partial=True,
+        )
+        serializer.is_valid(raise_exception=True)
+        self.notify(serializer.save())
+        return Response(serializer.data)
+
+    def notify(self, lessons):
+        """Send one notification per affected course."""
+        lesson_ids = {}
+        for lesson in lessons:
+            lesson_ids.setdefault(lesson.course_id, []).append(lesson.id)
+        for course_id, ids in lesson_ids.items():
+            TaskService.dispatch(send_lessons_update_notification, course_id, ids)
+
+
+class LessonRetrieveUpdateDestroyView(
+    ConditionalRequestMixin, generics.RetrieveUpdateDestroyAPIView
+):
     """
     API endpoint for retrieving, updating and deleting a lesson.
     """
@@ -138,26 +330,37 @@ class LessonRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Lesson.objects.all()
     serializer_class = LessonSerializer
 
+    def get_conditional_state(self):
+        """Validators from the lesson row."""
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = self.get_queryset().filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        ).values_list('id', 'updated_at').first()
+        if row is None:
+            return None
+        return make_etag('lesson', *row), row[1]
+
     def perform_update(self, serializer):
         """Send notifications after lesson update."""
         instance = serializer.save()
         # Trigger async notification task
-        send_lesson_update_notification.delay(instance.id)
+        TaskService.dispatch(send_lesson_update_notification, instance.id)
 
 
 # ДОБАВЛЯЕМ ОТСУТСТВУЮЩИЕ КЛАССЫ:
 
-class PaymentListCreateView(generics.ListCreateAPIView):
+class PaymentListCreateView(
+    ScopedQuerysetMixin, SparseFieldsetMixin, generics.ListCreateAPIView
+):
     """
     API endpoint for listing and creating payments.
     """
 
-    permission_classes = [IsAuthenticated]
+    queryset = Payment.objects.all()
+    permission_classes = [IsAuthenticated, IsOwner]
+    owner_field = 'user'
     serializer_class = PaymentSerializer
-
-    def get_queryset(self):
-        """Return payments for current user."""
-        return Payment.objects.filter(user=self.request.user)
+    pagination_class = PaymentPagination
 
     def get_serializer_class(self):
         """Return appropriate serializer based on request method."""
@@ -170,33 +373,111 @@ class PaymentListCreateView(generics.ListCreateAPIView):
         serializer.save(user=self.request.user)
 
 
-class PaymentRetrieveView(generics.RetrieveAPIView):
+class PaymentRetrieveView(ScopedQuerysetMixin, generics.RetrieveAPIView):
     """
     API endpoint for retrieving payment details.
     """
 
-    permission_classes = [IsAuthenticated]
+    queryset = Payment.objects.all()
+    permission_classes = [IsAuthenticated, IsOwner]
+    owner_field = 'user'
     serializer_class = PaymentSerializer
 
-    def get_queryset(self):
-        """Return payments for current user."""
-        return Payment.objects.filter(user=self.request.user)
-
 
-class SubscriptionListView(generics.ListAPIView):
+class SubscriptionListView(
+    ScopedQuerysetMixin, SparseFieldsetMixin, generics.ListAPIView
+):
     """
     API endpoint for listing user's subscriptions.
     """
 
-    permission_classes = [IsAuthenticated]
+    queryset = Subscription.objects.filter(is_active=True)
+    permission_classes = [IsAuthenticated, IsOwner]
+    owner_field = 'user'
     serializer_class = SubscriptionSerializer
+    pagination_class = SubscriptionPagination
 
-    def get_queryset(self):
-        """Return subscriptions for current user."""
-        return Subscription.objects.filter(
-            user=self.request.user,
-            is_active=True
+
+class SubscriptionUpdateView(ScopedQuerysetMixin, generics.UpdateAPIView):
+    """
+    API endpoint for choosing immediate, hourly or daily notifications.
+    """
+
+    queryset = Subscription.objects.filter(is_active=True)
+    permission_classes = [IsAuthenticated, IsOwner]
+    owner_field = 'user'
+    serializer_class = SubscriptionSettingsSerializer
+    http_method_names = ['patch', 'options']
+
+
+class CatalogExportView(APIView):
+    """
+    API endpoint streaming the whole catalog as NDJSON or CSV.
+    """
+
+    permission_classes = [IsAuthenticated]
+    accepts_gzip = re.compile(r'\bgzip\b')
+
+    @swagger_auto_schema(
+        operation_description=(
+            'Stream all courses with their lessons. Gzipped on the fly '
+            'when the client sends Accept-Encoding: gzip'
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                'export_format', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                enum=list(FORMATS), default=FORMAT_NDJSON,
+            ),
+            openapi.Parameter(
+                'updated_since', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                description='ISO date or datetime',
+            ),
+            openapi.Parameter(
+                'include', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                description='Staff only: subscriptions,payments (NDJSON)',
+            ),
+        ],
+        responses={
+            200: 'Export stream',
+            400: 'Invalid parameters',
+            403: 'Relations requested by non-staff user',
+        }
+    )
+    def get(self, request):
+        """Stream the catalog export."""
+        params = request.query_params
+        export_format = params.get('export_format', FORMAT_NDJSON)
+        include = {
+            name.strip() for name in params.get('include', '').split(',')
+            if name.strip()
+        }
+        if include & set(STAFF_RELATIONS) and not request.user.is_staff:
+            raise PermissionDenied('Only staff can export subscriptions and payments')
+        compress = bool(
+            self.accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        )
+
+        try:
+            stream = ExportService.stream(
+                export_format,
+                include=include,
+                updated_since=ExportService.parse_updated_since(
+                    params.get('updated_since')
+                ),
+                compress=compress,
+            )
+        except ValueError as e:
+            raise ValidationError({'detail': str(e)})
+
+        content_type, extension = FORMATS[export_format]
+        response = StreamingHttpResponse(stream, content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="catalog.{extension}"'
         )
+        if compress:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -0,0 +1,101 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import BasicAuthentication
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .services.token_service import TokenService
+
+CLAIM_FIELDS = ("email", "is_active", "is_staff", "is_superuser")
+
+BASIC_AUTH_KEY = "users:basic-auth:{digest}"
+BASIC_AUTH_SALT = "users.authentication.CachedBasicAuthentication"
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    Authenticate JWT requests from the token claims alone.
+
+    The user is built from the claims as a partially loaded instance, so
+    foreign keys and permission checks work without a query. Other fields
+    are loaded on first access. Revocation is checked against the token
+    version served from the cache.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = self.user_model._meta.pk.to_python(
+                validated_token[api_settings.USER_ID_CLAIM]
+            )
+            loaded = {name: validated_token[name] for name in CLAIM_FIELDS}
+            loaded[api_settings.USER_ID_FIELD] = user_id
+            loaded["token_version"] = validated_token["ver"]
+            roles = frozenset(validated_token["roles"])
+        except KeyError:
+            raise InvalidToken(
+                _("Token contained no recognizable user identification")
+            )
+
+        if not loaded["is_active"]:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if TokenService.get_version(user_id) != loaded["token_version"]:
+            raise AuthenticationFailed(
+                _("Token has been revoked"), code="token_revoked"
+            )
+
+        # from_db() expects the values in model field order
+        fields = [
+            field.attname
+            for field in self.user_model._meta.concrete_fields
+            if field.attname in loaded
+        ]
+        user = self.user_model.from_db(
+            DEFAULT_DB_ALIAS, fields, [loaded[name] for name in fields]
+        )
+        # Consumed by RoleService, no groups query needed
+        user._roles = roles
+        return user
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    """
+    HTTP Basic authentication that skips the password hasher on repeats.
+
+    Verified credentials are remembered for BASIC_AUTH_CACHE_TIMEOUT
+    seconds under a keyed HMAC, never in clear. An entry is bound to the
+    stored password hash and only accepted for active users, so changing
+    the password or deactivating the user invalidates it immediately.
+    """
+
+    @staticmethod
+    def _digest(*parts):
+        return salted_hmac(BASIC_AUTH_SALT, "\0".join(parts)).hexdigest()
+
+    def authenticate_credentials(self, userid, password, request=None):
+        timeout = settings.BASIC_AUTH_CACHE_TIMEOUT
+        if not timeout:
+            return super().authenticate_credentials(userid, password, request)
+
+        key = BASIC_AUTH_KEY.format(digest=self._digest(userid, password))
+        cached = cache.get(key)
+        if cached is not None:
+            user_id, password_digest = cached
+            user = get_user_model().objects.filter(pk=user_id).first()
+            if (
+                user is not None
+                and user.is_active
+                and constant_time_compare(
+                    password_digest, self._digest(user.password)
+                )
+            ):
+                return user, None
+            cache.delete(key)
+
+        user, auth = super().authenticate_credentials(userid, password, request)
+        cache.set(key, (user.pk, self._digest(user.password)), timeout)
+        return user, auth
@@ -0,0 +1,16 @@
+from django.contrib.auth.backends import ModelBackend
+
+from .services.user_cache_service import UserCacheService
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend resolving the session user through UserCacheService.
+
+    AuthenticationMiddleware calls ``get_user`` on every request carrying
+    a session, a cache hit spares the users query.
+    """
+
+    def get_user(self, user_id):
+        user = UserCacheService.get_user(user_id)
+        return user if self.user_can_authenticate(user) else None
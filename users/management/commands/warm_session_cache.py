@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from users.sessions import SessionStore
+
+
+class Command(BaseCommand):
+    help = "Copy unexpired database sessions into the session cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.SESSION_SWEEP_BATCH_SIZE,
+            help="Number of sessions read per query",
+        )
+
+    def handle(self, *args, **options):
+        model = SessionStore.get_model_class()
+        sessions = model.objects.filter(expire_date__gt=timezone.now()).order_by(
+            "session_key"
+        )
+        warmed = 0
+        last_key = ""
+        while True:
+            batch = list(
+                sessions.filter(session_key__gt=last_key)[: options["batch_size"]]
+            )
+            if not batch:
+                break
+            for session in batch:
+                store = SessionStore(session.session_key)
+                # Sessions already cached are newer than their row
+                if store._cache.add(
+                    store.cache_key,
+                    store.decode(session.session_data),
+                    store.get_expiry_age(expiry=session.expire_date),
+                ):
+                    warmed += 1
+            last_key = batch[-1].session_key
+
+        self.stdout.write(self.style.SUCCESS(f"{warmed} sessions cached"))
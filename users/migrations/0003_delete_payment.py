@@ -0,0 +1,16 @@
+# Generated by Django 6.0 on 2026-01-06 12:10
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0002_payment"),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name="Payment",
+        ),
+    ]
@@ -3,6 +3,8 @@ from django.db import models
 from django.contrib.auth.base_user import BaseUserManager
 from django.utils.translation import gettext_lazy as _
 
+from .services.token_service import TokenService
+
 
 class UserManager(BaseUserManager):
     """Custom user manager for email authentication."""
@@ -32,11 +34,72 @@ class User(AbstractUser):
     phone = models.CharField(_("phone"), max_length=15, blank=True, null=True)
     city = models.CharField(_("city"), max_length=100, blank=True, null=True)
     avatar = models.ImageField(_("avatar"), upload_to="avatars/", blank=True, null=True)
+    # Embedded in issued JWTs, bumping it revokes them (see TokenService)
+    token_version = models.PositiveIntegerField(_("token version"), default=0)
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
 
     objects = UserManager()
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Nightly lookup of dormant accounts (users.tasks.check_inactive_users)
+            models.Index(
+                fields=["is_active", "last_login"], name="users_active_last_login_idx"
+            ),
+        ]
+
     def __str__(self):
         return self.email
+
+    # Fields copied into JWT claims (users.tokens.ClaimsRefreshToken)
+    CLAIM_FIELDS = ("email", "is_active", "is_staff", "is_superuser")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_claims()
+        return instance
+
+    def _remember_claims(self):
+        deferred = self.get_deferred_fields()
+        self._claims = {
+            name: getattr(self, name)
+            for name in self.CLAIM_FIELDS
+            if name not in deferred
+        }
+
+    def _claims_changed(self, fields):
+        """Tell whether a save of ``fields`` changes a stored claim."""
+        stored = getattr(self, "_claims", {})
+        if set(fields) - set(stored):
+            stored = (
+                type(self)
+                ._base_manager.filter(pk=self.pk)
+                .values(*self.CLAIM_FIELDS)
+                .first()
+            ) or {}
+        return any(
+            name in stored and stored[name] != getattr(self, name) for name in fields
+        )
+
+    def save(self, *args, **kwargs):
+        """Revoke issued tokens when the password or a claimed field changes."""
+        update_fields = kwargs.get("update_fields")
+        fields = [
+            name
+            for name in self.CLAIM_FIELDS
+            if update_fields is None or name in update_fields
+        ]
+        revoke = self.pk is not None and (
+            self._password is not None or self._claims_changed(fields)
+        )
+        if revoke:
+            self.token_version += 1
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "token_version"}
+        super().save(*args, **kwargs)
+        self._remember_claims()
+        if revoke:
+            TokenService.forget([self.pk])
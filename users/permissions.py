@@ -1,70 +1,140 @@
+from django.contrib.auth import get_user_model
+from django.core.exceptions import FieldDoesNotExist
 from rest_framework import permissions
 
+from .services.role_service import RoleService
+
+# Rows a request may act on
+SCOPE_ALL = "all"
+SCOPE_OWNER = "owner"
+SCOPE_NONE = "none"
+
+
+class ScopedPermission(permissions.BasePermission):
+    """
+    Permission deciding access through a scope of rows.
+
+    ``get_scope`` returns which rows the request may act on: all of them,
+    the ones owned by the user or none. The same scope answers object
+    checks, comparing the owner id without loading the owner, and filters
+    querysets in SQL, so both decisions always agree.
+    """
+
+    def get_scope(self, request, view):
+        """
+        Return the scope of the request.
+
+        Args:
+            request: Current request
+            view: View handling the request
+
+        Returns:
+            SCOPE_ALL, SCOPE_OWNER or SCOPE_NONE
+        """
+        return SCOPE_ALL
+
+    def get_owner_field(self, view, model):
+        """
+        Return the attribute holding the owner id of ``model`` rows.
+
+        Views name the owner foreign key with ``owner_field``, "owner" by
+        default. Models without it have no owner.
+        """
+        try:
+            field = model._meta.get_field(getattr(view, "owner_field", "owner"))
+        except FieldDoesNotExist:
+            return None
+        return field.attname
+
+    def has_object_permission(self, request, view, obj):
+        scope = self.get_scope(request, view)
+        if scope == SCOPE_OWNER:
+            field = self.get_owner_field(view, type(obj))
+            return (
+                field is not None
+                and request.user.is_authenticated
+                and getattr(obj, field) == request.user.pk
+            )
+        return scope == SCOPE_ALL
+
+    def filter_queryset(self, request, view, queryset):
+        """Narrow ``queryset`` to the rows ``has_object_permission`` allows."""
+        scope = self.get_scope(request, view)
+        if scope == SCOPE_ALL:
+            return queryset
+        if scope == SCOPE_OWNER:
+            field = self.get_owner_field(view, queryset.model)
+            if field is not None and request.user.is_authenticated:
+                return queryset.filter(**{field: request.user.pk})
+        return queryset.none()
+
+
+class ScopedQuerysetMixin:
+    """Scope the view queryset with its ScopedPermission policies."""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        for permission in self.get_permissions():
+            if isinstance(permission, ScopedPermission):
+                queryset = permission.filter_queryset(self.request, self, queryset)
+        return queryset
+
 
 class IsModerator(permissions.BasePermission):
     """Проверяет, является ли пользователь модератором."""
 
     def has_permission(self, request, view):
-        return request.user.groups.filter(name="moderators").exists()
+        return RoleService.is_moderator(request.user)
 
 
-class IsOwner(permissions.BasePermission):
+class IsOwner(ScopedPermission):
     """Проверяет, является ли пользователь владельцем объекта."""
 
-    def has_object_permission(self, request, view, obj):
-        # Проверяем, есть ли у объекта поле owner
-        if hasattr(obj, "owner"):
-            return obj.owner == request.user
-        # Для User модели
-        elif hasattr(obj, "id"):
-            return obj.id == request.user.id
-        return False
+    def get_scope(self, request, view):
+        return SCOPE_OWNER
+
+    def get_owner_field(self, view, model):
+        field = super().get_owner_field(view, model)
+        # Для User модели владелец - сам пользователь
+        if field is None and model is get_user_model():
+            return "pk"
+        return field
 
 
-class IsOwnerOrModerator(permissions.BasePermission):
+class IsOwnerOrModerator(IsOwner):
     """Проверяет, является ли пользователь владельцем или модератором."""
 
-    def has_object_permission(self, request, view, obj):
+    def get_scope(self, request, view):
         # Если пользователь модератор - разрешаем
-        if request.user.groups.filter(name="moderators").exists():
-            return True
-
-        # Если пользователь владелец - разрешаем
-        if hasattr(obj, "owner"):
-            return obj.owner == request.user
-        elif hasattr(obj, "id"):
-            return obj.id == request.user.id
-
-        return False
+        if RoleService.is_moderator(request.user):
+            return SCOPE_ALL
+        return SCOPE_OWNER
 
 
 class IsNotModerator(permissions.BasePermission):
     """Проверяет, что пользователь НЕ является модератором."""
 
     def has_permission(self, request, view):
-        return not request.user.groups.filter(name="moderators").exists()
+        return not RoleService.is_moderator(request.user)
 
 
-class IsOwnerOrModeratorOrReadOnly(permissions.BasePermission):
+class IsOwnerOrModeratorOrReadOnly(ScopedPermission):
     """Разрешает редактирование только владельцам и модераторам."""
 
-    def has_object_permission(self, request, view, obj):
+    def get_scope(self, request, view):
         # Разрешаем безопасные методы всем
         if request.method in permissions.SAFE_METHODS:
-            return True
+            return SCOPE_ALL
 
-        # Модераторы могут редактировать
-        if request.user.groups.filter(name="moderators").exists():
-            return request.method != "DELETE"  # Модераторы не могут удалять
+        # Модераторы могут редактировать, но не удалять
+        if RoleService.is_moderator(request.user):
+            return SCOPE_NONE if request.method == "DELETE" else SCOPE_ALL
 
         # Владельцы могут все
-        if hasattr(obj, "owner"):
-            return obj.owner == request.user
-
-        return False
+        return SCOPE_OWNER
 
 
-class CourseLessonPermission(permissions.BasePermission):
+class CourseLessonPermission(ScopedPermission):
     """Общие права для курсов и уроков."""
 
     def has_permission(self, request, view):
@@ -76,22 +146,19 @@ class CourseLessonPermission(permissions.BasePermission):
         if request.method == "POST":
             return (
                 request.user.is_authenticated
-                and not request.user.groups.filter(name="moderators").exists()
+                and not RoleService.is_moderator(request.user)
             )
 
         return request.user.is_authenticated
 
-    def has_object_permission(self, request, view, obj):
+    def get_scope(self, request, view):
         # Разрешаем просмотр всем авторизованным
         if request.method in permissions.SAFE_METHODS:
-            return request.user.is_authenticated
+            return SCOPE_ALL if request.user.is_authenticated else SCOPE_NONE
 
         # Модераторы могут только редактировать, но не удалять
-        if request.user.groups.filter(name="moderators").exists():
-            return request.method in ["PUT", "PATCH"]
+        if RoleService.is_moderator(request.user):
+            return SCOPE_ALL if request.method in ["PUT", "PATCH"] else SCOPE_NONE
 
         # Владельцы могут все
-        if hasattr(obj, "owner"):
-            return obj.owner == request.user
-
-        return False
+        return SCOPE_OWNER
@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.core.cache import cache
+
+MODERATORS_GROUP = "moderators"
+
+ROLES_VERSION_KEY = "users:roles:version"
+ROLES_KEY = "users:roles:{version}:{user_id}"
+
+
+class RoleService:
+    """
+    Service resolving the roles (group names) of a user.
+
+    Roles are computed once per user instance, which lives as long as the
+    request. With AUTH_CACHE_ENABLED they are shared between requests
+    through the cache for ROLE_CACHE_TIMEOUT seconds, group membership
+    signals invalidate them.
+    """
+
+    @staticmethod
+    def _version() -> int:
+        version = cache.get(ROLES_VERSION_KEY)
+        if version is None:
+            cache.add(ROLES_VERSION_KEY, 1, timeout=None)
+            version = cache.get(ROLES_VERSION_KEY, 1)
+        return version
+
+    @staticmethod
+    def _key(user_id) -> str:
+        return ROLES_KEY.format(version=RoleService._version(), user_id=user_id)
+
+    @staticmethod
+    def get_roles(user) -> frozenset:
+        """
+        Get the names of the groups the user belongs to.
+
+        Args:
+            user: User instance or AnonymousUser
+
+        Returns:
+            Frozen set of group names, empty for anonymous users
+        """
+        if user is None or not user.is_authenticated:
+            return frozenset()
+        roles = getattr(user, "_roles", None)
+        if roles is not None:
+            return roles
+
+        timeout = settings.ROLE_CACHE_TIMEOUT
+        shared = timeout and settings.AUTH_CACHE_ENABLED
+        key = RoleService._key(user.pk) if shared else None
+        if key:
+            roles = cache.get(key)
+        if roles is None:
+            roles = frozenset(user.groups.values_list("name", flat=True))
+            if key:
+                cache.set(key, roles, timeout)
+        user._roles = roles
+        return roles
+
+    @staticmethod
+    def has_role(user, role: str) -> bool:
+        """Check whether the user belongs to the group named role."""
+        return role in RoleService.get_roles(user)
+
+    @staticmethod
+    def is_moderator(user) -> bool:
+        """Check whether the user is a moderator."""
+        return RoleService.has_role(user, MODERATORS_GROUP)
+
+    @staticmethod
+    def invalidate(user_ids) -> None:
+        """
+        Drop cached roles of the given users.
+
+        Args:
+            user_ids: IDs of users whose groups changed
+        """
+        cache.delete_many([RoleService._key(user_id) for user_id in user_ids])
+
+    @staticmethod
+    def invalidate_all() -> None:
+        """Drop cached roles of every user, e.g. after a group rename."""
+        try:
+            cache.incr(ROLES_VERSION_KEY)
+        except ValueError:
+            cache.add(ROLES_VERSION_KEY, 1, timeout=None)
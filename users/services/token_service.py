@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .user_cache_service import UserCacheService
+
+TOKEN_VERSION_KEY = "users:token-version:{user_id}"
+
+
+class TokenService:
+    """
+    Service for per-user token versions.
+
+    Every JWT carries the version of its user at issue time. Bumping the
+    version revokes all tokens issued before. With AUTH_CACHE_ENABLED the
+    current version is served from the shared cache, so checking it costs
+    no query.
+    """
+
+    @staticmethod
+    def get_version(user_id):
+        """
+        Get the current token version of a user.
+
+        Args:
+            user_id: ID of the user
+
+        Returns:
+            Token version, None if the user does not exist
+        """
+        key = TOKEN_VERSION_KEY.format(user_id=user_id)
+        cached = settings.AUTH_CACHE_ENABLED
+        version = cache.get(key) if cached else None
+        if version is None:
+            version = (
+                get_user_model()
+                .objects.filter(pk=user_id)
+                .values_list("token_version", flat=True)
+                .first()
+            )
+            if version is not None and cached:
+                cache.set(key, version, timeout=None)
+        return version
+
+    @staticmethod
+    def forget(user_ids) -> None:
+        """
+        Drop cached versions, now and once the transaction commits.
+
+        Args:
+            user_ids: IDs of users whose version changed
+        """
+        keys = [TOKEN_VERSION_KEY.format(user_id=user_id) for user_id in user_ids]
+        if not keys:
+            return
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+    @staticmethod
+    def revoke(user_ids) -> None:
+        """
+        Revoke all tokens of the given users.
+
+        Args:
+            user_ids: IDs of the users
+        """
+        user_ids = list(user_ids)
+        get_user_model().objects.filter(pk__in=user_ids).update(
+            token_version=F("token_version") + 1
+        )
+        TokenService.forget(user_ids)
+        UserCacheService.invalidate(user_ids)
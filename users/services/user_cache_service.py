@@ -0,0 +1,85 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+USER_VERSION_KEY = "users:user-version:{user_id}"
+USER_KEY = "users:user:{user_id}"
+
+
+class UserCacheService:
+    """
+    Service loading users by primary key through the cache.
+
+    An entry holds the user row tagged with the per-user version current
+    when it was read. Writes bump the version, now and once the
+    transaction commits, which turns entries read in between into misses.
+    Version and entry are fetched in a single cache round trip. Users are
+    only cached with AUTH_CACHE_ENABLED.
+    """
+
+    @staticmethod
+    def _keys(user_id):
+        return (
+            USER_VERSION_KEY.format(user_id=user_id),
+            USER_KEY.format(user_id=user_id),
+        )
+
+    @staticmethod
+    def get_user(user_id):
+        """
+        Get a user by primary key.
+
+        Args:
+            user_id: ID of the user
+
+        Returns:
+            User instance, None if the user does not exist
+        """
+        user_model = get_user_model()
+        fields = [field.attname for field in user_model._meta.concrete_fields]
+        timeout = settings.USER_CACHE_TIMEOUT
+        if not timeout or not settings.AUTH_CACHE_ENABLED:
+            return user_model.objects.filter(pk=user_id).first()
+
+        version_key, user_key = UserCacheService._keys(user_id)
+        cached = cache.get_many([version_key, user_key])
+        version = cached.get(version_key)
+        entry = cached.get(user_key)
+        if entry is not None and entry[0] == version:
+            values = entry[1]
+            if len(values) == len(fields):
+                return user_model.from_db(DEFAULT_DB_ALIAS, fields, values)
+
+        if version is None:
+            cache.add(version_key, 1, timeout=None)
+            version = cache.get(version_key, 1)
+        values = user_model.objects.filter(pk=user_id).values_list(*fields).first()
+        if values is None:
+            return None
+        cache.set(user_key, (version, values), timeout)
+        return user_model.from_db(DEFAULT_DB_ALIAS, fields, values)
+
+    @staticmethod
+    def _bump(user_ids):
+        for user_id in user_ids:
+            version_key, user_key = UserCacheService._keys(user_id)
+            try:
+                cache.incr(version_key)
+            except ValueError:
+                # The version was evicted, drop the entry it tagged
+                cache.delete(user_key)
+
+    @staticmethod
+    def invalidate(user_ids) -> None:
+        """
+        Invalidate cached users, now and once the transaction commits.
+
+        Args:
+            user_ids: IDs of users whose row changed
+        """
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        UserCacheService._bump(user_ids)
+        transaction.on_commit(lambda: UserCacheService._bump(user_ids))
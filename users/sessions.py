@@ -0,0 +1,128 @@
+"""
+Cached sessions persisted to the database behind the request.
+"""
+
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.sessions.backends.base import CreateError
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.db import router, transaction
+from django.utils import timezone
+
+KEY_PREFIX = "users.sessions"
+PENDING_PREFIX = "users.sessions.pending"
+DELETED_PREFIX = "users.sessions.deleted"
+
+# Seconds a deleted session key stays blocked from being persisted again
+DELETED_TIMEOUT = 3600
+
+logger = logging.getLogger("django.contrib.sessions")
+
+
+class SessionStore(CachedDBStore):
+    """
+    Session store serving the cache and writing the database behind.
+
+    ``save`` only writes the cache and schedules
+    ``users.tasks.persist_session`` after SESSION_WRITE_DELAY seconds,
+    saves landing while a write is pending are coalesced into it. Sessions
+    missing from the cache are read from the database, so sessions created
+    by the db and cached_db engines stay valid after switching engines.
+    """
+
+    cache_key_prefix = KEY_PREFIX
+
+    @staticmethod
+    def _pending_key(session_key):
+        return PENDING_PREFIX + session_key
+
+    @staticmethod
+    def _deleted_key(session_key):
+        return DELETED_PREFIX + session_key
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        data = self._get_session(no_load=must_create)
+        age = self.get_expiry_age()
+        if must_create:
+            if not self._cache.add(self.cache_key, data, age):
+                raise CreateError
+        else:
+            self._cache.set(self.cache_key, data, age)
+        self._schedule()
+
+    async def asave(self, must_create=False):
+        await sync_to_async(self.save)(must_create)
+
+    def _schedule(self):
+        """Schedule one database write for all saves within the delay."""
+        delay = settings.SESSION_WRITE_DELAY
+        session_key = self.session_key
+        if not self._cache.add(self._pending_key(session_key), True, delay + 60):
+            return
+
+        def dispatch():
+            from .tasks import persist_session
+
+            try:
+                persist_session.apply_async((session_key,), countdown=delay)
+            except Exception:
+                logger.exception("Could not schedule session write, writing now")
+                SessionStore(session_key).persist()
+
+        transaction.on_commit(dispatch)
+
+    def persist(self):
+        """
+        Write the cached session to the database.
+
+        Returns:
+            True if a row was written, False if the session is gone
+        """
+        self._cache.delete(self._pending_key(self.session_key))
+        data = self._cache.get(self.cache_key)
+        if data is None:
+            return False
+        self._session_cache = data
+        obj = self.create_model_instance(data)
+        using = router.db_for_write(self.model, instance=obj)
+        obj.save(using=using)
+        # The session was deleted while it was being written
+        if self._cache.get(self._deleted_key(self.session_key)):
+            self.model.objects.using(using).filter(pk=obj.pk).delete()
+            return False
+        return True
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            session_key = self.session_key
+        if session_key is None:
+            return
+        self._cache.set(self._deleted_key(session_key), True, DELETED_TIMEOUT)
+        self._cache.delete(self._pending_key(session_key))
+        super().delete(session_key)
+
+    async def adelete(self, session_key=None):
+        await sync_to_async(self.delete)(session_key)
+
+    @classmethod
+    def clear_expired(cls, batch_size=None):
+        """
+        Delete expired rows in batches of SESSION_SWEEP_BATCH_SIZE.
+
+        Returns:
+            Number of deleted sessions
+        """
+        batch_size = batch_size or settings.SESSION_SWEEP_BATCH_SIZE
+        model = cls.get_model_class()
+        expired = model.objects.filter(expire_date__lt=timezone.now())
+        deleted = 0
+        while True:
+            keys = list(expired.values_list("pk", flat=True)[:batch_size])
+            if keys:
+                deleted += expired.filter(pk__in=keys).delete()[0]
+            if len(keys) < batch_size:
+                return deleted
@@ -0,0 +1,48 @@
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import User
+from .services.role_service import RoleService
+from .services.token_service import TokenService
+from .services.user_cache_service import UserCacheService
+
+
+def roles_changed(user_ids):
+    """Drop cached roles and revoke tokens whose role claims are stale."""
+    user_ids = list(user_ids)
+    RoleService.invalidate(user_ids)
+    TokenService.revoke(user_ids)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_member_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    """Handle users whose group membership changed."""
+    if not reverse:
+        # user.groups.add/remove/clear(), the instance is the user
+        if action in ("post_add", "post_remove", "post_clear"):
+            instance.__dict__.pop("_roles", None)
+            roles_changed([instance.pk])
+    elif action in ("post_add", "post_remove"):
+        # group.user_set.add/remove(), pk_set holds user ids
+        roles_changed(pk_set)
+    elif action == "pre_clear":
+        # group.user_set.clear() does not tell which users it removes
+        roles_changed(instance.user_set.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def invalidate_group_roles(sender, instance, created=False, **kwargs):
+    """Handle all members when a group is renamed or deleted."""
+    if created:
+        return
+    RoleService.invalidate_all()
+    TokenService.revoke(instance.user_set.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Drop the cached row of a saved or deleted user."""
+    UserCacheService.invalidate([instance.pk])
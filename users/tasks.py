@@ -1,31 +1,95 @@
+import logging
+import time
+
 from celery import shared_task
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db.models import F
 from django.utils import timezone
 from datetime import timedelta
 
+from .services.token_service import TokenService
+from .services.user_cache_service import UserCacheService
+from .sessions import SessionStore
+
 User = get_user_model()
 
+logger = logging.getLogger(__name__)
+
 
 @shared_task
-def check_inactive_users():
+def check_inactive_users(batch_size=None):
     """
     Check users who haven't logged in for more than a month
     and deactivate them.
 
-    This task runs daily via celery-beat.
+    Users are scanned in primary key order, INACTIVE_USERS_BATCH_SIZE at
+    a time, and every batch is deactivated with a single UPDATE that also
+    revokes issued tokens. Sessions stop authenticating once the cached
+    users are invalidated. This task runs daily via celery-beat.
+
+    Args:
+        batch_size: Users per batch, INACTIVE_USERS_BATCH_SIZE by default
     """
+    batch_size = batch_size or settings.INACTIVE_USERS_BATCH_SIZE
     one_month_ago = timezone.now() - timedelta(days=30)
 
     # Find active users who haven't logged in for more than a month
     inactive_users = User.objects.filter(
         is_active=True,
         last_login__lt=one_month_ago
-    )
+    ).order_by('pk')
 
     count = 0
-    for user in inactive_users:
-        user.is_active = False
-        user.save(update_fields=['is_active'])
-        count += 1
+    last_pk = 0
+    while True:
+        started = time.monotonic()
+        user_ids = list(
+            inactive_users.filter(pk__gt=last_pk)
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not user_ids:
+            break
+        # Filter again, a user may have logged in since the scan
+        deactivated = inactive_users.filter(pk__in=user_ids).update(
+            is_active=False,
+            token_version=F('token_version') + 1,
+        )
+        TokenService.forget(user_ids)
+        UserCacheService.invalidate(user_ids)
+        count += deactivated
+        last_pk = user_ids[-1]
+        logger.info(
+            'Deactivated %s inactive users up to id %s in %.3fs',
+            deactivated,
+            last_pk,
+            time.monotonic() - started,
+        )
+        if len(user_ids) < batch_size:
+            break
+
+    return f'Deactivated {count} inactive users'
+
+
+@shared_task
+def persist_session(session_key):
+    """
+    Write a cached session to the database.
 
-    return f'Deactivated {count} inactive users'
\ No newline at end of file
+    Scheduled by users.sessions.SessionStore, one run covers every save
+    of the session since it was scheduled.
+
+    Args:
+        session_key: Key of the session to write
+    """
+    SessionStore(session_key).persist()
+
+
+@shared_task
+def clear_expired_sessions():
+    """
+    Delete expired sessions in batches.
+
+    This task runs hourly via celery-beat.
+    """
+    return f'Deleted {SessionStore.clear_expired()} expired sessions'
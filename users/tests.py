@@ -0,0 +1,387 @@
+import base64
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser, Group
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+from .authentication import CachedBasicAuthentication, ClaimsJWTAuthentication
+from .backends import CachedModelBackend
+from .models import User
+from .services.role_service import RoleService
+from .services.token_service import TokenService
+from .sessions import SessionStore
+from .tasks import check_inactive_users
+
+
+@override_settings(AUTH_CACHE_ENABLED=True)
+class RoleServiceTestCase(TestCase):
+    """Test role resolution and its invalidation."""
+
+    def setUp(self):
+        cache.clear()
+        self.moderators = Group.objects.create(name="moderators")
+        self.user = User.objects.create_user(email="user@test.com", password="user123")
+
+    def _fresh_user(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def test_roles_resolved_once(self):
+        """Test repeated checks reuse the memoized and cached roles."""
+        self.user.groups.add(self.moderators)
+        user = self._fresh_user()
+        with self.assertNumQueries(1):
+            for _ in range(5):
+                self.assertTrue(RoleService.is_moderator(user))
+
+        user = self._fresh_user()
+        with self.assertNumQueries(0):
+            self.assertTrue(RoleService.is_moderator(user))
+
+        self.assertFalse(RoleService.is_moderator(AnonymousUser()))
+
+    def test_membership_changes_invalidate(self):
+        """Test both sides of the m2m relation drop cached roles."""
+        self.assertFalse(RoleService.is_moderator(self.user))
+
+        self.user.groups.add(self.moderators)
+        self.assertTrue(RoleService.is_moderator(self.user))
+        self.assertTrue(RoleService.is_moderator(self._fresh_user()))
+
+        self.moderators.user_set.remove(self.user)
+        self.assertFalse(RoleService.is_moderator(self._fresh_user()))
+
+        self.moderators.user_set.add(self.user)
+        self.moderators.name = "editors"
+        self.moderators.save()
+        self.assertFalse(RoleService.is_moderator(self._fresh_user()))
+
+    @override_settings(AUTH_CACHE_ENABLED=False)
+    def test_roles_are_read_without_shared_cache(self):
+        """Test a demotion another process made is seen without a shared cache."""
+        self.user.groups.add(self.moderators)
+        self.assertTrue(RoleService.is_moderator(self._fresh_user()))
+        # Its local cache invalidation would not have reached this process
+        User.groups.through.objects.filter(user=self.user).delete()
+        self.assertFalse(RoleService.is_moderator(self._fresh_user()))
+
+
+@override_settings(AUTH_CACHE_ENABLED=True)
+class JWTClaimsTestCase(APITestCase):
+    """Test claim-based JWT authentication and revocation."""
+
+    def setUp(self):
+        cache.clear()
+        self.moderators = Group.objects.create(name="moderators")
+        self.user = User.objects.create_user(email="user@test.com", password="user123")
+        self.user.groups.add(self.moderators)
+        self.url = reverse("subscription-list")
+
+    def _login(self, password="user123"):
+        response = self.client.post(
+            reverse("token-obtain-pair"),
+            {"email": "user@test.com", "password": password},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        return response.data
+
+    def test_claims_authenticate_without_queries(self):
+        """Test the user and its roles come from the token."""
+        self._login()
+        self.client.get(self.url)
+
+        request = APIRequestFactory().get(self.url)
+        request.META.update(self.client._credentials)
+        with self.assertNumQueries(0):
+            user, _ = ClaimsJWTAuthentication().authenticate(Request(request))
+            self.assertTrue(RoleService.is_moderator(user))
+        self.assertEqual(user.pk, self.user.pk)
+
+        # Only the list's own COUNT, no session, user or groups lookups
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_version_bump_revokes_tokens(self):
+        """Test password and group changes revoke issued tokens."""
+        tokens = self._login()
+        self.user.groups.remove(self.moderators)
+        self.assertEqual(
+            self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED
+        )
+        response = self.client.post(
+            reverse("token-refresh"), {"refresh": tokens["refresh"]}
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self._login()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        user = User.objects.get(pk=self.user.pk)
+        user.set_password("new-password123")
+        user.save()
+        self.assertEqual(
+            self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED
+        )
+
+    @override_settings(AUTH_CACHE_ENABLED=False)
+    def test_versions_are_read_without_shared_cache(self):
+        """Test a bump another process made is seen without a shared cache."""
+        self._login()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        # Its local cache invalidation would not have reached this process
+        User.objects.filter(pk=self.user.pk).update(
+            token_version=F("token_version") + 1
+        )
+        self.assertEqual(
+            self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED
+        )
+
+    def test_claim_field_changes_revoke_tokens(self):
+        """Test demotions and email changes revoke tokens carrying old claims."""
+        self.user.is_staff = True
+        self.user.save()
+        tokens = self._login()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+        user = User.objects.get(pk=self.user.pk)
+        user.is_staff = False
+        user.save(update_fields=["is_staff"])
+        self.assertEqual(
+            self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED
+        )
+        response = self.client.post(
+            reverse("token-refresh"), {"refresh": tokens["refresh"]}
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self._login()
+        user = User.objects.get(pk=self.user.pk)
+        user.email = "renamed@test.com"
+        user.save()
+        self.assertEqual(
+            self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED
+        )
+
+    def test_unrelated_saves_keep_tokens(self):
+        """Test saves that leave every claim alone do not revoke tokens."""
+        self._login()
+        user = User.objects.get(pk=self.user.pk)
+        user.city = "Москва"
+        user.save()
+        user.save(update_fields=["last_login"])
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+
+class CachedBasicAuthenticationTestCase(TestCase):
+    """Test the verified-credential cache of Basic authentication."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="user@test.com", password="user123")
+
+    def _authenticate(self, password="user123"):
+        credentials = base64.b64encode(f"user@test.com:{password}".encode()).decode()
+        request = APIRequestFactory().get(
+            "/", HTTP_AUTHORIZATION=f"Basic {credentials}"
+        )
+        return CachedBasicAuthentication().authenticate(Request(request))
+
+    def test_repeat_skips_hasher(self):
+        """Test verified credentials are not hashed again."""
+        with mock.patch.object(
+            User, "check_password", autospec=True, side_effect=User.check_password
+        ) as check_password:
+            self.assertEqual(self._authenticate()[0], self.user)
+            self.assertEqual(self._authenticate()[0], self.user)
+        self.assertEqual(check_password.call_count, 1)
+
+        with self.assertRaises(AuthenticationFailed):
+            self._authenticate("wrong")
+
+    def test_password_change_and_deactivation_invalidate(self):
+        """Test cached credentials follow the stored user state."""
+        self._authenticate()
+        self.user.set_password("new-password123")
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self._authenticate()
+
+        self._authenticate("new-password123")
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        with self.assertRaises(AuthenticationFailed):
+            self._authenticate("new-password123")
+
+
+@override_settings(AUTH_CACHE_ENABLED=True)
+class CachedModelBackendTestCase(TestCase):
+    """Test session users are loaded through the cache."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="user@test.com", password="user123")
+        self.backend = CachedModelBackend()
+
+    def test_repeat_lookup_hits_cache(self):
+        """Test only the first lookup queries the database."""
+        with self.assertNumQueries(1):
+            self.backend.get_user(self.user.pk)
+        with self.assertNumQueries(0):
+            user = self.backend.get_user(self.user.pk)
+        self.assertEqual(user, self.user)
+        self.assertEqual(user.email, "user@test.com")
+        self.assertIsNone(self.backend.get_user(self.user.pk + 1))
+
+    def test_writes_invalidate(self):
+        """Test profile updates, password changes and deactivation."""
+        self.backend.get_user(self.user.pk)
+        self.user.city = "Москва"
+        self.user.save()
+        self.assertEqual(self.backend.get_user(self.user.pk).city, "Москва")
+
+        self.user.set_password("new-password123")
+        self.user.save()
+        user = self.backend.get_user(self.user.pk)
+        self.assertTrue(user.check_password("new-password123"))
+
+        User.objects.filter(pk=self.user.pk).update(
+            last_login=timezone.now() - timedelta(days=31)
+        )
+        self.backend.get_user(self.user.pk)
+        check_inactive_users()
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+
+    @override_settings(AUTH_CACHE_ENABLED=False)
+    def test_users_are_read_without_shared_cache(self):
+        """Test a deactivation another process made is seen without a shared cache."""
+        self.backend.get_user(self.user.pk)
+        # Its local cache invalidation would not have reached this process
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+
+    def test_session_request(self):
+        """Test the session user of a request comes from the cache."""
+        self.client.login(email="user@test.com", password="user123")
+        self.client.get("/admin/")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/admin/")
+        self.assertEqual(response.wsgi_request.user, self.user)
+        self.assertFalse(
+            [query for query in queries if "users_user" in query["sql"]]
+        )
+
+
+@mock.patch("users.tasks.persist_session.apply_async")
+class SessionStoreTestCase(TestCase):
+    """Test the write-behind session store."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_saves_are_coalesced(self, apply_async):
+        """Test saves only hit the cache and schedule one write."""
+        store = SessionStore()
+        with self.captureOnCommitCallbacks(execute=True):
+            # Only a new key is checked against the database
+            store.create()
+            with self.assertNumQueries(0):
+                store["step"] = 1
+                store.save()
+                store["step"] = 2
+                store.save()
+        apply_async.assert_called_once_with((store.session_key,), countdown=5)
+        self.assertFalse(Session.objects.exists())
+        self.assertEqual(SessionStore(store.session_key)["step"], 2)
+
+        self.assertTrue(SessionStore(store.session_key).persist())
+        cache.clear()
+        self.assertEqual(SessionStore(store.session_key)["step"], 2)
+
+    def test_database_sessions_stay_valid(self, apply_async):
+        """Test sessions of the db engine are read from the database."""
+        old = DBStore()
+        old["user"] = "value"
+        old.save()
+        self.assertEqual(SessionStore(old.session_key)["user"], "value")
+
+        call_command("warm_session_cache", stdout=StringIO())
+        Session.objects.all().delete()
+        self.assertEqual(SessionStore(old.session_key)["user"], "value")
+
+    def test_deleted_session_is_not_persisted(self, apply_async):
+        """Test a write racing a delete does not resurrect the session."""
+        store = SessionStore()
+        store["step"] = 1
+        store.save()
+        data = cache.get(store.cache_key)
+        store.delete()
+        # A write that read the cache just before the delete
+        cache.set(store.cache_key, data)
+        self.assertFalse(SessionStore(store.session_key).persist())
+        self.assertFalse(Session.objects.exists())
+
+    def test_unreachable_broker_writes_through(self, apply_async):
+        """Test the session is written at once when scheduling fails."""
+        apply_async.side_effect = OSError
+        store = SessionStore()
+        with self.captureOnCommitCallbacks(execute=True):
+            store.save()
+        self.assertTrue(Session.objects.filter(pk=store.session_key).exists())
+
+    def test_clear_expired_in_batches(self, apply_async):
+        """Test the sweeper deletes every expired row."""
+        now = timezone.now()
+        Session.objects.bulk_create(
+            Session(session_key=f"expired{i}", session_data="", expire_date=now)
+            for i in range(5)
+        )
+        Session.objects.create(
+            session_key="valid", session_data="", expire_date=now + timedelta(1)
+        )
+        with self.assertNumQueries(6):
+            self.assertEqual(SessionStore.clear_expired(batch_size=2), 5)
+        self.assertEqual(list(Session.objects.values_list("pk", flat=True)), ["valid"])
+
+
+class CheckInactiveUsersTestCase(TestCase):
+    """Test the nightly deactivation of dormant accounts."""
+
+    def setUp(self):
+        long_ago = timezone.now() - timedelta(days=31)
+        self.dormant = [
+            User.objects.create_user(email=f"dormant{i}@test.com", last_login=long_ago)
+            for i in range(5)
+        ]
+        self.recent = User.objects.create_user(
+            email="recent@test.com", last_login=timezone.now()
+        )
+
+    def test_batches_are_deactivated_in_bulk(self):
+        """Test every keyset batch costs one scan and one update."""
+        tokens = {user.pk: TokenService.get_version(user.pk) for user in self.dormant}
+        with self.assertLogs("users.tasks", "INFO") as logs:
+            with self.assertNumQueries(6):
+                result = check_inactive_users(batch_size=2)
+        self.assertEqual(result, "Deactivated 5 inactive users")
+        self.assertEqual(len(logs.output), 3)
+
+        self.assertFalse(
+            User.objects.filter(pk__in=tokens, is_active=True).exists()
+        )
+        for user_id, version in tokens.items():
+            self.assertEqual(TokenService.get_version(user_id), version + 1)
+        self.assertTrue(User.objects.get(pk=self.recent.pk).is_active)
+        self.assertEqual(check_inactive_users(), "Deactivated 0 inactive users")
@@ -0,0 +1,45 @@
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .services.role_service import RoleService
+from .services.token_service import TokenService
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """Refresh token carrying the claims needed to authorize requests."""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token["email"] = user.email
+        token["is_active"] = user.is_active
+        token["is_staff"] = user.is_staff
+        token["is_superuser"] = user.is_superuser
+        token["roles"] = sorted(RoleService.get_roles(user))
+        token["ver"] = user.token_version
+        # Access tokens derived from this one copy the claims above
+        return token
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Issue claim-carrying token pairs."""
+
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refuse to refresh tokens revoked by a version bump."""
+
+    token_class = ClaimsRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM)
+        if refresh.payload.get("ver") != TokenService.get_version(user_id):
+            raise InvalidToken("Token has been revoked")
+        return super().validate(attrs)